@@ -1,3 +1,16 @@
 from .plot_functions import *
 # from .connect_functions import *
-from .extract_functions import *
\ No newline at end of file
+from .extract_functions import *
+from .parallel_functions import *
+from .cache_functions import *
+from .checkpoint_functions import *
+from .stream_functions import *
+from .buffer_functions import *
+from .storage_functions import *
+from .derived_functions import *
+from .tile_functions import *
+from .render_functions import *
+from .dashboard_functions import *
+from .html_functions import *
+from .batch_functions import *
+from .profile_functions import *
@@ -0,0 +1,430 @@
+import glob
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .dashboard_functions import resolve_panels
+from .derived_functions import DERIVED_COLUMNS, compute_derived
+from .plot_settings import set_limit
+from .profile_functions import profile
+from .storage_functions import load_run, params_csv_for
+
+# Labels of the resampling axes, used as x label of the time history overlays
+AXIS_LABELS = {
+    'N': 'Number of uniform cycles, $N$ [-]',
+    'gamxy_cum': 'Cumulative shear strain, $\\Sigma|\\Delta\\gamma_{xy}|$ [-]',
+    'step': 'Step [-]',
+}
+
+# Overlays of the plot functions: plot_* name -> (xlabel, ylabel, curves, options).
+# Every curve is (x column, y column, x scale, y scale, label); an x column of
+# None is the resampling axis, and a tuple of columns takes the first one a run
+# has (PM4Silt and PM4Sand name the back stress differently).
+OVERLAY_PANELS = {
+    'plot_sxy_vs_gxy': ('Shear strain, $\\gamma_{xy}$ [%]', 'Shear stress, $\\tau_{xy}$ [kPa]',
+                        [('gamxy', 'sxy', 100, 1, None)], {}),
+    'plot_sxy_vs_sy': ('Vertical effective stress, $\\sigma\'_{y}$ [kPa]', 'Shear stress, $\\tau_{xy}$ [kPa]',
+                       [('sy', 'sxy', 1, 1, None)], {}),
+    'plot_alpha_vs_N': (None, 'Back stress ratio, $\\alpha_{ii}$ [-]',
+                        [(None, ('alphaxx', 'alpha_xx'), 1, 1, '$\\alpha_{xx}$'),
+                         (None, ('alphayy', 'alpha_yy'), 1, 1, '$\\alpha_{yy}$'),
+                         (None, ('alphaxy', 'alpha_xy'), 1, 1, '$\\alpha_{xy}$')], {}),
+    'plot_q_vs_p': ('Mid stress, $p^{*} = \\dfrac{\\sigma_{x}+\\sigma_{y}}{2}$ [kPa]',
+                    'Dev. stress, $q^{*} = \\sqrt{2} \\cdot |\\sigma-pI|$ [kPa]',
+                    [('p_ast', 'q_ast', 1, 1, None)], {}),
+    'plot_e_vs_logp': ('Mid stress, $p^{*} = \\dfrac{\\sigma_{x}+\\sigma_{y}}{2}$ [kPa]', 'Void ratio, e [-]',
+                       [('p_ast', 'e', 1, 1, None)], {'log_scale': True}),
+    'plot_ryy_vs_rxy': ('Stress ratio, $r_{xy}=\\dfrac{\\sigma_{xy}}{p^{*}}$',
+                        'Stress ratio, $r_{yy}=\\dfrac{\\sigma_{yy}-p^{*}}{p^{*}}$',
+                        [('rxy', 'ryy', np.sqrt(2), np.sqrt(2), None)], {'equal': True}),
+    'plot_ru_vs_gxy': ('Shear strain, $\\gamma_{xy}$ [-]', 'ru coefficient, $ru$ [-]',
+                       [('gamxy', 'ru', 1, 1, None)], {}),
+    'plot_rxy_vs_N': (None, 'Back stress ratio, $r_{ii}$ [-]',
+                      [(None, 'rxx', 1, 1, '$r_{xx}$'), (None, 'ryy', 1, 1, '$r_{yy}$'),
+                       (None, 'rxy', 1, 1, '$r_{xy}$')], {}),
+}
+
+
+def find_runs(data_dir):
+    """
+    Returns the runs below data_dir (C*.csv files), sorted by path. A run
+    converted with convert_csv is returned as its directory instead of the CSV.
+    """
+    sources = []
+    for path in sorted(glob.glob(os.path.join(data_dir, '**', 'C*.csv'), recursive=True)):
+        directory = os.path.splitext(path)[0]
+        sources.append(directory if os.path.exists(os.path.join(directory, 'meta.json')) else path)
+    return sources
+
+
+def read_run(source):
+    """
+    Returns (data, params) of a run CSV, with the parameter CSV found by
+    params_csv_for (params is None without one), or of a directory written
+    by save_run (memory-mapped).
+    """
+    if os.path.isdir(source):
+        return load_run(source)
+    params_path = params_csv_for(source)
+    data = pd.read_csv(source, index_col=0)
+    params = pd.read_csv(params_path, index_col=0) if params_path is not None else None
+    return data, params
+
+
+def run_names(sources):
+    """Returns the file names of sources without extension, or the paths if two names clash."""
+    names = [os.path.splitext(os.path.basename(os.path.normpath(source)))[0] for source in sources]
+    if len(set(names)) < len(names):
+        names = [os.path.normpath(source) for source in sources]
+    return names
+
+
+def _prepare_run(source, columns, steps_per_cycle):
+    """Returns (data, params, derived columns), or (None, None, error) if the columns cannot be derived."""
+    data, params = read_run(source)
+    try:
+        derived = compute_derived(data, params, columns=columns, inplace=False, steps_per_cycle=steps_per_cycle)
+    except ValueError as error:
+        return None, None, str(error)
+    for column, values in derived.items():
+        data[column] = values
+    return data, params, list(derived)
+
+
+def load_batch(sources, columns=None, workers=None, steps_per_cycle=200):
+    """
+    Loads many runs and computes their derived columns, in parallel.
+
+    Every run is read and preprocessed (see compute_derived) by a pool of
+    worker processes, so the fabric integration of one run does not wait for
+    the others.
+
+    Parameters:
+    - sources: str or list of str
+        Run CSV files or save_run directories, or a data directory whose runs
+        are found with find_runs.
+    - columns: list or None, optional
+        Derived columns to compute, see compute_derived. Runs that lack their
+        inputs are left out, with a warning. Default is None, which computes
+        every derived column the inputs of a run allow (runs of PM4Silt and
+        PM4Sand can be mixed), with a warning for the runs missing derived
+        columns that other runs have (e.g. the fabric without eps_xx and
+        eps_yy): they are NaN in resample_runs. An extracted column with the
+        name of such a column (eps_v) is dropped, so runs are not mixed with
+        values on another scale.
+    - workers: int or None, optional
+        Number of processes. Default is None (os.cpu_count()). With 1, the runs
+        are prepared in this process.
+    - steps_per_cycle: int, optional
+        See compute_derived. Default is 200.
+
+    Returns:
+    - dict
+        Run name (see run_names) -> (data, params), in the order of sources.
+    """
+    if isinstance(sources, str):
+        sources = find_runs(sources)
+    sources = list(sources)
+    workers = min(workers or os.cpu_count() or 1, len(sources))
+
+    with profile('io', 'load_batch'):
+        if workers <= 1:
+            results = [_prepare_run(source, columns, steps_per_cycle) for source in sources]
+        else:
+            with ProcessPoolExecutor(workers) as pool:
+                results = list(pool.map(_prepare_run, sources, [columns] * len(sources),
+                                        [steps_per_cycle] * len(sources)))
+
+    runs = {}
+    derived_any = set()
+    for name, (data, params, derived) in zip(run_names(sources), results):
+        if data is None:
+            warnings.warn('%s left out: %s' % (name, derived))
+            continue
+        runs[name] = (data, params, derived)
+        derived_any.update(derived)
+    for name, (data, params, derived) in runs.items():
+        missing = [column for column in DERIVED_COLUMNS if column in derived_any and column not in derived]
+        if missing:
+            # An extracted column named like a derived one (eps_v) is on another scale; keep the batch consistent
+            dropped = [column for column in missing if column in data]
+            if dropped:
+                data.drop(columns=dropped, inplace=True)
+            warnings.warn('%s: %s could not be derived%s' % (
+                name, ', '.join(missing), ' (extracted %s dropped)' % ', '.join(dropped) if dropped else ''))
+    return {name: (data, params) for name, (data, params, _) in runs.items()}
+
+
+def resample_axis(data, axis):
+    """
+    Returns the values of a resampling axis for every step of data: 'step'
+    (the step index) or a column, e.g. 'N' (cycles), 'gamxy_cum' (cumulative
+    shear strain) or a time column.
+    """
+    if axis == 'step':
+        return np.arange(len(data), dtype=float)
+    if axis not in data:
+        raise ValueError("data has no '%s' column to resample on" % axis)
+    return np.asarray(data[axis], dtype=float)
+
+
+def interpolation_weights(x, grid):
+    """
+    Returns the linear interpolation of the steps of a run at the points of
+    grid, as indices and weights shared by all its columns: the value of a
+    column at grid[j] is values[lo[j]] * (1 - w[j]) + values[hi[j]] * w[j].
+
+    Parameters:
+    - x: numpy.ndarray
+        Axis value at every step, nondecreasing. Steps with a NaN value are
+        skipped. Within a run of equal values the last step is used.
+    - grid: numpy.ndarray
+        Points to resample at.
+
+    Returns:
+    - tuple: (lo, hi, w, inside)
+        inside is False at the points outside the range of x.
+    """
+    x = np.asarray(x, dtype=float)
+    grid = np.asarray(grid, dtype=float)
+    steps = np.flatnonzero(np.isfinite(x))
+    if len(steps) == 0:
+        zeros = np.zeros(len(grid), dtype=np.intp)
+        return zeros, zeros, np.zeros(len(grid)), np.zeros(len(grid), dtype=bool)
+    xs = x[steps]
+    if np.any(xs[1:] < xs[:-1]):
+        raise ValueError('the resampling axis must be nondecreasing')
+
+    i = np.searchsorted(xs, grid, side='right') - 1
+    np.clip(i, 0, max(len(xs) - 2, 0), out=i)
+    j = np.minimum(i + 1, len(xs) - 1)
+    dx = xs[j] - xs[i]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        w = np.where(dx > 0, (grid - xs[i]) / dx, 0.0)
+    inside = (grid >= xs[0]) & (grid <= xs[-1])
+    return steps[i], steps[j], w, inside
+
+
+def resample_runs(runs, axis='N', columns=None, grid=None, npoints=1000, overlap=False):
+    """
+    Resamples runs to a common grid of an axis, e.g. to compare or average them.
+
+    The interpolation indices and weights of a run are computed once (see
+    interpolation_weights) and applied to all its columns at once.
+
+    Parameters:
+    - runs: dict
+        Run name -> (data, params), as returned by load_batch.
+    - axis: str, optional
+        Resampling axis, see resample_axis. Default is 'N'.
+    - columns: list or None, optional
+        Columns to resample. Default is None, every numeric column of any run.
+    - grid: array-like or None, optional
+        Points to resample at. Default is None, npoints evenly spaced points
+        over the range of axis.
+    - npoints: int, optional
+        Number of points of the default grid. Default is 1000.
+    - overlap: bool, optional
+        The default grid covers only the range every run reaches, instead of
+        the range of any run. Default is False.
+
+    Returns:
+    - tuple: (grid, values)
+        values is a dict column -> (number of runs, number of points) array,
+        in the order of runs. Points outside the range of a run, and columns
+        a run does not have, are NaN.
+    """
+    with profile('convert', 'resample_runs'):
+        axes = [resample_axis(data, axis) for data, _ in runs.values()]
+        if grid is None:
+            lows = [np.nanmin(x) for x in axes]
+            highs = [np.nanmax(x) for x in axes]
+            low, high = (max(lows), min(highs)) if overlap else (min(lows), max(highs))
+            if low > high:
+                raise ValueError("the runs have no common range of '%s'" % axis)
+            grid = np.linspace(low, high, npoints)
+        grid = np.asarray(grid, dtype=float)
+
+        if columns is None:
+            columns = []
+            for data, _ in runs.values():
+                columns.extend(column for column in data.select_dtypes('number').columns if column not in columns)
+
+        values = {column: np.full((len(runs), len(grid)), np.nan) for column in columns}
+        for k, ((data, _), x) in enumerate(zip(runs.values(), axes)):
+            present = [column for column in columns if column in data]
+            if not present:
+                continue
+            lo, hi, w, inside = interpolation_weights(x, grid)
+            block = data[present].to_numpy(dtype=float)
+            resampled = block[lo] * (1 - w)[:, None] + block[hi] * w[:, None]
+            resampled[~inside] = np.nan
+            for column, column_values in zip(present, resampled.T):
+                values[column][k] = column_values
+    return grid, values
+
+
+def run_colors(n, cmap=None):
+    """Returns n colors for the runs of an overlay: tab10 up to 10 runs, viridis beyond."""
+    import matplotlib
+
+    if cmap is None:
+        cmap = 'tab10' if n <= 10 else 'viridis'
+    colormap = matplotlib.colormaps[cmap]
+    if getattr(colormap, 'N', 256) <= 10:
+        return [colormap(i) for i in range(n)]
+    return [colormap(v) for v in np.linspace(0, 1, n)]
+
+
+def _curve(values, columns, nruns, npoints):
+    """Values of a curve column, filling the runs without the first column from the next ones."""
+    if isinstance(columns, str):
+        columns = (columns,)
+    result = np.full((nruns, npoints), np.nan)
+    for column in columns:
+        if column in values:
+            missing = np.isnan(result).all(axis=1)
+            result[missing] = values[column][missing]
+    return result
+
+
+def overlay_columns(panels, axis='N'):
+    """Returns the columns the overlays of panels (plot functions or names) read, with axis."""
+    columns = [] if axis == 'step' else [axis]
+    for panel in panels:
+        for x, y, _, _, _ in OVERLAY_PANELS[getattr(panel, '__name__', panel)][2]:
+            for column in (x, y):
+                names = (column,) if isinstance(column, str) else column or ()
+                columns.extend(name for name in names if name not in columns)
+    return columns
+
+
+def overlay_panel(ax, function, grid, values, axis='N', colors=None, xmin='auto', xmax='auto', ymin='auto',
+                  ymax='auto', log_scale=None, **kwargs):
+    """
+    Draws the curves of a plot function for every run of a batch on the
+    provided Matplotlib Axes, one color per run.
+
+    Parameters:
+    - ax: Matplotlib Axes
+    - function: function or str
+        plot_* function (or its name) with an overlay, see OVERLAY_PANELS.
+    - grid, values:
+        Resampled runs, see resample_runs.
+    - axis: str, optional
+        Resampling axis of grid, the x axis of the time history panels
+        (plot_alpha_vs_N, plot_rxy_vs_N). Default is 'N'.
+    - colors: list or None, optional
+        Color of every run. Default is None (see run_colors).
+    - xmin, xmax, ymin, ymax: float or 'auto', optional
+        Axis limits. Default is 'auto', the range of all runs.
+    - log_scale: bool or None, optional
+        Logarithmic x axis. Default is None, as the plot function.
+    - **kwargs:
+        Other options of the plot function (limits, surfaces...), ignored.
+    """
+    from matplotlib.collections import LineCollection
+
+    xlabel, ylabel, curves, options = OVERLAY_PANELS[getattr(function, '__name__', function)]
+    nruns, npoints = len(next(iter(values.values()))), len(grid)
+    if colors is None:
+        colors = run_colors(nruns)
+    if log_scale is None:
+        log_scale = options.get('log_scale', False)
+
+    ax.set_xlabel(xlabel or AXIS_LABELS.get(axis, axis))
+    ax.set_ylabel(ylabel)
+    ax.axhline(0, color='k', linestyle='dotted')
+    ax.grid(color='gray', alpha=0.2)
+
+    xs, ys = [], []
+    for (x, y, xscale, yscale, label), style in zip(curves, ('solid', 'dashed', 'dotted')):
+        xvalues = np.broadcast_to(grid, (nruns, npoints)) if x is None else _curve(values, x, nruns, npoints)
+        xvalues = xvalues * xscale
+        yvalues = _curve(values, y, nruns, npoints) * yscale
+        # One collection per curve draws all the runs in a single call
+        ax.add_collection(LineCollection(np.stack([xvalues, yvalues], axis=-1), colors=colors, linestyles=style,
+                                         linewidths=1))
+        if label is not None:
+            ax.plot([], [], color='k', linestyle=style, label=label)
+        xs.append(xvalues)
+        ys.append(yvalues)
+
+    # Limits of the runs, ignoring the points outside their range
+    xrange = {'x': np.array([np.nanmin(xs), np.nanmax(xs)])}
+    yrange = {'y': np.array([np.nanmin(ys), np.nanmax(ys)])}
+    xmin, xmax = set_limit(xmin, xmax, xrange, ['x'], offset=0 if log_scale else 0.1)
+    ymin, ymax = set_limit(ymin, ymax, yrange, ['y'])
+    if options.get('equal'):
+        value_max = max(abs(xmin), xmax, abs(ymin), ymax)
+        xmin, xmax, ymin, ymax = -value_max, value_max, -value_max, value_max
+        ax.set_aspect('equal')
+    if log_scale:
+        ax.set_xscale('log')
+    ax.set_xlim(xmin, xmax)
+    ax.set_ylim(ymin, ymax)
+    if any(curve[4] is not None for curve in curves):
+        ax.legend(loc='upper left', ncol=3)
+
+
+def render_overlays(panels, runs, path=None, axis='N', grid=None, npoints=1000, overlap=False, shape=None,
+                    figsize=None, dpi=100, colors=None, legend=None):
+    """
+    Draws a dashboard of panels overlaying the full histories of many runs,
+    resampled to a common grid (see resample_runs).
+
+    Parameters:
+    - panels: list
+        Dashboard spec, see Dashboard (e.g. PM4SILT_DASHBOARD). Panels without
+        an overlay (particles_plot) are left out, and the surfaces of a
+        single run are not drawn.
+    - runs: dict
+        Run name -> (data, params), as returned by load_batch.
+    - path: str or None, optional
+        Image file to save the figure to. Default is None.
+    - axis, grid, npoints, overlap:
+        See resample_runs. Default is 'N' with 1000 points.
+    - shape, figsize, dpi:
+        See PanelAnimation.
+    - colors: list or None, optional
+        Color of every run. Default is None (see run_colors).
+    - legend: bool or None, optional
+        Show the names of the runs below the panels. Default is None, only
+        for up to 20 runs.
+
+    Returns:
+    - matplotlib.figure.Figure
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from matplotlib.lines import Line2D
+
+    panels = [panel for panel in resolve_panels(panels) if panel[0].__name__ in OVERLAY_PANELS]
+    if shape is None:
+        shape = (max(row for _, (row, _), _ in panels) + 1, max(col for _, (_, col), _ in panels) + 1)
+    if figsize is None:
+        figsize = (4 * shape[1], 4 * shape[0])
+    if colors is None:
+        colors = run_colors(len(runs))
+    if legend is None:
+        legend = len(runs) <= 20
+
+    grid, values = resample_runs(runs, axis, columns=overlay_columns([panel[0] for panel in panels], axis),
+                                 grid=grid, npoints=npoints, overlap=overlap)
+
+    figure = Figure(figsize=figsize, dpi=dpi, layout='constrained')
+    FigureCanvasAgg(figure)
+    gridspec = figure.add_gridspec(*shape)
+    with profile('render', 'render_overlays'):
+        for function, (row, col), options in panels:
+            ax = figure.add_subplot(gridspec[row, col])
+            overlay_panel(ax, function, grid, values, axis=axis, colors=colors, **options)
+        if legend:
+            handles = [Line2D([], [], color=color) for color in colors]
+            figure.legend(handles, list(runs), loc='outside lower center', ncol=min(len(runs), 5))
+        if path is not None:
+            figure.savefig(path)
+    return figure
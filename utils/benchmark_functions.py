@@ -0,0 +1,353 @@
+"""
+Benchmarks of extraction, preprocessing and rendering on the bundled runs.
+
+Every benchmark is timed on the runs of data/ (C*.csv with their parameter
+files) and on synthetic runs made of 10 and 100 copies of them, and the results
+are written as JSON so two versions can be compared:
+
+    python -m utils.benchmark_functions --output bench_new.json --compare bench_old.json
+
+or from Python:
+
+    from utils.benchmark_functions import run_benchmarks, compare_results
+    results = run_benchmarks('bench.json', scales=(1, 10))
+"""
+import argparse
+import glob
+import inspect
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import matplotlib
+import numpy as np
+import pandas as pd
+
+from . import plot_functions as pf
+from .dashboard_functions import Dashboard
+from .derived_functions import PLOT_COLUMNS, compute_derived, integrate_fabric, param_value
+from .extract_functions import (PM4SAND_COLUMNS, PM4SAND_FIELDS, PM4SILT_COLUMNS, PM4SILT_FIELDS,
+                                clear_result_types, extract_data_PM4Sand, extract_data_PM4Sand_batched,
+                                extract_data_PM4Silt, extract_data_PM4Silt_batched)
+from .fake_output import FakeOutput
+from .render_functions import MemorySink
+from .storage_functions import params_csv_for
+
+# Plot functions timed per frame, in the order of the dashboard
+PLOTS = [pf.plot_sxy_vs_gxy, pf.plot_sxy_vs_sy, pf.plot_alpha_vs_N, pf.plot_q_vs_p, pf.plot_e_vs_logp,
+         pf.plot_ryy_vs_rxy, pf.plot_ru_vs_gxy, pf.particles_plot, pf.plot_rxy_vs_N]
+
+# Model -> (extraction functions, field table, columns)
+EXTRACTORS = {
+    'PM4Silt': ({'extract_data': extract_data_PM4Silt, 'extract_data_batched': extract_data_PM4Silt_batched},
+                PM4SILT_FIELDS, PM4SILT_COLUMNS),
+    'PM4Sand': ({'extract_data': extract_data_PM4Sand, 'extract_data_batched': extract_data_PM4Sand_batched},
+                PM4SAND_FIELDS, PM4SAND_COLUMNS),
+}
+
+
+def timeit(function, repeat=5):
+    """Calls function repeat times and returns the wall times in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def result(benchmark, dataset, scale, steps, times, per='call', count=1, **extra):
+    """
+    One benchmark record. min and median are per 'per' (call, frame...), i.e.
+    the wall times divided by count.
+    """
+    times = np.asarray(times, dtype=float) / count
+    record = {'benchmark': benchmark, 'dataset': dataset, 'scale': scale, 'steps': steps, 'per': per,
+              'repeat': len(times), 'min': float(times.min()), 'median': float(np.median(times)),
+              'times': times.tolist()}
+    record.update(extra)
+    return record
+
+
+def load_runs(data_dir='data'):
+    """
+    Returns the bundled runs as {name: (data, params, model)}, with name the
+    CSV path relative to data_dir and model 'PM4Silt' or 'PM4Sand'.
+    """
+    runs = {}
+    for path in sorted(glob.glob(os.path.join(data_dir, '**', 'C*.csv'), recursive=True)):
+        params_path = params_csv_for(path)
+        if params_path is None:
+            continue
+        data = pd.read_csv(path, index_col=0)
+        model = 'PM4Sand' if 'alpha_xx' in data else 'PM4Silt'
+        runs[os.path.relpath(path, data_dir)] = (data, pd.read_csv(params_path, index_col=0), model)
+    return runs
+
+
+def scale_run(data, scale):
+    """Synthetic run of scale consecutive copies of data."""
+    if scale == 1:
+        return data
+    return pd.concat([data] * scale, ignore_index=True)
+
+
+def plot_args(function, data, params, stop_idx):
+    """Arguments of a plot_* function (some of them take no params)."""
+    if 'params' in inspect.signature(function).parameters:
+        return data, params, stop_idx
+    return data, stop_idx
+
+
+def available_plots(data):
+    """Plot functions whose columns are all in data (derived columns included)."""
+    plots = []
+    for function in PLOTS:
+        if all(column in data for column in PLOT_COLUMNS[function.__name__]):
+            plots.append(function)
+    return plots
+
+
+def bench_extraction(name, data, model, steps=200, latencies=(0.0, 0.001), repeat=3):
+    """
+    Times the extractors of model against a FakeOutput replaying the first
+    steps of data, for every per-call latency. Records the time per step and
+    the number of round trips. Only the columns present in data are extracted
+    (older runs lack some of them).
+    """
+    extractors, fields, columns = EXTRACTORS[model]
+    columns = [column for column in columns if column in data]
+    data = data.iloc[:steps]
+    records = []
+    for latency in latencies:
+        for label, extract in extractors.items():
+            g_o = FakeOutput(data, fields=fields, latency=latency)
+            point = g_o.StressPoints[0]
+            args = (point.x, point.y) if label == 'extract_data' else (point,)
+
+            def run():
+                clear_result_types()
+                g_o.reset()
+                extract(g_o, g_o.Phases, *args, columns=columns)
+
+            times = timeit(run, repeat)
+            records.append(result(label, name, 1, len(data), times, per='step', count=len(data),
+                                  latency=latency, round_trips=g_o.round_trips))
+    return records
+
+
+def bench_derived(name, data, params, scale, repeat=5):
+    """Times compute_derived (every derivable column, fabric included) on a run."""
+    times = timeit(lambda: compute_derived(data, params, inplace=False), repeat)
+    return [result('compute_derived', name, scale, len(data), times)]
+
+
+def bench_fabric(name, data, params, scale, repeat=5):
+    """Times integrate_fabric on the inputs computed by compute_derived, if data has them."""
+    inputs = ('deps_v_pl', 'D', 'zmax', 'nxx', 'nyy', 'nxy')
+    if any(column not in data for column in inputs) or 'cz' not in params:
+        return []
+    values = [np.asarray(data[column], dtype=float) for column in inputs]
+    cz, zmax = param_value(params, 'cz'), param_value(params, 'zmax')
+    times = timeit(lambda: integrate_fabric(*values, cz, zmax), repeat)
+    return [result('integrate_fabric', name, scale, len(data), times)]
+
+
+def bench_plots(name, data, params, scale, frames=5, dpi=100):
+    """
+    Times every available plot_* function per frame: the axes are cleared,
+    the panel drawn at stop_idx and the figure rendered (Agg), for frames
+    stop_idx spread over the run.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(4, 4), dpi=dpi)
+    canvas = FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
+    indices = np.linspace(2, len(data), frames).astype(int)
+    records = []
+    for function in available_plots(data):
+        times = []
+        for stop_idx in indices:
+            start = time.perf_counter()
+            ax.clear()
+            function(ax, *plot_args(function, data, params, stop_idx))
+            canvas.draw()
+            times.append(time.perf_counter() - start)
+        records.append(result(function.__name__, name, scale, len(data), times, per='frame', dpi=dpi))
+    figure.clear()
+    return records
+
+
+def bench_animation(name, data, params, scale, frames=50, dpi=100, decimate=False):
+    """
+    Times an end-to-end animation of the available panels (3 per row) with a
+    Dashboard: building it, then rendering frames into memory.
+    """
+    plots = available_plots(data)
+    if not plots:
+        return []
+    panels = [(function, (i // 3, i % 3)) for i, function in enumerate(plots)]
+    label = 'animation_decimate' if decimate else 'animation'
+    start = time.perf_counter()
+    dashboard = Dashboard(panels, data, params, dpi=dpi, decimate=decimate)
+    build = time.perf_counter() - start
+    with dashboard:
+        indices = np.linspace(2, len(data), frames).astype(int)
+        sink = MemorySink(dashboard.animation.canvas.get_width_height(), len(indices))
+        report = dashboard.render_range(indices, encoder=sink)
+    return [result(label + '_build', name, scale, len(data), [build], panels=len(panels), dpi=dpi),
+            result(label, name, scale, len(data), [report['seconds']], per='frame', count=frames,
+                   panels=len(panels), dpi=dpi)]
+
+
+def environment():
+    """Versions and machine of a benchmark run, stored with its results."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': commit, 'python': platform.python_version(),
+            'numpy': np.__version__, 'pandas': pd.__version__, 'matplotlib': matplotlib.__version__,
+            'platform': platform.platform(), 'processor': platform.processor(), 'cpus': os.cpu_count()}
+
+
+def run_benchmarks(output=None, data_dir='data', scales=(1, 10, 100), extract_steps=200,
+                   latencies=(0.0, 0.001), frames=5, animation_frames=50, repeat=5, progress=print):
+    """
+    Runs the benchmark suite and optionally writes the results as JSON.
+
+    Parameters:
+    - output: str or None, optional
+        JSON file of the results. Default is None (not written).
+    - data_dir: str, optional
+        Folder of the runs (C*.csv and their parameter files). Default is 'data'.
+    - scales: tuple of int, optional
+        Run lengths, as multiples of the bundled runs. Default is (1, 10, 100).
+        Extraction is only timed on the bundled runs.
+    - extract_steps: int, optional
+        Number of steps extracted from the fake server. Default is 200.
+    - latencies: tuple of float, optional
+        Per-call latencies of the fake server, in seconds. Default is (0, 0.001).
+    - frames: int, optional
+        Frames timed per plot function. Default is 5.
+    - animation_frames: int, optional
+        Frames of the end-to-end animation. Default is 50.
+    - repeat: int, optional
+        Repetitions of the extraction and preprocessing benchmarks. Default is 5.
+    - progress: callable or None, optional
+        Called with a message before every benchmark. Default is print.
+
+    Returns:
+    - dict
+        {'environment': ..., 'results': [record, ...]}, see result.
+    """
+    records = []
+    for name, (raw, params, model) in load_runs(data_dir).items():
+        if progress is not None:
+            progress('%s: extraction' % name)
+        records += bench_extraction(name, raw, model, extract_steps, latencies, repeat=min(repeat, 3))
+        for scale in scales:
+            data = scale_run(raw, scale)
+            if progress is not None:
+                progress('%s x%d: preprocessing' % (name, scale))
+            records += bench_derived(name, data, params, scale, repeat)
+            data = compute_derived(data.copy(), params)
+            records += bench_fabric(name, data, params, scale, repeat)
+            if progress is not None:
+                progress('%s x%d: plots and animation' % (name, scale))
+            records += bench_plots(name, data, params, scale, frames)
+            records += bench_animation(name, data, params, scale, animation_frames)
+            records += bench_animation(name, data, params, scale, animation_frames, decimate=True)
+
+    results = {'environment': environment(),
+               'settings': {'scales': list(scales), 'extract_steps': extract_steps, 'latencies': list(latencies),
+                            'frames': frames, 'animation_frames': animation_frames, 'repeat': repeat},
+               'results': records}
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=1)
+    return results
+
+
+def _key(record):
+    return (record['benchmark'], record['dataset'], record['scale'], record.get('latency'))
+
+
+def compare_results(baseline, current, tolerance=0.2):
+    """
+    Compares two benchmark runs (dicts or JSON files), benchmark by benchmark,
+    on the minimum time.
+
+    Returns:
+    - list of dict
+        One entry per benchmark present in both: its key, the baseline and
+        current minimum times, their ratio and 'regression' (ratio above
+        1 + tolerance), slowest ratio first.
+    """
+    runs = []
+    for run in (baseline, current):
+        if isinstance(run, str):
+            with open(run) as f:
+                run = json.load(f)
+        runs.append({_key(record): record for record in run['results']})
+    baseline, current = runs
+
+    comparison = []
+    for key, record in current.items():
+        if key not in baseline:
+            continue
+        ratio = record['min'] / baseline[key]['min'] if baseline[key]['min'] > 0 else float('inf')
+        comparison.append({'benchmark': key[0], 'dataset': key[1], 'scale': key[2], 'latency': key[3],
+                           'baseline': baseline[key]['min'], 'current': record['min'], 'ratio': ratio,
+                           'regression': ratio > 1 + tolerance})
+    comparison.sort(key=lambda entry: entry['ratio'], reverse=True)
+    return comparison
+
+
+def print_results(results):
+    """Prints benchmark records as a table."""
+    for record in results['results']:
+        extra = ' latency=%g' % record['latency'] if 'latency' in record else ''
+        print('%-26s %-28s x%-4d %8d steps  %10.3f ms/%s%s' % (
+            record['benchmark'], record['dataset'], record['scale'], record['steps'], record['min'] * 1000,
+            record['per'], extra))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of extraction, preprocessing and rendering.')
+    parser.add_argument('--output', default=None, help='JSON file of the results')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--scales', default='1,10,100', help='comma separated run length multiples')
+    parser.add_argument('--extract-steps', type=int, default=200)
+    parser.add_argument('--latencies', default='0,0.001', help='comma separated fake server latencies [s]')
+    parser.add_argument('--frames', type=int, default=5)
+    parser.add_argument('--animation-frames', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--compare', default=None, help='baseline JSON file to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.output, args.data_dir, tuple(int(s) for s in args.scales.split(',')),
+                             args.extract_steps, tuple(float(s) for s in args.latencies.split(',')),
+                             args.frames, args.animation_frames, args.repeat)
+    print_results(results)
+    if args.compare is None:
+        return 0
+    regressions = 0
+    for entry in compare_results(args.compare, results, args.tolerance):
+        if entry['regression']:
+            regressions += 1
+            print('REGRESSION %s %s x%d: %.3f ms -> %.3f ms (x%.2f)' % (
+                entry['benchmark'], entry['dataset'], entry['scale'], entry['baseline'] * 1000,
+                entry['current'] * 1000, entry['ratio']))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,237 @@
+import numpy as np
+import pandas as pd
+
+from .extract_functions import (PM4SAND_COLUMNS, PM4SAND_FIELDS, PM4SILT_COLUMNS, PM4SILT_FIELDS,
+                                ExtractionReport, locate_stress_points, report_failures, result_columns,
+                                resolve_result_types, select_fields)
+from .profile_functions import profile
+
+
+class ResultBuffer:
+    """
+    Array-backed container of an extracted time history.
+
+    The float columns live in one preallocated (ncols, capacity) array and the
+    'phase' column in an int64 array, so every column is a contiguous view and
+    to_frame builds a pandas.DataFrame without copying the values.
+
+    Parameters:
+    - columns: list
+        Column order, including 'phase'.
+    - capacity: int
+        Number of preallocated rows. The buffer grows when it is exceeded.
+    - dtype: numpy dtype, optional
+        np.float64 (default) or np.float32.
+    - array: numpy.ndarray or None, optional
+        Existing (ncols - 1, capacity) array to fill instead of a new one.
+
+    Attributes:
+    - nrows: int
+        Number of filled rows.
+    """
+
+    def __init__(self, columns, capacity, dtype=np.float64, array=None):
+        self.columns = list(columns)
+        self.float_columns = [column for column in self.columns if column != 'phase']
+        self.index = {column: i for i, column in enumerate(self.float_columns)}
+        if array is None:
+            array = np.full((len(self.float_columns), capacity), np.nan, dtype=dtype)
+        self.array = array
+        self.phase = np.zeros(array.shape[1], dtype=np.int64)
+        self.nrows = 0
+
+    @classmethod
+    def from_dict(cls, data, dtype=np.float64):
+        """Builds a buffer from a dict of lists, as returned by extract_data."""
+        buffer = cls(list(data), len(data['phase']), dtype=dtype)
+        buffer.write(data)
+        return buffer
+
+    def __len__(self):
+        return self.nrows
+
+    def __getitem__(self, column):
+        """Returns a view of a column over the filled rows."""
+        if column == 'phase':
+            return self.phase[:self.nrows]
+        return self.array[self.index[column], :self.nrows]
+
+    def __contains__(self, column):
+        return column in self.columns
+
+    def __setitem__(self, column, values):
+        """
+        Sets a column over the filled rows. A new float column is added as one
+        more row of the array (which is copied), e.g. by compute_derived.
+        """
+        if column == 'phase':
+            self.phase[:self.nrows] = values
+            return
+        if column not in self.index:
+            row = np.full((1, self.array.shape[1]), np.nan, dtype=self.array.dtype)
+            self.array = np.concatenate([self.array, row])
+            self.index[column] = len(self.float_columns)
+            self.float_columns.append(column)
+            self.columns.append(column)
+        self.array[self.index[column], :self.nrows] = values
+
+    def reserve(self, capacity):
+        """Grows the buffer to at least capacity rows."""
+        if capacity <= self.array.shape[1]:
+            return
+        capacity = max(capacity, 2 * self.array.shape[1])
+        array = np.full((self.array.shape[0], capacity), np.nan, dtype=self.array.dtype)
+        array[:, :self.nrows] = self.array[:, :self.nrows]
+        phase = np.zeros(capacity, dtype=np.int64)
+        phase[:self.nrows] = self.phase[:self.nrows]
+        self.array, self.phase = array, phase
+
+    def write(self, record):
+        """
+        Appends a record ({column: value}) or a block ({column: list of values}),
+        so a buffer can be used as a sink of stream_to.
+        """
+        nrows = np.size(record['phase'])
+        self.reserve(self.nrows + nrows)
+        rows = slice(self.nrows, self.nrows + nrows)
+        for column in self.float_columns:
+            self.array[self.index[column], rows] = record[column]
+        self.phase[rows] = record['phase']
+        self.nrows += nrows
+
+    def to_frame(self):
+        """Returns the filled rows as a pandas.DataFrame sharing memory with the buffer."""
+        with profile('convert', 'ResultBuffer.to_frame'):
+            frame = pd.DataFrame(self.array[:, :self.nrows].T, columns=self.float_columns, copy=False)
+            if 'phase' in self.columns:
+                frame.insert(self.columns.index('phase'), 'phase', self.phase[:self.nrows])
+        return frame
+
+    def to_dict(self):
+        """Returns the filled rows as a dict of lists, like extract_data."""
+        return {column: self[column].tolist() for column in self.columns}
+
+
+def field_mapping(fields, float_columns, result_types):
+    """
+    Returns, for every float column, the position of its result type in
+    result_types and its factor (scale * sign).
+    """
+    by_column = {field[0]: field for field in fields}
+    source = np.array([result_types.index(by_column[column][1]) for column in float_columns])
+    factor = np.array([by_column[column][2] * by_column[column][3] for column in float_columns], dtype=float)
+    return source, factor
+
+
+def extract_data_array(g_o, phases, x, y, fields, all_columns, columns=None, dtype=np.float64, report=None):
+    """
+    Extracts a time history at point (x, y) into a preallocated ResultBuffer.
+
+    The buffer is sized from the step counts of the phases, and every step is
+    written with a single vectorized assignment.
+
+    Parameters:
+    - g_o, phases, x, y, fields, all_columns, columns, report:
+        See extract_data.
+    - dtype: numpy dtype, optional
+        np.float64 (default) or np.float32.
+
+    Returns:
+    - ResultBuffer
+    """
+    fields, columns = select_fields(fields, all_columns, columns)
+    handles = resolve_result_types(g_o, dict.fromkeys(field[1] for field in fields))
+    result_types = list(handles)
+    sources = result_columns(fields)
+    own_report = report is None
+    if own_report:
+        report = ExtractionReport()
+
+    phase_steps = [list(phase.Steps) for phase in phases]
+    buffer = ResultBuffer(columns, sum(len(steps) for steps in phase_steps), dtype=dtype)
+    source, factor = field_mapping(fields, buffer.float_columns, result_types)
+
+    values = np.empty(len(result_types))
+    for phaseid, steps in enumerate(phase_steps):
+        for istep, step in enumerate(steps):
+            for i, result_type in enumerate(result_types):
+                value = report.fetch(g_o.getsingleresult, (step, handles[result_type], (x, y)),
+                                     phaseid, istep, result_type, sources[result_type])
+                values[i] = np.nan if value is None else value
+            buffer.array[:, buffer.nrows] = values[source] * factor
+            buffer.phase[buffer.nrows] = phaseid
+            buffer.nrows += 1
+
+    if own_report:
+        report_failures(report)
+    return buffer
+
+
+def extract_data_points_array(g_o, phases, points, fields, all_columns, columns=None, dtype=np.float64,
+                              report=None):
+    """
+    Multi-point version of extract_data_array (see extract_data_points).
+
+    All points share one preallocated (npoints, ncols, nsteps) array, and each
+    step is written for every point with a single vectorized assignment.
+
+    Returns:
+    - list of ResultBuffer
+        One buffer per point, each a view of the shared array.
+    """
+    fields, columns = select_fields(fields, all_columns, columns)
+    handles = resolve_result_types(g_o, dict.fromkeys(field[1] for field in fields))
+    result_types = list(handles)
+    sources = result_columns(fields)
+    own_report = report is None
+    if own_report:
+        report = ExtractionReport()
+
+    phase_steps = [list(phase.Steps) for phase in phases]
+    nsteps = sum(len(steps) for steps in phase_steps)
+    float_columns = [column for column in columns if column != 'phase']
+    array = np.full((len(points), len(float_columns), nsteps), np.nan, dtype=dtype)
+    buffers = [ResultBuffer(columns, nsteps, array=array[i]) for i in range(len(points))]
+    source, factor = field_mapping(fields, float_columns, result_types)
+
+    stress_points = None
+    values = np.empty((len(result_types), len(points)))
+    nrows = 0
+    for phaseid, steps in enumerate(phase_steps):
+        for istep, step in enumerate(steps):
+            if stress_points is None:
+                stress_points = locate_stress_points(g_o, step, points)
+            for i, result_type in enumerate(result_types):
+                mesh_values = report.fetch(g_o.getresults, (step, handles[result_type], 'stresspoint'),
+                                           phaseid, istep, result_type, sources[result_type])
+                values[i] = np.nan if mesh_values is None else np.asarray(mesh_values, dtype=float)[stress_points]
+            array[:, :, nrows] = (values[source] * factor[:, None]).T
+            for buffer in buffers:
+                buffer.phase[nrows] = phaseid
+            nrows += 1
+
+    for buffer in buffers:
+        buffer.nrows = nrows
+    if own_report:
+        report_failures(report)
+    return buffers
+
+
+def extract_data_PM4Silt_array(g_o, phases, x, y, columns=None, dtype=np.float64, report=None):
+    return extract_data_array(g_o, phases, x, y, PM4SILT_FIELDS, PM4SILT_COLUMNS, columns=columns, dtype=dtype,
+                              report=report)
+
+
+def extract_data_PM4Sand_array(g_o, phases, x, y, columns=None, dtype=np.float64, report=None):
+    return extract_data_array(g_o, phases, x, y, PM4SAND_FIELDS, PM4SAND_COLUMNS, columns=columns, dtype=dtype,
+                              report=report)
+
+
+def extract_data_PM4Silt_points_array(g_o, phases, points, columns=None, dtype=np.float64, report=None):
+    return extract_data_points_array(g_o, phases, points, PM4SILT_FIELDS, PM4SILT_COLUMNS,
+                                     columns=columns, dtype=dtype, report=report)
+
+
+def extract_data_PM4Sand_points_array(g_o, phases, points, columns=None, dtype=np.float64, report=None):
+    return extract_data_points_array(g_o, phases, points, PM4SAND_FIELDS, PM4SAND_COLUMNS,
+                                     columns=columns, dtype=dtype, report=report)
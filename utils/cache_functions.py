@@ -0,0 +1,184 @@
+import os
+import sqlite3
+
+
+def file_fingerprint(path):
+    """
+    Fingerprint of a PLAXIS project file or directory, changing whenever the
+    project is saved or recalculated (size and modification time).
+    """
+    paths = [path]
+    if os.path.isdir(path):
+        paths = [os.path.join(root, name) for root, dirs, names in os.walk(path) for name in names]
+    stats = [os.stat(p) for p in paths]
+    size = sum(st.st_size for st in stats)
+    mtime = max([st.st_mtime_ns for st in stats], default=0)
+    return '%d:%d' % (size, mtime)
+
+
+def phase_name(phase):
+    """Returns the name of a phase, for PLAXIS proxies and plain objects."""
+    name = getattr(phase, 'Identification', None)
+    if name is None:
+        name = phase.Name
+    return str(getattr(name, 'value', name))
+
+
+class ResultCache:
+    """
+    Persistent on-disk cache of extracted results (SQLite).
+
+    Results are keyed by (phase key, step, x, y, result type) and material
+    parameters by (project, material, slot). The phase key combines the project,
+    its fingerprint, the phase name and its number of steps. A phase seen before
+    with the same fingerprint is found from its name alone (lookup_phase), so a
+    cache hit needs no request to the server besides the phase name.
+
+    Invalidation: when a phase of the project is seen again with a different key
+    (the fingerprint changed because the project was recalculated, or the step
+    count changed), every result of the old key is dropped. Parameters stored
+    under another fingerprint are ignored. invalidate() drops entries explicitly.
+
+    Eviction: once more than max_entries results are stored, the least recently
+    used ones are deleted.
+
+    Parameters:
+    - path: str
+        SQLite file. Created if missing.
+    - project: str, optional
+        Identifier of the project, e.g. the path of the model. Default is ''.
+    - fingerprint: str or None, optional
+        Version of the project, e.g. file_fingerprint('model.p2dx'). Default is
+        None, which is file_fingerprint(project). Without a fingerprint,
+        results of an older calculation would be served as current, so a
+        ValueError is raised if project is not an existing file or directory.
+    - max_entries: int, optional
+        Maximum number of cached results. Default is 10**7 (about 1 GB on disk).
+    """
+
+    def __init__(self, path, project='', fingerprint=None, max_entries=10**7):
+        if fingerprint is None:
+            if not project or not os.path.exists(project):
+                raise ValueError('a fingerprint is needed unless project is the path of the model, '
+                                 'e.g. ResultCache(path, project, file_fingerprint(model_path))')
+            fingerprint = file_fingerprint(project)
+        self.path = path
+        self.project = project
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self._clock = 0
+        self._db = sqlite3.connect(path)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS results (
+                phase TEXT, step INTEGER, x REAL, y REAL, result_type TEXT, value REAL, used INTEGER,
+                PRIMARY KEY (phase, x, y, step, result_type));
+            CREATE TABLE IF NOT EXISTS phases (
+                project TEXT, name TEXT, phase TEXT, PRIMARY KEY (project, name));
+            CREATE TABLE IF NOT EXISTS params (
+                project TEXT, material INTEGER, slot INTEGER, fingerprint TEXT, value REAL,
+                PRIMARY KEY (project, material, slot));
+        ''')
+        row = self._db.execute('SELECT MAX(used) FROM results').fetchone()
+        self._clock = row[0] or 0
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def _key(self, name, nsteps):
+        return '%s|%s|%s|%d' % (self.project, self.fingerprint, name, nsteps)
+
+    def lookup_phase(self, phase):
+        """
+        Returns (key, number of steps) of a phase stored with the current
+        fingerprint, or None. Only the name of the phase is read.
+        """
+        name = phase_name(phase)
+        row = self._db.execute('SELECT phase FROM phases WHERE project=? AND name=?',
+                               (self.project, name)).fetchone()
+        if row is None:
+            return None
+        nsteps = int(row[0].rsplit('|', 1)[1])
+        if row[0] != self._key(name, nsteps):
+            return None
+        return row[0], nsteps
+
+    def phase_key(self, phase, nsteps):
+        """
+        Returns the key of a phase and drops the results of its previous key
+        if the phase was recalculated.
+        """
+        name = phase_name(phase)
+        key = self._key(name, nsteps)
+        row = self._db.execute('SELECT phase FROM phases WHERE project=? AND name=?',
+                               (self.project, name)).fetchone()
+        if row is None or row[0] != key:
+            with self._db:
+                if row is not None:
+                    self._db.execute('DELETE FROM results WHERE phase=?', (row[0],))
+                self._db.execute('INSERT OR REPLACE INTO phases VALUES (?, ?, ?)', (self.project, name, key))
+        return key
+
+    def invalidate(self, phase=None):
+        """Drops the cached results of a phase, or of the whole project if phase is None."""
+        with self._db:
+            if phase is None:
+                keys = [row[0] for row in self._db.execute('SELECT phase FROM phases WHERE project=?',
+                                                           (self.project,))]
+                self._db.execute('DELETE FROM phases WHERE project=?', (self.project,))
+                self._db.execute('DELETE FROM params WHERE project=?', (self.project,))
+            else:
+                name = phase_name(phase)
+                keys = [row[0] for row in self._db.execute('SELECT phase FROM phases WHERE project=? AND name=?',
+                                                           (self.project, name))]
+                self._db.execute('DELETE FROM phases WHERE project=? AND name=?', (self.project, name))
+            self._db.executemany('DELETE FROM results WHERE phase=?', [(key,) for key in keys])
+
+    def load(self, phase_key, x, y):
+        """Returns the cached results of a phase at (x, y) as {(step, result type): value}."""
+        self._clock += 1
+        with self._db:
+            self._db.execute('UPDATE results SET used=? WHERE phase=? AND x=? AND y=?',
+                             (self._clock, phase_key, x, y))
+        rows = self._db.execute('SELECT step, result_type, value FROM results WHERE phase=? AND x=? AND y=?',
+                                (phase_key, x, y))
+        return {(step, result_type): value for step, result_type, value in rows}
+
+    def store(self, phase_key, x, y, values):
+        """Stores [(step, result type, value), ...] of a phase at (x, y) and evicts if needed."""
+        if not values:
+            return
+        self._clock += 1
+        with self._db:
+            self._db.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                 [(phase_key, step, x, y, str(result_type), value, self._clock)
+                                  for step, result_type, value in values])
+        self.evict()
+
+    def evict(self):
+        excess = len(self) - self.max_entries
+        if excess > 0:
+            with self._db:
+                self._db.execute('DELETE FROM results WHERE rowid IN '
+                                 '(SELECT rowid FROM results ORDER BY used LIMIT ?)', (excess,))
+
+    def load_params(self, material):
+        """Returns the cached parameters of a material as {slot: value}."""
+        rows = self._db.execute('SELECT slot, value FROM params WHERE project=? AND material=? AND fingerprint=?',
+                                (self.project, material, self.fingerprint))
+        return dict(rows.fetchall())
+
+    def store_params(self, material, values):
+        """Stores {slot: value} for a material."""
+        with self._db:
+            self._db.executemany('INSERT OR REPLACE INTO params VALUES (?, ?, ?, ?, ?)',
+                                 [(self.project, material, slot, self.fingerprint, value)
+                                  for slot, value in values.items()])
@@ -0,0 +1,326 @@
+import csv
+import json
+import math
+import os
+import time
+
+from .extract_functions import (PM4SAND_COLUMNS, PM4SAND_FIELDS, PM4SILT_COLUMNS, PM4SILT_FIELDS,
+                                ExtractionReport, extract_steps, report_failures, resolve_result_types,
+                                select_fields)
+
+
+class Checkpoint:
+    """
+    Append-only CSV checkpoint of an extraction.
+
+    Every row holds the index of the step within its phase ('step') followed by
+    the extracted columns. Rows are flushed to disk as soon as they are
+    appended, so an interrupted extraction loses at most the block in progress.
+    A partially written last line is discarded when the checkpoint is reopened.
+
+    Values that could not be extracted are stored as NaN. Such steps are
+    listed in failed and can be extracted again: the new row is appended, and
+    a later row of the same phase and step replaces the earlier one when the
+    file is read back.
+
+    What the rows were extracted for (the point, the version of the project)
+    is stored next to the CSV, in path + '.json'. A checkpoint is only resumed
+    for the same key, so steps of another point or of an older calculation
+    are never mixed with new ones.
+
+    Parameters:
+    - path: str
+        CSV file. Created if missing.
+    - columns: list
+        Extracted columns, in order. Must match the header of an existing file.
+    - key: dict or None, optional
+        What the checkpoint holds, e.g. {'x': x, 'y': y, 'fingerprint': ...}
+        (JSON values). Must match the key of an existing file: a checkpoint
+        with rows and another key, or no key file, raises ValueError. Default
+        is None, which checks the columns only.
+
+    Attributes:
+    - data: dict
+        Column name -> list of values of every checkpointed step.
+    - done: dict
+        Phase id -> index of the first step that is not checkpointed yet.
+    - failed: set
+        (phase id, step) pairs whose row holds NaN values.
+    """
+
+    def __init__(self, path, columns, key=None):
+        self.path = path
+        self.columns = list(columns)
+        # Compared as read back from the key file (tuples become lists)
+        self.key = None if key is None else json.loads(json.dumps(key))
+        self.data = {column: [] for column in self.columns}
+        self.done = {}
+        self.failed = set()
+        self._rows = {}
+
+        if os.path.exists(path):
+            self._read()
+            if self.data['phase'] and self.key is not None:
+                self._check_key()
+        self._file = open(path, 'a', newline='')
+        self._writer = csv.writer(self._file)
+        if os.path.getsize(path) == 0:
+            self._writer.writerow(['step'] + self.columns)
+            self._file.flush()
+        if self.key is not None and not self.data['phase']:
+            self._write_key()
+
+    def _check_key(self):
+        try:
+            with open(self.path + '.json') as f:
+                key = json.load(f)
+        except FileNotFoundError:
+            raise ValueError('checkpoint %s has no key file, it may hold another point or project' % self.path)
+        if key != self.key:
+            raise ValueError('checkpoint %s holds %s, not %s' % (self.path, key, self.key))
+
+    def _write_key(self):
+        # Written under another name first, so an interrupted write never leaves a broken key file
+        with open(self.path + '.json.tmp', 'w') as f:
+            json.dump(self.key, f)
+        os.replace(self.path + '.json.tmp', self.path + '.json')
+
+    def _read(self):
+        with open(self.path, newline='') as f:
+            text = f.read()
+        if text and not text.endswith('\n'):
+            # Drop a row cut short by an interruption
+            text = text[:text.rfind('\n') + 1]
+            with open(self.path, 'w', newline='') as f:
+                f.write(text)
+
+        rows = csv.reader(text.splitlines())
+        header = next(rows, None)
+        if header is None:
+            return
+        if header != ['step'] + self.columns:
+            raise ValueError('checkpoint %s has different columns' % self.path)
+
+        for row in rows:
+            values = {column: int(value) if column == 'phase' else float(value)
+                      for column, value in zip(self.columns, row[1:])}
+            self._store(values, int(row[0]))
+
+    def _store(self, values, step):
+        phaseid = values['phase']
+        index = self._rows.get((phaseid, step))
+        if index is None:
+            self._rows[(phaseid, step)] = len(self.data['phase'])
+            for column in self.columns:
+                self.data[column].append(values[column])
+        else:
+            for column in self.columns:
+                self.data[column][index] = values[column]
+        self.done[phaseid] = max(self.done.get(phaseid, 0), step + 1)
+        if any(column != 'phase' and math.isnan(values[column]) for column in self.columns):
+            self.failed.add((phaseid, step))
+        else:
+            self.failed.discard((phaseid, step))
+
+    def append(self, part, steps):
+        """
+        Appends extracted rows and flushes them to disk. A row of a step that
+        is already checkpointed replaces it.
+
+        Parameters:
+        - part: dict
+            Column name -> list of values, as filled by extract_steps.
+        - steps: list of int
+            Index within its phase of every row of part.
+        """
+        for i, step in enumerate(steps):
+            self._writer.writerow([step] + [part[column][i] for column in self.columns])
+            self._store({column: part[column][i] for column in self.columns}, step)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def extract_new_steps(g_o, checkpoint, phase, phaseid, x, y, fields, handles, block_size, report):
+    """
+    Extracts the steps of a phase that are not in the checkpoint yet, in blocks
+    of block_size steps, and returns the new rows. Values that could not be
+    extracted are checkpointed as NaN and recorded in report.
+    """
+    columns = checkpoint.columns
+    new = {column: [] for column in columns}
+    steps = list(phase.Steps)
+    first = checkpoint.done.get(phaseid, 0)
+
+    for start in range(first, len(steps), block_size):
+        stop = min(start + block_size, len(steps))
+        part = {column: [] for column in columns}
+        extract_steps(g_o, steps[start:stop], x, y, fields, handles, part, phaseid,
+                      report=report, first_step=start)
+        checkpoint.append(part, list(range(start, stop)))
+        for column in columns:
+            new[column].extend(part[column])
+
+    return new
+
+
+def retry_failed_steps(g_o, checkpoint, phases, x, y, fields, handles, report):
+    """
+    Extracts again the checkpointed steps whose values could not be extracted
+    (see Checkpoint.failed) and replaces their rows. phases[phaseid] is the
+    phase of every phase id. Steps that fail again stay NaN and are recorded
+    in report.
+    """
+    columns = checkpoint.columns
+    for phaseid in sorted({phaseid for phaseid, _ in checkpoint.failed}):
+        steps = list(phases[phaseid].Steps)
+        for step in sorted(step for failed_phase, step in checkpoint.failed if failed_phase == phaseid):
+            if step >= len(steps):
+                continue
+            part = {column: [] for column in columns}
+            extract_steps(g_o, [steps[step]], x, y, fields, handles, part, phaseid,
+                          report=report, first_step=step)
+            checkpoint.append(part, [step])
+
+
+def extract_data_resumable(g_o, phases, x, y, fields, all_columns, path, columns=None, block_size=50,
+                           fingerprint='', report=None):
+    """
+    Extracts a time history at point (x, y) with checkpoints, resuming after
+    the last checkpointed step if path already exists. Checkpointed steps whose
+    values could not be extracted are requested again. A checkpoint of another
+    point or fingerprint is not resumed (ValueError): delete it to start over.
+
+    Parameters:
+    - g_o: PLAXIS output global object
+    - phases: list
+        Phases to extract, in order.
+    - x, y: float
+        Coordinates of the point.
+    - fields, all_columns, columns, report:
+        See extract_data.
+    - path: str
+        Checkpoint CSV (see Checkpoint).
+    - block_size: int, optional
+        Number of steps between checkpoints. Default is 50.
+    - fingerprint: str, optional
+        Version of the project, e.g. file_fingerprint('model.p2dx') (see
+        ResultCache). Default is ''.
+
+    Returns:
+    - dict
+        Column name -> list of values, one per step, including the steps
+        read back from the checkpoint.
+    """
+    fields, columns = select_fields(fields, all_columns, columns)
+    handles = resolve_result_types(g_o, dict.fromkeys(field[1] for field in fields))
+
+    own_report = report is None
+    if own_report:
+        report = ExtractionReport()
+
+    phases = list(phases)
+    key = {'x': float(x), 'y': float(y), 'fingerprint': fingerprint}
+    with Checkpoint(path, columns, key=key) as checkpoint:
+        retry_failed_steps(g_o, checkpoint, phases, x, y, fields, handles, report)
+        phaseid = -1
+        for phase in phases:
+            phaseid += 1
+            extract_new_steps(g_o, checkpoint, phase, phaseid, x, y, fields, handles, block_size, report)
+
+    if own_report:
+        report_failures(report)
+    return checkpoint.data
+
+
+def follow_data(g_o, phase_idx, x, y, fields, all_columns, path, columns=None, block_size=50,
+                poll_interval=10.0, idle_polls=3, refresh=None, report=None):
+    """
+    Follows a phase that is still being calculated, extracting only new steps.
+
+    The phase is polled every poll_interval seconds and the steps added since
+    the previous poll are checkpointed and yielded, so histories can be plotted
+    while the analysis runs. Steps already in the checkpoint are not requested
+    again, which also makes following resumable (for the same point and
+    phase only, see Checkpoint). Checkpointed steps whose values could not be
+    extracted are requested again before the first yield.
+
+    Parameters:
+    - g_o: PLAXIS output global object
+    - phase_idx: int
+        Index of the phase in g_o.Phases. The phase is looked up again at every
+        poll.
+    - x, y: float
+        Coordinates of the point.
+    - fields, all_columns, columns:
+        See extract_data.
+    - path: str
+        Checkpoint CSV (see Checkpoint).
+    - block_size: int, optional
+        Number of steps between checkpoints. Default is 50.
+    - report: ExtractionReport or None, optional
+        Retry policy and failure record. Default is None (default policy).
+    - poll_interval: float, optional
+        Seconds between polls. Default is 10.
+    - idle_polls: int or None, optional
+        Stop after this many consecutive polls without new steps. Default is 3.
+        None follows until interrupted.
+    - refresh: callable or None, optional
+        Called before every poll, e.g. to reload the results in PLAXIS Output.
+
+    Yields:
+    - dict
+        Column name -> list of values of the steps added since the previous
+        poll ('phase' is 0). The first yield holds the checkpointed steps.
+    """
+    fields, columns = select_fields(fields, all_columns, columns)
+    handles = resolve_result_types(g_o, dict.fromkeys(field[1] for field in fields))
+    if report is None:
+        report = ExtractionReport()
+
+    with Checkpoint(path, columns, key={'x': float(x), 'y': float(y), 'phase': phase_idx}) as checkpoint:
+        retry_failed_steps(g_o, checkpoint, [g_o.Phases[phase_idx]], x, y, fields, handles, report)
+        if checkpoint.data['phase']:
+            yield {column: list(values) for column, values in checkpoint.data.items()}
+
+        idle = 0
+        while idle_polls is None or idle < idle_polls:
+            if refresh is not None:
+                refresh()
+            new = extract_new_steps(g_o, checkpoint, g_o.Phases[phase_idx], 0, x, y,
+                                    fields, handles, block_size, report)
+            if new['phase']:
+                idle = 0
+                yield new
+            else:
+                idle += 1
+                if idle_polls is None or idle < idle_polls:
+                    time.sleep(poll_interval)
+
+
+def extract_data_PM4Silt_resumable(g_o, phases, x, y, path, columns=None, block_size=50, fingerprint='',
+                                   report=None):
+    return extract_data_resumable(g_o, phases, x, y, PM4SILT_FIELDS, PM4SILT_COLUMNS, path, columns=columns,
+                                  block_size=block_size, fingerprint=fingerprint, report=report)
+
+
+def extract_data_PM4Sand_resumable(g_o, phases, x, y, path, columns=None, block_size=50, fingerprint='',
+                                   report=None):
+    return extract_data_resumable(g_o, phases, x, y, PM4SAND_FIELDS, PM4SAND_COLUMNS, path, columns=columns,
+                                  block_size=block_size, fingerprint=fingerprint, report=report)
+
+
+def follow_data_PM4Silt(g_o, phase_idx, x, y, path, columns=None, **kwargs):
+    return follow_data(g_o, phase_idx, x, y, PM4SILT_FIELDS, PM4SILT_COLUMNS, path, columns=columns, **kwargs)
+
+
+def follow_data_PM4Sand(g_o, phase_idx, x, y, path, columns=None, **kwargs):
+    return follow_data(g_o, phase_idx, x, y, PM4SAND_FIELDS, PM4SAND_COLUMNS, path, columns=columns, **kwargs)
@@ -0,0 +1,21 @@
+def connect_output_servers(endpoints, password=''):
+    """
+    Opens one connection per PLAXIS Output instance.
+
+    Parameters:
+    - endpoints: list of (host, port)
+        Output servers to connect to, e.g. [('localhost', 10001), ('localhost', 10002)].
+    - password: str, optional
+        Password of the remote scripting servers. Default is ''.
+
+    Returns:
+    - list
+        The g_o global object of every connection, in the order of endpoints.
+    """
+    from plxscripting.easy import new_server
+
+    servers = []
+    for host, port in endpoints:
+        s_o, g_o = new_server(host, port, password=password)
+        servers.append(g_o)
+    return servers
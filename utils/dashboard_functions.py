@@ -0,0 +1,150 @@
+import numpy as np
+
+from . import plot_functions
+from .derived_functions import compute_derived, plot_columns
+from .plot_functions import PanelAnimation
+from .plot_settings import LimitIndex, surface_tables
+from .profile_functions import profile
+from .render_functions import stream_frames
+from .tile_functions import TiledAnimation
+
+# The 3x3 dashboard of the PM4Silt plot notebook: (plot function, (row, col), options)
+PM4SILT_DASHBOARD = [
+    ('plot_sxy_vs_gxy', (0, 0), {}),
+    ('plot_sxy_vs_sy', (0, 1), {'xmin': 0}),
+    ('plot_alpha_vs_N', (1, 0), {}),
+    ('plot_q_vs_p', (1, 1), {}),
+    ('plot_e_vs_logp', (2, 0), {'ymin': 0.8, 'ymax': 1, 'xmin': 1, 'xmax': 1000}),
+    ('plot_ryy_vs_rxy', (2, 1), {}),
+    ('plot_ru_vs_gxy', (0, 2), {'ymax': 1.1}),
+    ('particles_plot', (1, 2), {}),
+    ('plot_rxy_vs_N', (2, 2), {}),
+]
+
+# Panels drawing the M, Mb and Md surfaces (see surface_tables)
+SURFACE_PANELS = ('plot_sxy_vs_sy', 'plot_q_vs_p')
+
+
+def resolve_panels(panels):
+    """
+    Returns a dashboard spec as (function, (row, col), options) tuples, with
+    plot functions given by name replaced by the functions of plot_functions.
+    """
+    resolved = []
+    for panel in panels:
+        function, position = panel[:2]
+        options = dict(panel[2]) if len(panel) > 2 else {}
+        if isinstance(function, str):
+            function = getattr(plot_functions, function)
+        resolved.append((function, tuple(position), options))
+    return resolved
+
+
+class Dashboard:
+    """
+    Dashboard of plot panels, declared once and rendered for any frame.
+
+    The spec lists the panels, their positions and their options. When the
+    dashboard is built, everything the panels share is prepared once for the
+    dataset: the derived columns they read (see plot_columns) that data does
+    not have yet, one LimitIndex for the 'auto' axis limits and the surface
+    tables of the panels drawing the M, Mb and Md surfaces. They are passed
+    to every panel (unless its options set them), and the panels are drawn
+    once in a PanelAnimation, or a TiledAnimation if cache is given.
+
+    Parameters:
+    - panels: list
+        (function, (row, col)) or (function, (row, col), options) for every
+        panel. function is a plot_* function or its name, e.g.
+        PM4SILT_DASHBOARD.
+    - data: pandas.DataFrame
+        Extracted time history. Missing derived columns are added to it.
+    - params: pandas.DataFrame
+        Material parameters.
+    - stop_idx: int, optional
+        Frame drawn first. Default is 2.
+    - growing: bool, optional
+        Axes grow with the animation (see LimitIndex): a panel whose limits
+        change is drawn again at that frame (see PanelAnimation). Default is
+        False, which keeps the limits of the whole dataset.
+    - cache: TileCache, str or None, optional
+        Tile cache (or its directory), see TiledAnimation. Default is None.
+    - **kwargs:
+        Passed to PanelAnimation (shape, figsize, dpi, decimate).
+
+    Attributes:
+    - panels: list
+        The resolved spec, with the shared options added.
+    - columns: list
+        Derived columns read by the panels.
+    - limits: LimitIndex
+    - surfaces: dict
+        Surface tables, by the upper x limit of plot_q_vs_p ('auto' or a value).
+    """
+
+    def __init__(self, panels, data, params, stop_idx=2, growing=False, cache=None, **kwargs):
+        spec = resolve_panels(panels)
+        self.columns = plot_columns([function for function, _, _ in spec])
+        missing = [column for column in self.columns if column not in data]
+        if missing:
+            with profile('convert', 'compute_derived'):
+                compute_derived(data, params, columns=missing)
+        self.data = data
+        self.params = params
+        self.limits = LimitIndex(data, growing=growing)
+        self.surfaces = {}
+
+        self.panels = []
+        for function, position, options in spec:
+            options = dict(options)
+            options.setdefault('limits', self.limits)
+            if function.__name__ in SURFACE_PANELS and options.get('show_surfaces', True):
+                options.setdefault('surfaces', self._surfaces(options.get('xmax', 'auto')))
+            self.panels.append((function, position, options))
+
+        if cache is not None:
+            self.animation = TiledAnimation(self.panels, data, params, cache, stop_idx=stop_idx, **kwargs)
+        else:
+            self.animation = PanelAnimation(self.panels, data, params, stop_idx=stop_idx, **kwargs)
+
+    def _surfaces(self, xmax):
+        if xmax not in self.surfaces:
+            pbs = None if xmax == 'auto' else np.linspace(0, xmax, 1000)
+            with profile('render', 'surface_tables'):
+                self.surfaces[xmax] = surface_tables(self.data, self.params, pbs=pbs)
+        return self.surfaces[xmax]
+
+    def render(self, stop_idx):
+        """Draws frame stop_idx and returns it as a (height, width, 4) uint8 array (a view)."""
+        self.animation.update(stop_idx)
+        return self.animation.frame_rgba()
+
+    def render_range(self, indices, path=None, fps=30, encoder=None, progress=None):
+        """
+        Renders the frames of indices and streams them into an encoder.
+
+        Parameters:
+        - indices: iterable of int
+            stop_idx of every frame (e.g. from select_frames).
+        - path, fps, encoder, progress:
+            See encode_animation. With path None (default), the frames are
+            kept in memory.
+
+        Returns:
+        - dict
+            See encode_animation.
+        """
+        return stream_frames(self.animation, indices, path, fps=fps, encoder=encoder, progress=progress)
+
+    def save_frame(self, path):
+        """Saves the current frame as an image."""
+        self.animation.save_frame(path)
+
+    def close(self):
+        self.animation.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,281 @@
+import numpy as np
+
+# Derived column -> columns it is computed from, in computation order
+DERIVED_COLUMNS = {
+    'N': (),
+    'gamxy_cum': ('gamxy',),
+    'p_ast': ('sx', 'sy'),
+    'sxx': ('sx', 'p_ast'),
+    'syy': ('sy', 'p_ast'),
+    'szz': ('sz', 'p_ast'),
+    'rxx': ('sxx', 'p_ast'),
+    'ryy': ('syy', 'p_ast'),
+    'rxy': ('sxy', 'p_ast'),
+    'rzz': ('szz', 'p_ast'),
+    'norms': ('sxx', 'syy', 'sxy'),
+    'q_ast': ('norms',),
+    'sxy_der': ('sxy',),
+    'nxx': ('rxx', 'alphaxx'),
+    'nyy': ('ryy', 'alphayy'),
+    'nxy': ('rxy', 'alphaxy'),
+    'dp': ('p_ast',),
+    'deps_v_el': ('dp', 'K'),
+    'eps_v': ('eps_xx', 'eps_yy'),
+    'deps_v': ('eps_v',),
+    'deps_v_pl': ('deps_v', 'deps_v_el'),
+    'zxx': ('deps_v_pl', 'D', 'zmax', 'nxx', 'nyy', 'nxy'),
+    'zyy': ('deps_v_pl', 'D', 'zmax', 'nxx', 'nyy', 'nxy'),
+    'zxy': ('deps_v_pl', 'D', 'zmax', 'nxx', 'nyy', 'nxy'),
+    'zcum': ('deps_v_pl', 'D', 'zmax', 'nxx', 'nyy', 'nxy'),
+}
+
+# Fabric columns, integrated together by integrate_fabric
+FABRIC_COLUMNS = ('zxx', 'zyy', 'zxy', 'zcum')
+FABRIC_PARAMS = ('cz', 'zmax')
+
+# Plot function -> columns it reads
+PLOT_COLUMNS = {
+    'plot_sxy_vs_gxy': ('gamxy', 'sxy'),
+    'plot_sxy_vs_sy': ('sy', 'sxy', 'p_ast', 'pcs', 'M'),
+    'plot_alpha_vs_N': ('N', 'alphaxx', 'alphayy', 'alphaxy'),
+    'plot_q_vs_p': ('p_ast', 'q_ast', 'pcs', 'M'),
+    'plot_e_vs_logp': ('p_ast', 'e', 'Gamma', 'xi'),
+    'plot_ryy_vs_rxy': ('rxy', 'ryy', 'Mb', 'Md', 'alphaxy', 'alphayy'),
+    'plot_ru_vs_gxy': ('gamxy', 'ru'),
+    'particles_plot': ('zxy', 'sxy'),
+    'plot_rxy_vs_N': ('N', 'rxx', 'ryy', 'rxy'),
+}
+
+
+def required_columns(columns):
+    """
+    Returns the derived columns needed to compute columns (including the
+    derived columns they depend on), in computation order.
+    """
+    needed = set()
+    stack = [column for column in columns if column in DERIVED_COLUMNS]
+    while stack:
+        column = stack.pop()
+        if column not in needed:
+            needed.add(column)
+            stack.extend(c for c in DERIVED_COLUMNS[column] if c in DERIVED_COLUMNS)
+    return [column for column in DERIVED_COLUMNS if column in needed]
+
+
+def plot_columns(plots):
+    """
+    Returns the derived columns read by a set of plot functions.
+
+    Parameters:
+    - plots: list
+        Plot functions of plot_functions, or their names.
+
+    Returns:
+    - list
+        Derived columns, in computation order, to pass to compute_derived.
+    """
+    columns = []
+    for plot in plots:
+        columns.extend(PLOT_COLUMNS[getattr(plot, '__name__', plot)])
+    return required_columns(columns)
+
+
+def param_value(params, name):
+    """Returns a material parameter as a float, from a one-row DataFrame or a dict."""
+    return float(np.asarray(params[name]).ravel()[0])
+
+
+def integrate_fabric(deps_v_pl, D, zmax, nxx, nyy, nxy, cz, zmax_param):
+    """
+    Integrates the fabric tensor (zxx, zyy, zxy) and its cumulative measure
+    zcum over a time history.
+
+    Fabric only changes at steps with plastic contraction, so the rate of
+    every step is computed with NumPy, the recurrence is run over those steps
+    only (with Python floats and the parameters hoisted), and the values are
+    carried forward over the other steps. The result is the same as the step
+    by step loop of the plot notebooks.
+
+    Parameters:
+    - deps_v_pl, D, zmax, nxx, nyy, nxy: numpy.ndarray
+        Plastic volumetric strain increment, dilatancy, maximum fabric and
+        loading direction at every step.
+    - cz: float
+        Fabric growth parameter.
+    - zmax_param: float
+        Maximum fabric parameter, used to degrade the growth with zcum.
+
+    Returns:
+    - tuple of numpy.ndarray: (zxx, zyy, zxy, zcum)
+    """
+    deps_v_pl, D, zmax, nxx, nyy, nxy = (np.asarray(values, dtype=float)
+                                         for values in (deps_v_pl, D, zmax, nxx, nyy, nxy))
+    n = len(deps_v_pl)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = cz * np.maximum(-deps_v_pl, 0) / D
+    # Step i updates the fabric of step i + 1; NaN rates are kept, as in the loop
+    active = np.flatnonzero(rate[:n - 1] != 0)
+
+    rates = rate[active].tolist()
+    targets_xx = (zmax[active] * nxx[active]).tolist()
+    targets_yy = (zmax[active] * nyy[active]).tolist()
+    targets_xy = (zmax[active] * nxy[active]).tolist()
+    limit = 2 * zmax_param
+
+    zxx = zyy = zxy = zcum = 0.0
+    values = np.zeros((4, n))
+    rows = []
+    for k in range(len(rates)):
+        factor = -rates[k] / (1 + max(zcum / limit - 1, 0))
+        dzxx = factor * (targets_xx[k] + zxx)
+        dzyy = factor * (targets_yy[k] + zyy)
+        dzxy = factor * (targets_xy[k] + zxy)
+        zxx += dzxx
+        zyy += dzyy
+        zxy += dzxy
+        zcum += dzxx * dzyy - dzxy ** 2
+        rows.append((zxx, zyy, zxy, zcum))
+
+    # Carry every value forward until the next active step
+    updated = active + 1
+    if rows:
+        values[:, updated] = np.array(rows).T
+    last = np.zeros(n, dtype=np.intp)
+    last[updated] = updated
+    np.maximum.accumulate(last, out=last)
+    zxx, zyy, zxy, zcum = values[:, last]
+    return zxx, zyy, zxy, zcum
+
+
+def _increment(values, out, scale=1.0):
+    """out[i] = scale * (values[i] - values[i-1]), with out[0] = 0."""
+    out[0] = 0
+    np.subtract(values[1:], values[:-1], out=out[1:])
+    if scale != 1.0:
+        out *= scale
+    return out
+
+
+def compute_derived(data, params=None, columns=None, inplace=True, steps_per_cycle=200, m=0.01):
+    """
+    Computes the derived quantities used by the plot functions (p*, deviatoric
+    stresses, stress ratios, q*, loading directions, volumetric increments...)
+    and the cumulative shear strain 'gamxy_cum' in one vectorized pass.
+
+    Each column is computed with NumPy directly into its own output array, so
+    no intermediate pandas Series is created.
+
+    Parameters:
+    - data: pandas.DataFrame, dict or ResultBuffer
+        Extracted time history.
+    - params: pandas.DataFrame, dict or None, optional
+        Material parameters. 'cz' and 'zmax' are needed by the fabric columns
+        (see integrate_fabric).
+    - columns: list or None, optional
+        Derived columns to compute (see DERIVED_COLUMNS and plot_columns).
+        The columns they depend on are computed too. Default is None, which
+        computes every derived column whose inputs are present in data or
+        computed (a derived column already in data is not used as an input:
+        without 'eps_xx' and 'eps_yy', 'eps_v' and the columns computed from
+        it are skipped).
+    - inplace: bool, optional
+        If True (default), the columns are added to data, which is returned.
+        If False, data is left untouched and a dict {column: numpy.ndarray} of
+        the computed columns is returned.
+    - steps_per_cycle: int, optional
+        Number of steps per uniform cycle, used for 'N'. Default is 200.
+    - m: float, optional
+        Yield surface size, used for the loading directions 'nxx', 'nyy' and
+        'nxy'. Default is 0.01.
+
+    Returns:
+    - pandas.DataFrame, dict
+        See inplace.
+    """
+    if columns is None:
+        # A derived input is only used once computed here, never from a column of data with the same
+        # name (an extracted 'eps_v' is not eps_xx + eps_yy)
+        order = []
+        for column, inputs in DERIVED_COLUMNS.items():
+            if all(c in order or (c not in DERIVED_COLUMNS and c in data) for c in inputs):
+                order.append(column)
+        if params is None or any(name not in params for name in FABRIC_PARAMS):
+            order = [column for column in order if column not in FABRIC_COLUMNS]
+    else:
+        unknown = [column for column in columns if column not in DERIVED_COLUMNS]
+        if unknown:
+            raise ValueError('unknown derived columns: %s' % ', '.join(unknown))
+        order = required_columns(columns)
+        missing = sorted({c for column in order for c in DERIVED_COLUMNS[column]
+                          if c not in DERIVED_COLUMNS and c not in data})
+        if missing:
+            raise ValueError('data is missing columns: %s' % ', '.join(missing))
+        if any(column in FABRIC_COLUMNS for column in order) and params is None:
+            raise ValueError('params are needed to compute the fabric columns')
+
+    computed = {}
+
+    def get(column):
+        if column in computed:
+            return computed[column]
+        return np.asarray(data[column], dtype=float)
+
+    n = len(data['phase'])
+    sqrt2 = np.sqrt(2)
+
+    for column in order:
+        if column == 'N':
+            computed[column] = np.linspace(0, n / steps_per_cycle, n)
+            continue
+        if column in FABRIC_COLUMNS:
+            if column not in computed:
+                fabric = integrate_fabric(get('deps_v_pl'), get('D'), get('zmax'), get('nxx'), get('nyy'),
+                                          get('nxy'), param_value(params, 'cz'), param_value(params, 'zmax'))
+                computed.update(zip(FABRIC_COLUMNS, fabric))
+            continue
+
+        out = np.empty(n)
+        if column == 'p_ast':
+            np.add(get('sx'), get('sy'), out=out)
+            out *= 0.5
+        elif column in ('sxx', 'syy', 'szz'):
+            np.subtract(get('s' + column[1]), get('p_ast'), out=out)
+        elif column in ('rxx', 'ryy', 'rzz'):
+            np.divide(get('s' + column[1:]), get('p_ast'), out=out)
+        elif column == 'rxy':
+            np.divide(get('sxy'), get('p_ast'), out=out)
+        elif column == 'norms':
+            sxx, syy, sxy = get('sxx'), get('syy'), get('sxy')
+            np.multiply(sxy, sxy, out=out)
+            out *= 2
+            out += sxx * sxx
+            out += syy * syy
+            np.sqrt(out, out=out)
+        elif column == 'q_ast':
+            np.multiply(get('norms'), sqrt2, out=out)
+        elif column == 'gamxy_cum':
+            _increment(get('gamxy'), out)
+            np.abs(out, out=out)
+            np.cumsum(out, out=out)
+        elif column == 'sxy_der':
+            _increment(get('sxy'), out, -1.0)
+        elif column in ('nxx', 'nyy', 'nxy'):
+            np.subtract(get('r' + column[1:]), get('alpha' + column[1:]), out=out)
+            out *= sqrt2 / m
+        elif column == 'dp':
+            _increment(get('p_ast'), out)
+        elif column == 'deps_v_el':
+            np.divide(get('dp'), get('K'), out=out)
+        elif column == 'eps_v':
+            np.add(get('eps_xx'), get('eps_yy'), out=out)
+        elif column == 'deps_v':
+            _increment(get('eps_v'), out, 1 / 100)
+        elif column == 'deps_v_pl':
+            np.subtract(get('deps_v_el'), get('deps_v'), out=out)
+        computed[column] = out
+
+    if not inplace:
+        return computed
+    for column, values in computed.items():
+        data[column] = values
+    return data
@@ -1,110 +1,654 @@
-def extract_data_PM4Silt(g_o,phases,x,y):
-    data = {'q':[],'p':[],
-            'sx':[],'sy':[],'sz':[],'sxy':[],'ea':[],'eps_v':[],'gamxy':[],'gams':[],
-            'eps_1':[],'eps_2':[],'eps_3':[],'eps_xx':[],'eps_yy':[],'phase':[],'s1':[],'s2':[],'s3':[],
-            'suratio':[],'su':[],'rumax':[],'pmin':[],'zmax':[],'Cs':[],'M':[],'Gamma':[],
-            'pcs':[],'xi':[],'e':[],'Mcurrent':[],'K':[],'G':[],'alphastatic':[],'Kc':[],
-            'K0':[],'sigmav0':[],'ru':[],'ruextreme':[],'gmax/2extreme':[],'BCI':[],
-            'g/2max':[],'Md':[],'Mb':[],'D':[],'alphaxx':[],'alphayy':[],'alphaxy':[],
-            'rulimit':[],'lpr':[],'txyratio':[],'txyratioextreme':[]}
-    phaseid=-1
-    for phase in phases:
-        phaseid +=1
-        for step in phase.Steps:
+import numbers
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from . import profile_functions
+
+# Column order of the dicts returned by the extractors
+PM4SILT_COLUMNS = ['q','p','sx','sy','sz','sxy','ea','eps_v','gamxy','gams',
+                   'eps_1','eps_2','eps_3','eps_xx','eps_yy','phase','s1','s2','s3',
+                   'suratio','su','rumax','pmin','zmax','Cs','M','Gamma',
+                   'pcs','xi','e','Mcurrent','K','G','alphastatic','Kc',
+                   'K0','sigmav0','ru','ruextreme','gmax/2extreme','BCI',
+                   'g/2max','Md','Mb','D','alphaxx','alphayy','alphaxy',
+                   'rulimit','lpr','txyratio','txyratioextreme']
+
+PM4SAND_COLUMNS = ['q','p','sx','sy','sz','sxy','ea','eps_v','gamxy','gams',
+                   'eps_1','eps_2','eps_3','phase','s1','s2','s3',
+                   'sigmav_0','ru','ru_max','alpha_inxx','alpha_inyy','alpha_inxy',
+                   'alpha_xx','alpha_yy','alpha_xy','Md','Mb','xi_r','hp']
+
+# Field tables: (column, result type, scale, sign) for every extracted column.
+# The stored value is result * scale * sign. Integer result types are indices into
+# g_o.ResultTypes.Soil.StateParameters, strings are attribute names of
+# g_o.ResultTypes.Soil.
+STRESS_STRAIN_FIELDS = [
+    ('q', 'DeviatoricStress', 1, 1),
+    ('p', 'MeanEffStress', 1, -1),
+    ('sx', 'SigxxE', 1, -1),
+    ('sy', 'SigyyE', 1, -1),
+    ('sz', 'SigzzE', 1, -1),
+    ('s1', 'SigmaEffective1', 1, -1),
+    ('s2', 'SigmaEffective2', 1, -1),
+    ('s3', 'SigmaEffective3', 1, -1),
+    ('sxy', 'Sigxy', 1, -1),
+    ('ea', 'Eps1', 100, -1),
+    ('eps_v', 'TotalVolumetricStrain', 100, 1),
+    ('eps_1', 'Eps1', 1, -1),
+    ('gamxy', 'PGamxy', 1, -1),
+    ('gams', 'PhaseDeviatoricStrain', 1, -1),
+    ('eps_2', 'Eps2', 1, -1),
+    ('eps_3', 'Eps2', 1, -1),
+    ('eps_xx', 'Epsxx', 1, -1),
+    ('eps_yy', 'Epsyy', 1, -1),
+]
+
+PM4SILT_STATE_PARAMETERS = ['suratio','su','rumax','pmin','zmax','Cs','M','Gamma','pcs','xi','e',
+                            'Mcurrent','K','G','alphastatic','Kc','K0','sigmav0','ru',
+                            'ruextreme','gmax/2extreme','BCI','g/2max','Md','Mb','D',
+                            'alphaxx','alphayy','alphaxy','rulimit','lpr','txyratio','txyratioextreme']
+
+PM4SAND_STATE_PARAMETERS = ['sigmav_0','ru','ru_max','alpha_inxx','alpha_inyy','alpha_inxy',
+                            'alpha_xx','alpha_yy','alpha_xy','Md','Mb','xi_r','hp']
+
+PM4SILT_FIELDS = [(column, idx, 1, 1) for idx, column in enumerate(PM4SILT_STATE_PARAMETERS)] \
+                 + STRESS_STRAIN_FIELDS
+PM4SAND_FIELDS = [(column, idx, 1, 1) for idx, column in enumerate(PM4SAND_STATE_PARAMETERS)] \
+                 + [field for field in STRESS_STRAIN_FIELDS if field[0] in PM4SAND_COLUMNS]
+
+# Material parameter tables: User slot number -> parameter name
+PM4SILT_PARAMS = {1: 'Suratio', 2: 'Su', 3: 'G0', 4: 'hp0', 5: 'patm', 6: 'ng', 7: 'h0',
+                  8: 'e0', 9: 'lambda', 10: 'phicv', 11: 'nbwet', 12: 'nbdry', 13: 'nd',
+                  14: 'Ad0', 15: 'rumax', 16: 'zmax', 17: 'cz', 18: 'Ceps', 19: 'CGD',
+                  20: 'ckaf', 21: 'nu', 23: 'CGconsol', 24: 'FSu', 25: 'psiR', 26: 'dR',
+                  27: 'phic', 28: 'cc'}
+
+PM4SAND_PARAMS = {1: 'Dr0', 2: 'G0', 3: 'hp0', 4: 'patm', 5: 'emax', 6: 'emin', 7: 'nb',
+                  8: 'nd', 9: 'phicv', 10: 'nu', 11: 'Q', 12: 'R'}
+
+# Resolved result type handles, per output server
+_result_type_cache = {}
+
+
+class ExtractionReport:
+    """
+    Retry policy and failure report of an extraction.
+
+    Every request is retried up to retries times with exponential backoff,
+    as long as the retry budget of the whole extraction is not spent. A value
+    that still cannot be fetched is stored as NaN, so all columns keep the same
+    length, and the failure is recorded.
+
+    Parameters:
+    - retries: int, optional
+        Retries per request. Default is 3.
+    - backoff: float, optional
+        Seconds slept before the first retry, doubled on every further retry.
+        Default is 0.1.
+    - max_backoff: float, optional
+        Upper bound of the sleep between retries. Default is 5.
+    - budget: int or None, optional
+        Total number of retries allowed over the extraction. Default is 1000.
+        None means unbounded.
+
+    Attributes:
+    - failures: list of dict
+        One entry per value that was not extracted, with keys 'phase', 'step',
+        'result_type', 'columns' and 'error'.
+    - retried: int
+        Number of retries made so far.
+    """
+
+    def __init__(self, retries=3, backoff=0.1, max_backoff=5.0, budget=1000):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.budget = budget
+        self.failures = []
+        self.retried = 0
+        self._lock = threading.Lock()
+
+    def _take_retry(self):
+        with self._lock:
+            if self.budget is not None and self.retried >= self.budget:
+                return False
+            self.retried += 1
+            return True
+
+    def fetch(self, request, args, phaseid, step, result_type, columns=()):
+        """
+        Returns request(*args), retrying on errors, or None once it failed for good.
+        """
+        delay = self.backoff
+        attempt = 0
+        profiler = profile_functions.active_profiler()
+        while True:
             try:
-                data['suratio'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[0],(x,y)))
-                data['su'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[1],(x,y)))
-                data['rumax'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[2],(x,y)))
-                data['pmin'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[3],(x,y)))
-                data['zmax'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[4],(x,y)))
-                data['Cs'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[5],(x,y)))
-                data['M'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[6],(x,y)))
-                data['Gamma'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[7],(x,y)))
-                data['pcs'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[8],(x,y)))
-                data['xi'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[9],(x,y)))
-                data['e'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[10],(x,y)))
-
-                data['Mcurrent'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[11],(x,y)))
-                data['K'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[12],(x,y)))
-                data['G'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[13],(x,y)))
-                data['alphastatic'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[14],(x,y)))
-                data['Kc'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[15],(x,y)))
-                data['K0'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[16],(x,y)))
-                data['sigmav0'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[17],(x,y)))
-                data['ru'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[18],(x,y)))
-
-                data['ruextreme'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[19],(x,y)))
-                data['gmax/2extreme'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[20],(x,y)))
-                data['BCI'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[21],(x,y)))
-                data['g/2max'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[22],(x,y)))
-                data['Md'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[23],(x,y)))
-                data['Mb'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[24],(x,y)))
-                data['D'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[25],(x,y)))
-
-                data['alphaxx'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[26],(x,y)))
-                data['alphayy'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[27],(x,y)))
-                data['alphaxy'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[28],(x,y)))
-                data['rulimit'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[29],(x,y)))
-                data['lpr'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[30],(x,y)))
-                data['txyratio'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[31],(x,y)))
-                data['txyratioextreme'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.StateParameters[32],(x,y)))
-
-  
-
-                data['q'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.DeviatoricStress,(x,y)))
-                data['p'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.MeanEffStress,(x,y))*-1)
-                data['sx'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.SigxxE,(x,y))*-1)
-                data['sy'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.SigyyE,(x,y))*-1)
-                data['sz'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.SigzzE,(x,y))*-1)
-                data['s1'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.SigmaEffective1,(x,y))*-1)
-                data['s2'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.SigmaEffective2,(x,y))*-1)
-                data['s3'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.SigmaEffective3,(x,y))*-1)
-                data['sxy'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.Sigxy,(x,y))*-1)
-                data['ea'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.Eps1,(x,y))*-100)
-                data['eps_v'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.TotalVolumetricStrain,(x,y))*100)
-                data['eps_1'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.Eps1,(x,y))*-1)
-                data['gamxy'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.PGamxy,(x,y))*-1)
-                data['gams'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.PhaseDeviatoricStrain,(x,y))*-1)
-                data['eps_2'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.Eps2,(x,y))*-1)
-                data['eps_3'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.Eps2,(x,y))*-1)
-                data['eps_xx'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.Epsxx,(x,y))*-1)
-                data['eps_yy'].append(g_o.getsingleresult(step,g_o.ResultTypes.Soil.Epsyy,(x,y))*-1)
-                data['phase'].append(phaseid)
-            except:
-                print('a step was not extracted')
-                continue
+                if profiler is None:
+                    return request(*args)
+                start = time.perf_counter()
+                try:
+                    return request(*args)
+                finally:
+                    name = result_type if isinstance(result_type, str) else 'StateParameters[%s]' % result_type
+                    profiler.record('rpc', '%s(%s)' % (getattr(request, '__name__', 'request'), name),
+                                    start, time.perf_counter(), phase=phaseid, step=step, attempt=attempt,
+                                    columns=list(columns))
+            except Exception as error:
+                if attempt >= self.retries or not self._take_retry():
+                    self.add_failure(phaseid, step, result_type, columns, repr(error))
+                    return None
+                attempt += 1
+                time.sleep(delay)
+                delay = min(2 * delay, self.max_backoff)
+
+    def add_failure(self, phaseid, step, result_type, columns, error):
+        """Records a value that was not extracted."""
+        with self._lock:
+            self.failures.append({'phase': phaseid, 'step': step, 'result_type': result_type,
+                                  'columns': list(columns), 'error': error})
+
+    def failed_steps(self):
+        """Returns the sorted (phase, step) pairs with at least one missing value."""
+        return sorted({(failure['phase'], failure['step']) for failure in self.failures})
+
+    def to_frame(self):
+        """Returns the failures as a pandas.DataFrame."""
+        return pd.DataFrame(self.failures, columns=['phase', 'step', 'result_type', 'columns', 'error'])
+
+    def summary(self):
+        return '%d values in %d steps were not extracted (%d retries)' % (
+            len(self.failures), len(self.failed_steps()), self.retried)
+
+
+def report_failures(report):
+    """Prints the summary of a report created by an extractor, if anything failed."""
+    if report.failures:
+        print(report.summary())
+
+
+def result_columns(fields):
+    """Returns result type -> list of the columns it feeds."""
+    columns = {}
+    for column, result_type, scale, sign in fields:
+        columns.setdefault(result_type, []).append(column)
+    return columns
+
+
+def resolve_result_types(g_o, result_types):
+    """
+    Resolves result types to PLAXIS handles, once per output server.
+
+    Each handle is a chain of remote attribute lookups, so resolved handles are
+    kept for the lifetime of the session and reused by every later extraction.
+
+    Parameters:
+    - g_o: PLAXIS output global object
+    - result_types: iterable of int or str
+        Result types as used in the field tables.
+
+    Returns:
+    - dict
+        Result type -> handle, for the requested result types.
+    """
+    server, handles = _result_type_cache.get(id(g_o), (None, None))
+    if server is not g_o:
+        handles = {}
+        _result_type_cache[id(g_o)] = (g_o, handles)
+
+    missing = [result_type for result_type in result_types if result_type not in handles]
+    if missing:
+        with profile_functions.profile('rpc', 'resolve_result_types'):
+            soil = g_o.ResultTypes.Soil
+            state_parameters = None
+            for result_type in missing:
+                if isinstance(result_type, int):
+                    if state_parameters is None:
+                        state_parameters = soil.StateParameters
+                    handles[result_type] = state_parameters[result_type]
+                else:
+                    handles[result_type] = getattr(soil, result_type)
+
+    return {result_type: handles[result_type] for result_type in result_types}
+
+
+def clear_result_types(g_o=None):
+    """Forgets the resolved handles of g_o, or of every server if g_o is None."""
+    if g_o is None:
+        _result_type_cache.clear()
+    else:
+        _result_type_cache.pop(id(g_o), None)
+
+
+def select_fields(fields, all_columns, columns=None):
+    """
+    Selects the field table entries and output columns for an extraction.
+
+    Parameters:
+    - fields: list
+        Field table.
+    - all_columns: list
+        Column order of the full extraction, including 'phase'.
+    - columns: list or None, optional
+        Columns to extract. Default is None, which extracts every column.
+        'phase' is always included.
+
+    Returns:
+    - tuple: (fields, columns)
+        The selected field entries and the output column order.
+    """
+    if columns is None:
+        return list(fields), list(all_columns)
+
+    unknown = set(columns) - set(all_columns)
+    if unknown:
+        raise ValueError('unknown columns: ' + ', '.join(sorted(unknown)))
+    wanted = set(columns) | {'phase'}
+    return ([field for field in fields if field[0] in wanted],
+            [column for column in all_columns if column in wanted])
+
+
+def extract_data(g_o, phases, x, y, fields, all_columns, columns=None, cache=None, report=None):
+    """
+    Extracts a time history at point (x, y) with one getsingleresult call per
+    distinct result type per step.
+
+    Parameters:
+    - g_o: PLAXIS output global object
+    - phases: list
+        Phases to extract, in order.
+    - x, y: float
+        Coordinates of the point.
+    - fields: list
+        Field table, e.g. PM4SILT_FIELDS.
+    - all_columns: list
+        Column order of the full extraction, e.g. PM4SILT_COLUMNS.
+    - columns: list or None, optional
+        Subset of columns to extract. Default is None (all columns).
+    - cache: ResultCache or None, optional
+        On-disk cache (see cache_functions). Cached results are served without
+        requests to the server, and only missing ones are fetched and stored.
+        A phase cached in full only costs the lookup of its name: result types
+        are resolved and steps listed on the first miss. Default is None (no
+        cache).
+    - report: ExtractionReport or None, optional
+        Retry policy, and record of the values that could not be extracted
+        (stored as NaN). Default is None, which uses the default policy and
+        prints a summary if anything failed.
+
+    Returns:
+    - dict
+        Column name -> list of values, one per step.
+    """
+    fields, columns = select_fields(fields, all_columns, columns)
+    result_types = list(dict.fromkeys(field[1] for field in fields))
+    handles = None
+    own_report = report is None
+    if own_report:
+        report = ExtractionReport()
+
+    data = {column: [] for column in columns}
+    phaseid = -1
+    for phase in phases:
+        phaseid += 1
+        known = None
+        if cache is not None:
+            seen = cache.lookup_phase(phase)
+            if seen is not None:
+                phase_key, nsteps = seen
+                known = cache.load(phase_key, x, y)
+                if all(known.get((istep, str(result_type))) is not None
+                       for istep in range(nsteps) for result_type in result_types):
+                    for istep in range(nsteps):
+                        append_values(data, fields, {result_type: known[(istep, str(result_type))]
+                                                     for result_type in result_types}, phaseid)
+                    continue
+
+        if handles is None:
+            handles = resolve_result_types(g_o, result_types)
+        if cache is None:
+            extract_steps(g_o, phase.Steps, x, y, fields, handles, data, phaseid, report=report)
+        else:
+            steps = list(phase.Steps)
+            phase_key = cache.phase_key(phase, len(steps))
+            if known is None or seen[0] != phase_key:
+                known = cache.load(phase_key, x, y)
+            fetched = []
+            extract_steps(g_o, steps, x, y, fields, handles, data, phaseid,
+                          known=known, fetched=fetched, report=report)
+            cache.store(phase_key, x, y, fetched)
+
+    if own_report:
+        report_failures(report)
+    return data
 
 
+def extract_steps(g_o, steps, x, y, fields, handles, data, phaseid, known=None, fetched=None,
+                  report=None, first_step=0):
+    """
+    Appends the values of the given steps at point (x, y) to data.
+
+    Parameters:
+    - g_o: PLAXIS output global object
+    - steps: list
+        Steps to extract, in order.
+    - x, y: float
+        Coordinates of the point.
+    - fields: list
+        Selected field table entries.
+    - handles: dict
+        Result type -> handle, as returned by resolve_result_types.
+    - data: dict
+        Column name -> list of values, extended in place.
+    - phaseid: int
+        Value stored in the 'phase' column.
+    - known: dict or None, optional
+        Already available values, {(step index, str(result type)): value}.
+        Only the missing ones are requested.
+    - fetched: list or None, optional
+        Receives (step index, result type, value) for every requested value.
+    - report: ExtractionReport or None, optional
+        Retry policy and failure record. Values that fail for good are NaN.
+    - first_step: int, optional
+        Index of steps[0] within its phase. Default is 0.
+    """
+    if report is None:
+        report = ExtractionReport()
+    sources = result_columns(fields)
+
+    for istep, step in enumerate(steps, first_step):
+        values = {}
+        for result_type, handle in handles.items():
+            value = None if known is None else known.get((istep, str(result_type)))
+            if value is None:
+                value = report.fetch(g_o.getsingleresult, (step, handle, (x, y)),
+                                     phaseid, istep, result_type, sources[result_type])
+                if value is None:
+                    value = np.nan
+                elif fetched is not None:
+                    fetched.append((istep, result_type, value))
+            values[result_type] = value
+        append_values(data, fields, values, phaseid)
+
+
+def append_values(data, fields, values, phaseid):
+    """Appends one step to data from {result type: raw value}, scaled as in fields."""
+    for column, result_type, scale, sign in fields:
+        factor = scale * sign
+        data[column].append(values[result_type] if factor == 1 else values[result_type] * factor)
+    data['phase'].append(phaseid)
+
+
+def extract_data_batched(g_o, phases, point, fields, all_columns, columns=None, block_size=None,
+                         report=None):
+    """
+    Extracts the same columns as extract_data, fetching each result type for a
+    whole phase (or a block of steps) in a single request.
+
+    Each distinct result type is requested once per phase through
+    g_o.getcurveresultspath, so a phase costs about 50 round trips instead of
+    about 50 per step.
+
+    Parameters:
+    - g_o: PLAXIS output global object
+    - phases: list
+        Phases to extract, in order.
+    - point: PLAXIS curve point
+        Stress point preselected for curves (e.g. g_o.StressPoints[0]).
+    - fields, all_columns, columns:
+        See extract_data.
+    - block_size: int or None, optional
+        If given, each phase is requested in blocks of at most block_size steps
+        (the path bounds are then steps instead of phases). Default is None,
+        which requests the whole phase at once.
+    - report: ExtractionReport or None, optional
+        See extract_data. The 'step' of a failure is the first step of the
+        failed block. A path whose length differs from the number of steps of
+        its block is also a failure, and its values are NaN.
+
+    Returns:
+    - dict
+        Column name -> list of values, one per step.
+    """
+    fields, columns = select_fields(fields, all_columns, columns)
+    handles = resolve_result_types(g_o, dict.fromkeys(field[1] for field in fields))
+    sources = result_columns(fields)
+    own_report = report is None
+    if own_report:
+        report = ExtractionReport()
+
+    data = {column: [] for column in columns}
+    phaseid = -1
+    for phase in phases:
+        phaseid += 1
+        steps = list(phase.Steps)
+        if block_size is None:
+            bounds = [(0, len(steps), phase, phase)]
+        else:
+            bounds = [(i, min(i + block_size, len(steps)), steps[i], steps[min(i + block_size, len(steps)) - 1])
+                      for i in range(0, len(steps), block_size)]
+
+        for first, stop, start, end in bounds:
+            values = {}
+            for result_type, handle in handles.items():
+                path = report.fetch(g_o.getcurveresultspath, (point, start, end, handle),
+                                    phaseid, first, result_type, sources[result_type])
+                if path is not None:
+                    path = list(path)
+                    if len(path) != stop - first:
+                        # A short or long path cannot be aligned with the steps
+                        report.add_failure(phaseid, first, result_type, sources[result_type],
+                                           'getcurveresultspath returned %d values for %d steps'
+                                           % (len(path), stop - first))
+                        path = None
+                values[result_type] = [np.nan] * (stop - first) if path is None else path
+
+            for column, result_type, scale, sign in fields:
+                factor = scale * sign
+                if factor == 1:
+                    data[column].extend(values[result_type])
+                else:
+                    data[column].extend([value * factor for value in values[result_type]])
+            data['phase'].extend([phaseid] * (stop - first))
+
+    if own_report:
+        report_failures(report)
     return data
 
-def extract_params_PM4Silt(g_i,mat_idx):
-    params = {}
-    params['Suratio'] = g_i.Materials[mat_idx].User1.value
-    params['Su'] = g_i.Materials[mat_idx].User2.value
-    params['G0'] = g_i.Materials[mat_idx].User3.value
-    params['hp0'] = g_i.Materials[mat_idx].User4.value
-    params['patm'] = g_i.Materials[mat_idx].User5.value
-    params['ng'] = g_i.Materials[mat_idx].User6.value
-    params['h0'] = g_i.Materials[mat_idx].User7.value
-    params['e0'] = g_i.Materials[mat_idx].User8.value
-    params['lambda'] = g_i.Materials[mat_idx].User9.value
-    params['phicv'] = g_i.Materials[mat_idx].User10.value
-    params['nbwet'] = g_i.Materials[mat_idx].User11.value
-    params['nbdry'] = g_i.Materials[mat_idx].User12.value
-    params['nd'] = g_i.Materials[mat_idx].User13.value
-    params['Ad0'] = g_i.Materials[mat_idx].User14.value
-    params['rumax'] = g_i.Materials[mat_idx].User15.value
-    params['zmax'] = g_i.Materials[mat_idx].User16.value
-    params['cz'] = g_i.Materials[mat_idx].User17.value
-    params['Ceps'] = g_i.Materials[mat_idx].User18.value
-    params['CGD'] = g_i.Materials[mat_idx].User19.value
-    params['ckaf'] = g_i.Materials[mat_idx].User20.value
-    params['nu'] = g_i.Materials[mat_idx].User21.value
-    params['CGconsol'] = g_i.Materials[mat_idx].User23.value
-    params['FSu'] = g_i.Materials[mat_idx].User24.value
-    params['psiR'] = g_i.Materials[mat_idx].User25.value
-    params['dR'] = g_i.Materials[mat_idx].User26.value
-    params['phic'] = g_i.Materials[mat_idx].User27.value
-    params['cc'] = g_i.Materials[mat_idx].User28.value
+
+def locate_stress_points(g_o, step, points):
+    """
+    Returns the indices of the stress points nearest to each (x, y) point.
+
+    Parameters:
+    - g_o: PLAXIS output global object
+    - step: PLAXIS step
+        Step whose stress point coordinates are used.
+    - points: list of (x, y)
+
+    Returns:
+    - numpy.ndarray of int
+    """
+    handles = resolve_result_types(g_o, ['X', 'Y'])
+    with profile_functions.profile('rpc', 'locate_stress_points'):
+        xs = np.asarray(g_o.getresults(step, handles['X'], 'stresspoint'), dtype=float)
+        ys = np.asarray(g_o.getresults(step, handles['Y'], 'stresspoint'), dtype=float)
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    dist = (xs[None, :] - points[:, :1]) ** 2 + (ys[None, :] - points[:, 1:]) ** 2
+    return np.argmin(dist, axis=1)
+
+
+def extract_data_points(g_o, phases, points, fields, all_columns, columns=None, report=None):
+    """
+    Extracts time histories at several points in a single pass over the steps.
+
+    Every distinct result type is requested once per step for the whole mesh
+    with g_o.getresults(step, result type, 'stresspoint'), and the values of
+    the stress points nearest to the requested points are kept. The cost is
+    therefore independent of the number of points. Values are taken at the
+    nearest stress point, without the interpolation done by getsingleresult.
+
+    Parameters:
+    - g_o: PLAXIS output global object
+    - phases: list
+        Phases to extract, in order.
+    - points: list of (x, y)
+        Coordinates of the points.
+    - fields, all_columns, columns, report:
+        See extract_data.
+
+    Returns:
+    - list of dict
+        One dict per point, with the same layout as extract_data.
+        Use stack_points to get a single long-format table instead.
+    """
+    fields, columns = select_fields(fields, all_columns, columns)
+    handles = resolve_result_types(g_o, dict.fromkeys(field[1] for field in fields))
+    sources = result_columns(fields)
+    own_report = report is None
+    if own_report:
+        report = ExtractionReport()
+    datas = [{column: [] for column in columns} for point in points]
+
+    stress_points = None
+    phaseid = -1
+    for phase in phases:
+        phaseid += 1
+        for istep, step in enumerate(phase.Steps):
+            if stress_points is None:
+                stress_points = locate_stress_points(g_o, step, points)
+            values = {}
+            for result_type, handle in handles.items():
+                mesh_values = report.fetch(g_o.getresults, (step, handle, 'stresspoint'),
+                                           phaseid, istep, result_type, sources[result_type])
+                if mesh_values is None:
+                    values[result_type] = np.full(len(points), np.nan)
+                else:
+                    values[result_type] = np.asarray(mesh_values, dtype=float)[stress_points]
+
+            for column, result_type, scale, sign in fields:
+                factor = scale * sign
+                column_values = (values[result_type] if factor == 1 else values[result_type] * factor).tolist()
+                for data, value in zip(datas, column_values):
+                    data[column].append(value)
+            for data in datas:
+                data['phase'].append(phaseid)
+
+    if own_report:
+        report_failures(report)
+    return datas
+
+
+def stack_points(datas, points):
+    """
+    Stacks the per-point results of extract_data_points into one long-format
+    dict, with 'point', 'x' and 'y' columns identifying each row. The columns
+    are those of the first point, so at least one is needed (ValueError).
+    """
+    if not datas:
+        raise ValueError('no per-point results to stack (datas is empty)')
+    stacked = {'point': [], 'x': [], 'y': []}
+    stacked.update({column: [] for column in datas[0]})
+    for idx, (data, (x, y)) in enumerate(zip(datas, points)):
+        nrows = len(data['phase'])
+        stacked['point'].extend([idx] * nrows)
+        stacked['x'].extend([x] * nrows)
+        stacked['y'].extend([y] * nrows)
+        for column, values in data.items():
+            stacked[column].extend(values)
+    return stacked
+
+
+def extract_data_PM4Silt(g_o, phases, x, y, columns=None, cache=None, report=None):
+    return extract_data(g_o, phases, x, y, PM4SILT_FIELDS, PM4SILT_COLUMNS, columns=columns,
+                        cache=cache, report=report)
+
+
+def extract_data_PM4Silt_batched(g_o, phases, point, columns=None, block_size=None, report=None):
+    return extract_data_batched(g_o, phases, point, PM4SILT_FIELDS, PM4SILT_COLUMNS,
+                                columns=columns, block_size=block_size, report=report)
+
+
+def extract_data_PM4Sand(g_o, phases, x, y, columns=None, cache=None, report=None):
+    return extract_data(g_o, phases, x, y, PM4SAND_FIELDS, PM4SAND_COLUMNS, columns=columns,
+                        cache=cache, report=report)
+
+
+def extract_data_PM4Sand_batched(g_o, phases, point, columns=None, block_size=None, report=None):
+    return extract_data_batched(g_o, phases, point, PM4SAND_FIELDS, PM4SAND_COLUMNS,
+                                columns=columns, block_size=block_size, report=report)
+
+
+def extract_data_PM4Silt_points(g_o, phases, points, columns=None, report=None):
+    return extract_data_points(g_o, phases, points, PM4SILT_FIELDS, PM4SILT_COLUMNS, columns=columns,
+                               report=report)
+
+
+def extract_data_PM4Sand_points(g_o, phases, points, columns=None, report=None):
+    return extract_data_points(g_o, phases, points, PM4SAND_FIELDS, PM4SAND_COLUMNS, columns=columns,
+                               report=report)
+
+
+def extract_params(g_i, mat_idx, table, cache=None):
+    """
+    Reads material parameters from the User* slots of user-defined materials.
+
+    Parameters:
+    - g_i: PLAXIS input global object
+    - mat_idx: int, list of int or None
+        Index of the material in g_i.Materials, a list of indices, or None to
+        read every material in one pass (materials without the slots are skipped).
+    - table: dict
+        User slot number -> parameter name, e.g. PM4SILT_PARAMS.
+    - cache: ResultCache or None, optional
+        On-disk cache (see cache_functions). Default is None (no cache).
+
+    Returns:
+    - dict
+        Parameter name -> value for a single index. For a list of indices or
+        None, parameter name -> list of values, with a 'material' column holding
+        the material indices (one row per material once passed to pd.DataFrame).
+    """
+    # numpy integers too (e.g. from np.arange), as plain ints for the cache
+    if isinstance(mat_idx, numbers.Integral):
+        return read_user_slots(g_i.Materials, int(mat_idx), table, cache)
+
+    params = {'material': []}
+    params.update({name: [] for name in table.values()})
+    materials = list(g_i.Materials)
+    indices = range(len(materials)) if mat_idx is None else [int(idx) for idx in mat_idx]
+    for idx in indices:
+        try:
+            values = read_user_slots(materials, idx, table, cache)
+        except Exception:
+            if mat_idx is None:
+                continue
+            raise
+        params['material'].append(idx)
+        for name, value in values.items():
+            params[name].append(value)
 
     return params
+
+
+def read_user_slots(materials, idx, table, cache=None):
+    """Reads the User* slots of table from materials[idx], through cache if given."""
+    known = {} if cache is None else cache.load_params(idx)
+    if any(slot not in known for slot in table):
+        material = materials[idx]
+        fetched = {slot: getattr(material, 'User%d' % slot).value for slot in table if slot not in known}
+        if cache is not None:
+            cache.store_params(idx, fetched)
+        known.update(fetched)
+    return {name: known[slot] for slot, name in table.items()}
+
+
+def extract_params_PM4Silt(g_i, mat_idx, cache=None):
+    return extract_params(g_i, mat_idx, PM4SILT_PARAMS, cache=cache)
+
+
+def extract_params_PM4Sand(g_i, mat_idx, cache=None):
+    return extract_params(g_i, mat_idx, PM4SAND_PARAMS, cache=cache)
@@ -0,0 +1,275 @@
+"""
+Local stand-ins for the PLAXIS output (g_o) and input (g_i) global objects.
+
+FakeOutput replays an extracted run (e.g. data/PM4Silt/CDSSPm4silt3.csv) through
+the same calls the extractors make on a real output server, and counts every
+round trip so extraction strategies can be compared offline:
+
+    from utils.fake_output import FakeOutput
+    g_o = FakeOutput.from_csv('data/PM4Silt/CDSSPm4silt3.csv')
+    data = extract_data_PM4Silt(g_o, g_o.Phases, 0.1, 0.05)
+    g_o.round_trips
+
+FakeInput does the same for material parameters (e.g. DSSPm4silt_params3.csv).
+"""
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from .extract_functions import PM4SILT_FIELDS, PM4SILT_PARAMS
+
+
+class FakeResultType:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return '<FakeResultType %s>' % self.name
+
+
+class FakeStep:
+    def __init__(self, phase, row):
+        self.phase = phase
+        self.row = row
+
+    def __repr__(self):
+        return '<FakeStep %d of %s>' % (self.row, self.phase.Name)
+
+
+class FakePhase:
+    def __init__(self, output, name, rows):
+        self._output = output
+        self._steps = [FakeStep(self, row) for row in rows]
+        self.Name = name
+
+    @property
+    def Steps(self):
+        calculated = self._output.calculated
+        if calculated is None:
+            return list(self._steps)
+        return [step for step in self._steps if step.row < calculated]
+
+    def __repr__(self):
+        return '<FakePhase %s>' % self.Name
+
+
+class FakeStressPoint:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def __repr__(self):
+        return '<FakeStressPoint (%g, %g)>' % (self.x, self.y)
+
+
+class _FakeStateParameters:
+    def __init__(self, output):
+        self._output = output
+
+    def __getitem__(self, idx):
+        self._output.calls['lookup'] += 1
+        return FakeResultType(idx)
+
+
+class _FakeSoil:
+    def __init__(self, output):
+        self._output = output
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        self._output.calls['lookup'] += 1
+        if name == 'StateParameters':
+            return _FakeStateParameters(self._output)
+        return FakeResultType(name)
+
+
+class _FakeResultTypes:
+    def __init__(self, output):
+        self._output = output
+
+    @property
+    def Soil(self):
+        self._output.calls['lookup'] += 1
+        return _FakeSoil(self._output)
+
+
+class FakeOutput:
+    """
+    Fake PLAXIS output server backed by extracted data.
+
+    Parameters:
+    - data: pandas.DataFrame or list of pandas.DataFrame
+        Extracted data (same columns as extract_data_PM4Silt), one DataFrame per
+        stress point. Raw result values are recovered by dividing each column by
+        its scale and sign in the field table.
+    - points: list of (x, y), optional
+        Coordinates of the stress points, one per DataFrame. Default is
+        (0.1, 0.05), (0.1, 0.10), ...
+    - fields: list, optional
+        Field table mapping columns to result types. Default is PM4SILT_FIELDS.
+    - latency: float, optional
+        Seconds slept on every result request, to mimic a remote server.
+        Default is 0.
+    - fail_rate: float, optional
+        Probability that a result request raises a transient error. Default is 0.
+    - broken: iterable of (row, result type), optional
+        Values whose requests always raise. Default is none.
+    - seed: int, optional
+        Seed of the transient errors. Default is 0.
+
+    Attributes:
+    - Phases: list of FakePhase, built from the 'phase' column.
+    - StressPoints: list of FakeStressPoint, usable as curve points.
+    - calls: collections.Counter of round trips by kind ('lookup' for result
+      type attribute chains, otherwise the name of the called method).
+    - calculated: int or None
+        Number of rows calculated so far, to mimic a running calculation.
+        Steps of later rows are hidden. Default is None (all rows).
+    """
+
+    def __init__(self, data, points=None, fields=PM4SILT_FIELDS, latency=0.0, fail_rate=0.0, broken=(), seed=0):
+        if isinstance(data, (pd.DataFrame, dict)):
+            data = [data]
+        data = [pd.DataFrame(d) for d in data]
+        if points is None:
+            points = [(0.1, 0.05 * (i + 1)) for i in range(len(data))]
+        if len(points) != len(data):
+            raise ValueError('one point is needed per DataFrame')
+
+        self.calls = Counter()
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.broken = set(broken)
+        self._rng = np.random.default_rng(seed)
+        self.calculated = None
+        self.ResultTypes = _FakeResultTypes(self)
+        self.StressPoints = [FakeStressPoint(x, y) for x, y in points]
+
+        # Raw values per point and result type, preferring columns with a unit factor
+        self._raw = []
+        for d in data:
+            raw = {}
+            for column, result_type, scale, sign in sorted(fields, key=lambda f: f[2] != 1):
+                if result_type not in raw and column in d:
+                    raw[result_type] = d[column].to_numpy(dtype=float) / (scale * sign)
+            self._raw.append(raw)
+
+        phase_ids = data[0]['phase'].to_numpy() if 'phase' in data[0] else np.zeros(len(data[0]))
+        self.Phases = []
+        for phaseid in pd.unique(phase_ids):
+            rows = np.flatnonzero(phase_ids == phaseid)
+            self.Phases.append(FakePhase(self, 'Phase_%d' % len(self.Phases), rows.tolist()))
+
+    @classmethod
+    def from_csv(cls, path, **kwargs):
+        """Builds a FakeOutput from a CSV written by the extraction notebook."""
+        return cls(pd.read_csv(path, index_col=0), **kwargs)
+
+    @property
+    def round_trips(self):
+        return sum(self.calls.values())
+
+    def reset(self):
+        self.calls.clear()
+
+    def _request(self, name, row=None, result_type=None):
+        self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if (row, result_type.name if result_type is not None else None) in self.broken:
+            raise RuntimeError('fake server: result not available')
+        if self.fail_rate and self._rng.random() < self.fail_rate:
+            raise RuntimeError('fake server: transient error')
+
+    def _point_index(self, point):
+        if isinstance(point, FakeStressPoint):
+            return self.StressPoints.index(point)
+        x, y = point
+        dist = [(p.x - x) ** 2 + (p.y - y) ** 2 for p in self.StressPoints]
+        return int(np.argmin(dist))
+
+    def _rows(self, start, end):
+        first = start._steps[0] if isinstance(start, FakePhase) else start
+        last = end._steps[-1] if isinstance(end, FakePhase) else end
+        return first.row, last.row + 1
+
+    def getsingleresult(self, step, result_type, point):
+        self._request('getsingleresult', step.row, result_type)
+        return float(self._raw[self._point_index(point)][result_type.name][step.row])
+
+    def getresults(self, step, result_type, location):
+        self._request('getresults', step.row, result_type)
+        if location != 'stresspoint':
+            raise ValueError('only stress point results are available')
+        if result_type.name == 'X':
+            return [p.x for p in self.StressPoints]
+        if result_type.name == 'Y':
+            return [p.y for p in self.StressPoints]
+        return [float(raw[result_type.name][step.row]) for raw in self._raw]
+
+    def getcurveresultspath(self, point, start, end, result_type):
+        self._request('getcurveresultspath')
+        first, last = self._rows(start, end)
+        return self._raw[self._point_index(point)][result_type.name][first:last].tolist()
+
+
+class _FakeValue:
+    def __init__(self, value):
+        self.value = value
+
+
+class _FakeMaterial:
+    def __init__(self, server, values):
+        self._server = server
+        self._values = values
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        self._server.calls['lookup'] += 1
+        if name not in self._values:
+            raise AttributeError(name)
+        return _FakeValue(self._values[name])
+
+
+class FakeInput:
+    """
+    Fake PLAXIS input server exposing user-defined materials.
+
+    Parameters:
+    - params: pandas.DataFrame or list of pandas.DataFrame
+        Material parameters (one row each), as written by the extraction notebook.
+    - table: dict, optional
+        User slot number -> parameter name. Default is PM4SILT_PARAMS.
+
+    Attributes:
+    - Materials: list of fake materials with User* slots.
+    - calls: collections.Counter of round trips.
+    """
+
+    def __init__(self, params, table=PM4SILT_PARAMS):
+        if isinstance(params, (pd.DataFrame, dict)):
+            params = [params]
+        self.calls = Counter()
+        self.Materials = []
+        for p in params:
+            p = pd.DataFrame(p)
+            values = {'User%d' % slot: p[name].values[0].item() for slot, name in table.items() if name in p}
+            self.Materials.append(_FakeMaterial(self, values))
+
+    @classmethod
+    def from_csv(cls, paths, **kwargs):
+        """Builds a FakeInput from one or more parameter CSVs."""
+        if isinstance(paths, str):
+            paths = [paths]
+        return cls([pd.read_csv(path, index_col=0) for path in paths], **kwargs)
+
+    @property
+    def round_trips(self):
+        return sum(self.calls.values())
+
+    def reset(self):
+        self.calls.clear()
@@ -0,0 +1,379 @@
+import base64
+import html
+import json
+import os
+import zlib
+
+import numpy as np
+from matplotlib.colors import to_hex
+
+from . import plot_functions as pf
+from .dashboard_functions import resolve_panels
+from .derived_functions import compute_derived, param_value, plot_columns
+from .profile_functions import profile, record_bytes
+from .plot_settings import LimitIndex, bounding_ratio, calculate_M, calculate_tanphi, dilatancy_ratio, set_limit
+
+# Scenes
+#
+# The HTML player does not receive frames but one scene per panel: axes (limits,
+# labels, log scale), a legend and a list of items drawn in order. Item
+# coordinates are numbers or names of series, arrays with one value per step
+# that the player reads at the current step. 'path' items draw a series up to
+# the current step and mark its last point. The scene_* functions build the
+# scene of a plot_* function and the series it reads, with the same options
+# and limits.
+
+
+class SceneBuilder:
+    """Collects the series of the scenes of a page, stored once each."""
+
+    def __init__(self, data, limits):
+        self.data = data
+        self.limits = limits
+        self.series = {}
+
+    def add(self, name, values):
+        """Registers a series and returns its name (the reference used in scene items)."""
+        if name not in self.series:
+            self.series[name] = np.asarray(values, dtype=float)
+        return name
+
+    def column(self, column, scale=1):
+        name = column if scale == 1 else '%s*%g' % (column, scale)
+        return self.add(name, self.data[column].values * scale)
+
+    def limit(self, axismin, axismax, columns, offset=0.1):
+        return set_limit(axismin, axismax, self.data, columns, offset=offset, limits=self.limits)
+
+
+def _path(x, y, color='k'):
+    return {'kind': 'path', 'x': x, 'y': y, 'color': to_hex(color)}
+
+
+def _line(x0, y0, x1, y1, color, dash=False):
+    return {'kind': 'segment', 'x0': x0, 'y0': y0, 'x1': x1, 'y1': y1, 'color': to_hex(color), 'dash': dash}
+
+
+def _hline(y, color='k'):
+    return {'kind': 'hline', 'y': y, 'color': to_hex(color), 'dash': True}
+
+
+def _legend(*entries):
+    return [{'label': label, 'color': to_hex(color)} for label, color in entries]
+
+
+def _axes(xlabel, ylabel, xlim, ylim, **kwargs):
+    axes = {'xlabel': xlabel, 'ylabel': ylabel, 'xlim': [float(v) for v in xlim],
+            'ylim': [float(v) for v in ylim], 'items': [], 'legend': []}
+    axes.update(kwargs)
+    return axes
+
+
+def scene_sxy_vs_gxy(builder, params, xmin='auto', xmax='auto', ymin='auto', ymax='auto', **kwargs):
+    xmin, xmax = builder.limit(xmin, xmax, ['gamxy'])
+    ymin, ymax = builder.limit(ymin, ymax, ['sxy'])
+    scene = _axes('Shear strain, γxy [%]', 'Shear stress, τxy [kPa]', (xmin * 100, xmax * 100),
+                  (ymin, ymax))
+    scene['items'] = [_hline(0), {'kind': 'vline', 'x': 0, 'color': to_hex('k'), 'dash': True},
+                      _path(builder.column('gamxy', 100), builder.column('sxy'))]
+    return scene
+
+
+def scene_sxy_vs_sy(builder, params, xmin='auto', xmax='auto', ymin='auto', ymax='auto', show_surfaces=True,
+                    **kwargs):
+    data = builder.data
+    xmin, xmax = builder.limit(xmin, xmax, ['sy'])
+    ymin, ymax = builder.limit(ymin, ymax, ['sxy'])
+    scene = _axes('Vertical effective stress, σ\'y [kPa]', 'Shear stress, τxy [kPa]', (xmin, xmax),
+                  (ymin, ymax))
+    scene['items'].append(_hline(0))
+    if show_surfaces:
+        # Sign of the shear stress increment, as in stress_path_surfaces (step 1 compares with the last step)
+        sxy = data['sxy'].values
+        signo = np.where(sxy - np.roll(sxy, 1) >= 0, 1, -1)
+        M, pcs, p_ast = data['M'].values, data['pcs'].values, data['p_ast'].values
+        ratios = {'M': np.full(len(sxy), calculate_M(params)),
+                  'Mb': bounding_ratio(p_ast, M, pcs, param_value(params, 'nbwet'), param_value(params, 'nbdry')),
+                  'Md': dilatancy_ratio(p_ast, M, pcs, param_value(params, 'nd'))}
+        colors = {'M': 'r', 'Mb': 'b', 'Md': 'forestgreen'}
+        for name, ratio in ratios.items():
+            y = builder.add('sxy_vs_sy:%s:%g' % (name, xmax), xmax * calculate_tanphi(ratio) * signo)
+            scene['items'].append(_line(0, 0, float(xmax), y, colors[name]))
+        scene['legend'] = _legend(('M', 'r'), ('Mb', 'b'), ('Md', 'forestgreen'))
+        scene['legend_loc'] = 'lower left'
+    scene['items'].append(_path(builder.column('sy'), builder.column('sxy')))
+    return scene
+
+
+def _time_histories(builder, columns, labels, xmin, xmax, ymin, ymax, ylabel):
+    xmin, xmax = builder.limit(xmin, xmax, ['N'])
+    ymin, ymax = builder.limit(ymin, ymax, [columns[0], columns[2], columns[1]])
+    scene = _axes('Number of uniform cycles, N [-]', ylabel, (xmin, xmax), (ymin, ymax))
+    scene['items'].append(_hline(0))
+    colors = ('b', 'r', 'forestgreen')
+    for column, color in zip(columns, colors):
+        scene['items'].append(_path(builder.column('N'), builder.column(column), color))
+    scene['legend'] = _legend(*zip(labels, colors))
+    scene['legend_loc'] = 'upper left'
+    return scene
+
+
+def scene_alpha_vs_N(builder, params, xmin='auto', xmax='auto', ymin='auto', ymax='auto', **kwargs):
+    return _time_histories(builder, ('alphaxx', 'alphayy', 'alphaxy'), ('αxx', 'αyy', 'αxy'),
+                           xmin, xmax, ymin, ymax, 'Back stress ratio, αii [-]')
+
+
+def scene_rxy_vs_N(builder, params, xmin='auto', xmax='auto', ymin='auto', ymax='auto', **kwargs):
+    return _time_histories(builder, ('rxx', 'ryy', 'rxy'), ('rxx', 'ryy', 'rxy'),
+                           xmin, xmax, ymin, ymax, 'Back stress ratio, rii [-]')
+
+
+def scene_q_vs_p(builder, params, xmin='auto', xmax='auto', ymin='auto', ymax='auto', show_surfaces=True,
+                 **kwargs):
+    xmin, xmax = builder.limit(xmin, xmax, ['p_ast'])
+    ymin, ymax = builder.limit(ymin, ymax, ['q_ast'])
+    scene = _axes('Mid stress, p* = (σx+σy)/2 [kPa]', 'Dev. stress, q* = √2·|σ-pI| [kPa]',
+                  (0, xmax), (0, ymax))
+    if show_surfaces:
+        m = 0.01
+        M = calculate_M(params)
+        ratio = builder.data['q_ast'].values / builder.data['p_ast'].values
+        scene['items'].append(_line(0, 0, float(xmax), float(xmax * M), 'r'))
+        # Mb and Md are evaluated by the player from M and pcs of the step (see bounding_ratio)
+        for fn, color in (('bounding', 'b'), ('dilatancy', 'forestgreen')):
+            scene['items'].append({'kind': 'surface', 'fn': fn, 'M': builder.column('M'), 'pcs': builder.column('pcs'),
+                                   'nbwet': param_value(params, 'nbwet'), 'nbdry': param_value(params, 'nbdry'),
+                                   'nd': param_value(params, 'nd'), 'x1': float(xmax), 'color': to_hex(color)})
+        scene['items'].append(_line(0, 0, 10000, builder.add('10000*q/p', 10000 * ratio), 'gray'))
+        scene['items'].append(_line(0, 0, 10000, builder.add('10000*(q/p-2m)', 10000 * (ratio - 2 * m)), 'gray'))
+        scene['legend'] = _legend(('M', 'r'), ('Mb', 'b'), ('Md', 'forestgreen'), ('Yield surface', 'gray'))
+        scene['legend_loc'] = 'upper left'
+    scene['items'].append(_path(builder.column('p_ast'), builder.column('q_ast')))
+    return scene
+
+
+def scene_e_vs_logp(builder, params, xmin='auto', xmax='auto', ymin='auto', ymax='auto', log_scale=True,
+                    **kwargs):
+    data = builder.data
+    xmin, xmax = builder.limit(xmin, xmax, ['p_ast'])
+    ymin, ymax = builder.limit(ymin, ymax, ['e'])
+    scene = _axes('Mid stress, p* = (σx+σy)/2 [kPa]', 'Void ratio, e [-]', (xmin, xmax), (ymin, ymax),
+                  xlog=bool(log_scale))
+    critical_end = float(data['Gamma'].values[-1] - param_value(params, 'lambda') * np.log(100000))
+    e_cs = builder.add('e-xi', data['e'].values - data['xi'].values)
+    state = _line(builder.column('p_ast'), builder.column('e'), builder.column('p_ast'), e_cs, 'firebrick')
+    # Colors are picked by a 0/1 series, which quantization keeps exact
+    positive = builder.add('xi>0', data['xi'].values > 0)
+    state.update({'color_by': positive, 'colors': [to_hex('firebrick'), to_hex('limegreen')]})
+    scene['items'] = [state, _line(1, builder.column('Gamma'), 100000, critical_end, 'r'),
+                      _path(builder.column('p_ast'), builder.column('e'))]
+    scene['legend'] = _legend(('Critical state', 'r'), ('ξ = {}', 'firebrick'))
+    scene['legend'][1].update({'value': builder.column('xi'), 'digits': 2, 'color_by': positive,
+                               'colors': state['colors']})
+    scene['legend_loc'] = 'lower left'
+    return scene
+
+
+def scene_ryy_vs_rxy(builder, params, xmin='auto', xmax='auto', ymin='auto', ymax='auto', **kwargs):
+    data = builder.data
+    m = 0.01
+    xmin, xmax = builder.limit(xmin, xmax, ['rxy'], offset=0.2)
+    ymin, ymax = builder.limit(ymin, ymax, ['ryy'], offset=0.2)
+    value_max = max(abs(xmin), xmax, abs(ymin), ymax)
+    scene = _axes('Stress ratio, rxy = σxy/p*', 'Stress ratio, ryy = (σyy-p*)/p*',
+                  (-value_max, value_max), (-value_max, value_max), equal=True)
+    scene['items'] = [
+        _path(builder.column('rxy', np.sqrt(2)), builder.column('ryy', np.sqrt(2))),
+        {'kind': 'circle', 'r': builder.add('alphab', np.sqrt(1/2) * (data['Mb'].values - m)), 'cx': 0, 'cy': 0,
+         'color': to_hex('b')},
+        {'kind': 'circle', 'r': builder.add('alphad', np.sqrt(1/2) * (data['Md'].values - m)), 'cx': 0, 'cy': 0,
+         'color': to_hex('forestgreen')},
+        {'kind': 'circle', 'r': m, 'cx': builder.column('alphaxy', 1 / np.sqrt(1/2)),
+         'cy': builder.column('alphayy', 1 / np.sqrt(1/2)), 'color': to_hex('b')},
+    ]
+    return scene
+
+
+def scene_ru_vs_gxy(builder, params, xmin='auto', xmax='auto', ymin='auto', ymax='auto', **kwargs):
+    xmin, xmax = builder.limit(xmin, xmax, ['gamxy'])
+    ymin, ymax = builder.limit(ymin, ymax, ['ru'])
+    value_max = max(abs(ymin), ymax)
+    scene = _axes('Shear strain, γxy [-]', 'ru coefficient, ru [-]', (xmin, xmax), (-value_max, value_max))
+    scene['items'] = [_path(builder.column('gamxy'), builder.column('ru')), _hline(0), _hline(1, 'r')]
+    return scene
+
+
+def scene_particles(builder, params, limit_move='auto', **kwargs):
+    data = builder.data
+    if limit_move == 'auto':
+        limit_move = 10
+    x = 0.5 * np.clip(data['zxy'].values, -limit_move, limit_move) * -1 / limit_move
+    y = 2.95 - 0.2 * ((0.5 - np.abs(x)) / 0.5)
+    sxy_max = builder.limits.range('sxy')[1]
+    color = to_hex('darkgoldenrod')
+    cx = builder.add('particle_x:%g' % limit_move, x)
+    cy = builder.add('particle_y:%g' % limit_move, y)
+    scene = _axes('', '', (-3, 3), (-1, 5), equal=True, axis=False)
+    scene['items'] = [
+        {'kind': 'circle', 'r': 1, 'cx': 1, 'cy': 1, 'color': color, 'fill': True},
+        {'kind': 'circle', 'r': 1, 'cx': -1, 'cy': 1, 'color': color, 'fill': True},
+        {'kind': 'circle', 'r': 1, 'cx': cx, 'cy': cy, 'color': color, 'fill': True},
+        {'kind': 'arrow', 'x': cx, 'y': builder.add('particle_y+2:%g' % limit_move, y + 2), 'dx': 0, 'dy': -0.75,
+         'color': to_hex('r')},
+        {'kind': 'arrow', 'x': cx, 'y': builder.add('particle_y+1.1:%g' % limit_move, y + 1.1),
+         'dx': builder.add('shear_arrow', 0.75 * data['sxy'].values / sxy_max), 'dy': 0,
+         'visible': builder.add('particle_moved:%g' % limit_move, x != 0),
+         'color': to_hex('b')},
+    ]
+    return scene
+
+
+# plot_* function -> scene_* function
+HTML_PANELS = {
+    pf.plot_sxy_vs_gxy: scene_sxy_vs_gxy,
+    pf.plot_sxy_vs_sy: scene_sxy_vs_sy,
+    pf.plot_alpha_vs_N: scene_alpha_vs_N,
+    pf.plot_q_vs_p: scene_q_vs_p,
+    pf.plot_e_vs_logp: scene_e_vs_logp,
+    pf.plot_ryy_vs_rxy: scene_ryy_vs_rxy,
+    pf.plot_ru_vs_gxy: scene_ru_vs_gxy,
+    pf.particles_plot: scene_particles,
+    pf.plot_rxy_vs_N: scene_rxy_vs_N,
+}
+
+
+def encode_series(series, quantize=True, compress=True):
+    """
+    Packs series (name -> 1-D array of the same length) into one base64 string.
+
+    Parameters:
+    - series: dict
+    - quantize: bool, optional
+        If True (default), every series is stored as uint16 over its own
+        min/max range (65535 marks NaN), which is far below a pixel at any
+        panel size. If False, series are stored as float32.
+    - compress: bool, optional
+        Deflate (zlib) the packed bytes. Default is True.
+
+    Returns:
+    - tuple: (blob, layout)
+        blob is the base64 string. layout lists, for every series, its name,
+        byte offset, dtype ('u2' or 'f4') and, when quantized, 'min' and 'scale'.
+    """
+    chunks = []
+    layout = []
+    offset = 0
+    for name, values in series.items():
+        values = np.asarray(values, dtype=float)
+        entry = {'name': name, 'offset': offset}
+        if quantize:
+            finite = values[np.isfinite(values)]
+            vmin = float(finite.min()) if len(finite) else 0.0
+            vmax = float(finite.max()) if len(finite) else 0.0
+            scale = (vmax - vmin) / 65534 or 1.0
+            packed = np.full(len(values), 65535, dtype='<u2')
+            ok = np.isfinite(values)
+            packed[ok] = np.rint((values[ok] - vmin) / scale)
+            entry.update({'dtype': 'u2', 'min': vmin, 'scale': scale})
+        else:
+            packed = values.astype('<f4')
+            entry['dtype'] = 'f4'
+        raw = packed.tobytes()
+        # Keep every series 4-byte aligned for the typed arrays of the player
+        raw += b'\0' * (-len(raw) % 4)
+        chunks.append(raw)
+        layout.append(entry)
+        offset += len(raw)
+    payload = b''.join(chunks)
+    if compress:
+        payload = zlib.compress(payload, 9)
+    return base64.b64encode(payload).decode('ascii'), layout
+
+
+def build_scenes(panels, data, params):
+    """
+    Returns (scenes, series) of a dashboard spec (see Dashboard): the scene of
+    every panel, with its position, and the series the scenes refer to.
+    """
+    spec = resolve_panels(panels)
+    missing = [column for column in plot_columns([function for function, _, _ in spec]) if column not in data]
+    if missing:
+        compute_derived(data, params, columns=missing)
+    builder = SceneBuilder(data, LimitIndex(data))
+    scenes = []
+    for function, (row, col), options in spec:
+        if function not in HTML_PANELS:
+            raise ValueError('%s has no HTML scene' % function.__name__)
+        scene = HTML_PANELS[function](builder, params, **options)
+        scene.update({'row': row, 'col': col})
+        scenes.append(scene)
+    return scenes, builder.series
+
+
+def export_html(panels, data, params, path, indices=None, title='PM4 animation', fps=30, quantize=True,
+                compress=True, panel_size=360):
+    """
+    Writes a self-contained HTML page that animates a dashboard in the browser.
+
+    The series the panels read are written once, packed with encode_series,
+    with one scene per panel (see build_scenes). An embedded player draws the
+    panels as vectors on canvases at the current step, with a step scrubber,
+    play/pause and zoom (mouse wheel, drag to pan, double click to reset).
+    Export time and file size depend on the number of steps, not on the number
+    of frames or the resolution.
+
+    Parameters:
+    - panels: list
+        Dashboard spec, see Dashboard (e.g. PM4SILT_DASHBOARD).
+    - data: pandas.DataFrame
+        Extracted time history. Missing derived columns are added to it.
+    - params: pandas.DataFrame
+        Material parameters.
+    - path: str
+        Output .html file.
+    - indices: iterable of int or None, optional
+        stop_idx of the steps the scrubber and the playback go through (e.g.
+        from select_frames), each between 1 and len(data). Default is None,
+        every step. ValueError is raised for no indices or one out of range.
+    - title: str, optional
+        Page title.
+    - fps: float, optional
+        Playback rate in steps per second. Default is 30.
+    - quantize, compress:
+        See encode_series.
+    - panel_size: int, optional
+        Size of a panel in CSS pixels. Default is 360.
+
+    Returns:
+    - int
+        Size of the file in bytes.
+    """
+    nsteps = len(data)
+    if indices is None:
+        indices = range(1, nsteps + 1)
+    frames = [int(i) for i in indices]
+    if not frames:
+        raise ValueError('no frames to export (indices is empty)')
+    outside = [i for i in frames if not 1 <= i <= nsteps]
+    if outside:
+        raise ValueError('indices must be between 1 and %d (the number of steps), got %s'
+                         % (nsteps, ', '.join(map(str, outside[:5]))))
+
+    with profile('render', 'build_scenes'):
+        scenes, series = build_scenes(panels, data, params)
+    with profile('io', 'encode_series'):
+        blob, layout = encode_series(series, quantize=quantize, compress=compress)
+    spec = {'title': title, 'n': nsteps, 'frames': frames, 'fps': fps,
+            'panel_size': panel_size, 'compressed': compress, 'layout': layout, 'scenes': scenes}
+
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'html_player.html')) as f:
+        template = f.read()
+    # '</' would end the script elements early
+    page = (template.replace('{{title}}', html.escape(title))
+            .replace('{{spec}}', json.dumps(spec).replace('</', '<\\/'))
+            .replace('{{data}}', blob))
+    with profile('io', 'export_html'), open(path, 'w', encoding='utf-8') as f:
+        f.write(page)
+    nbytes = os.path.getsize(path)
+    record_bytes('io', 'export_html', nbytes)
+    return nbytes
@@ -0,0 +1,107 @@
+import math
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+from .extract_functions import (PM4SAND_COLUMNS, PM4SAND_FIELDS, PM4SILT_COLUMNS, PM4SILT_FIELDS,
+                                ExtractionReport, extract_steps, report_failures, resolve_result_types,
+                                select_fields)
+
+
+def split_steps(step_counts, nchunks):
+    """
+    Splits phases into contiguous step ranges of similar size.
+
+    Parameters:
+    - step_counts: list of int
+        Number of steps of every phase.
+    - nchunks: int
+        Approximate number of chunks wanted over all phases.
+
+    Returns:
+    - list of tuple: (phaseid, start, stop)
+        Step ranges in extraction order. Chunks never span two phases.
+    """
+    chunk_size = max(1, math.ceil(sum(step_counts) / max(nchunks, 1)))
+    chunks = []
+    for phaseid, nsteps in enumerate(step_counts):
+        for start in range(0, nsteps, chunk_size):
+            chunks.append((phaseid, start, min(start + chunk_size, nsteps)))
+    return chunks
+
+
+def extract_data_parallel(servers, phase_idx, x, y, fields, all_columns, columns=None,
+                          chunks_per_server=4, report=None):
+    """
+    Extracts a time history at point (x, y) using several output servers at once.
+
+    The steps of the requested phases are split into contiguous chunks that are
+    handed out to a thread pool with one thread per server. Every server is used
+    by one thread at a time. The partial results are merged back in step order,
+    so the result is the same as extract_data on a single server.
+
+    Parameters:
+    - servers: list
+        g_o global objects of output servers that have the same project open
+        (see connect_output_servers).
+    - phase_idx: list of int
+        Indices in g_o.Phases of the phases to extract, in order. Indices are
+        used instead of phase objects because every server has its own proxies.
+    - x, y: float
+        Coordinates of the point.
+    - fields, all_columns, columns, report:
+        See extract_data. The report is shared by all servers.
+    - chunks_per_server: int, optional
+        Number of chunks per server, higher values balance uneven servers
+        better. Default is 4.
+
+    Returns:
+    - dict
+        Column name -> list of values, one per step. The 'phase' column holds
+        the position of the phase in phase_idx.
+    """
+    fields, columns = select_fields(fields, all_columns, columns)
+    result_types = list(dict.fromkeys(field[1] for field in fields))
+    own_report = report is None
+    if own_report:
+        report = ExtractionReport()
+
+    step_counts = [len(servers[0].Phases[idx].Steps) for idx in phase_idx]
+    chunks = split_steps(step_counts, chunks_per_server * len(servers))
+
+    pool = queue.Queue()
+    for g_o in servers:
+        pool.put(g_o)
+
+    def extract_chunk(chunk):
+        phaseid, start, stop = chunk
+        g_o = pool.get()
+        try:
+            handles = resolve_result_types(g_o, result_types)
+            steps = list(g_o.Phases[phase_idx[phaseid]].Steps)[start:stop]
+            part = {column: [] for column in columns}
+            extract_steps(g_o, steps, x, y, fields, handles, part, phaseid, report=report, first_step=start)
+            return part
+        finally:
+            pool.put(g_o)
+
+    with ThreadPoolExecutor(max_workers=len(servers)) as executor:
+        parts = list(executor.map(extract_chunk, chunks))
+
+    data = {column: [] for column in columns}
+    for part in parts:
+        for column in columns:
+            data[column].extend(part[column])
+
+    if own_report:
+        report_failures(report)
+    return data
+
+
+def extract_data_PM4Silt_parallel(servers, phase_idx, x, y, columns=None, chunks_per_server=4, report=None):
+    return extract_data_parallel(servers, phase_idx, x, y, PM4SILT_FIELDS, PM4SILT_COLUMNS,
+                                 columns=columns, chunks_per_server=chunks_per_server, report=report)
+
+
+def extract_data_PM4Sand_parallel(servers, phase_idx, x, y, columns=None, chunks_per_server=4, report=None):
+    return extract_data_parallel(servers, phase_idx, x, y, PM4SAND_FIELDS, PM4SAND_COLUMNS,
+                                 columns=columns, chunks_per_server=chunks_per_server, report=report)
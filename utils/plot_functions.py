@@ -1,8 +1,16 @@
 from .plot_settings import *
+from . import profile_functions
+import os
 import numpy as np
 import matplotlib.patches as patches
 
-def plot_sxy_vs_gxy(ax, data, stop_idx, xmin='auto', xmax='auto', ymin='auto', ymax='auto'):
+def sxy_vs_gxy_limits(data, stop_idx, xmin='auto', xmax='auto', ymin='auto', ymax='auto', limits=None):
+    """Returns the axis limits ((xmin, xmax), (ymin, ymax)) of plot_sxy_vs_gxy at stop_idx."""
+    xmin, xmax = set_limit(xmin, xmax, data,['gamxy'], limits=limits, stop_idx=stop_idx)
+    ymin, ymax = set_limit(ymin, ymax, data,['sxy'], limits=limits, stop_idx=stop_idx)
+    return (xmin * 100, xmax * 100), (ymin, ymax)  # Convert x-axis limits to percentage
+
+def plot_sxy_vs_gxy(ax, data, stop_idx, xmin='auto', xmax='auto', ymin='auto', ymax='auto', limits=None):
     """
     Plots shear stress (τ_xy) versus shear strain (γ_xy) on the provided Matplotlib Axes.
 
@@ -22,6 +30,8 @@ def plot_sxy_vs_gxy(ax, data, stop_idx, xmin='auto', xmax='auto', ymin='auto', y
         Minimum y-axis limit. Default is 'auto', which calculates the limit from the data.
     - ymax: float or 'auto', optional
         Maximum y-axis limit. Default is 'auto', which calculates the limit from the data.
+    - limits: LimitIndex or None, optional
+        Precomputed axis limits of data (see LimitIndex). Default is None.
 
     Returns:
     - None
@@ -40,12 +50,11 @@ def plot_sxy_vs_gxy(ax, data, stop_idx, xmin='auto', xmax='auto', ymin='auto', y
     ax.grid(color='gray', alpha=0.2)
 
     # Calculate axis limits
-    xmin, xmax = set_limit(xmin, xmax, data,['gamxy'])
-    ymin, ymax = set_limit(ymin, ymax, data,['sxy'])
+    xlim, ylim = sxy_vs_gxy_limits(data, stop_idx, xmin, xmax, ymin, ymax, limits=limits)
 
     # Apply calculated or provided limits to the plot
-    ax.set_ylim(ymin, ymax)
-    ax.set_xlim(xmin * 100, xmax * 100)  # Convert x-axis limits to percentage
+    ax.set_ylim(*ylim)
+    ax.set_xlim(*xlim)
 
     # Plot the data up to the stop index
     ax.plot(data['gamxy'].values[:stop_idx] * 100, data['sxy'].values[:stop_idx], color='k')
@@ -53,8 +62,49 @@ def plot_sxy_vs_gxy(ax, data, stop_idx, xmin='auto', xmax='auto', ymin='auto', y
     # Highlight the final point with a scatter plot
     ax.scatter(data['gamxy'].values[stop_idx - 1] * 100, data['sxy'].values[stop_idx - 1], color='k')
 
+def stress_path_surfaces(data, params, stop_idx, surfaces=None):
+    """
+    Returns (signo, M, Mb, Md) drawn by plot_sxy_vs_sy at stop_idx: the sign of
+    the shear stress increment and the stress ratios at the current p*.
+    """
+    deltaxy = data['sxy'].values[stop_idx-1]-data['sxy'].values[stop_idx-2]
+    if deltaxy>=0:
+        signo = 1
+    else:
+        signo = -1
+
+    if surfaces is None:
+        M = calculate_M(params)
+        pbs = [data['p_ast'].values[stop_idx-1]]
+        Mb = calculate_Mb(pbs,params,data,stop_idx)[0]
+        Md = calculate_Md(pbs,params,data,stop_idx)[0]
+    else:
+        M = surfaces['M']
+        Mb = surfaces['Mb_p'][stop_idx-1]
+        Md = surfaces['Md_p'][stop_idx-1]
+    return signo, M, Mb, Md
+
+def q_p_surfaces(data, params, stop_idx, xmax, surfaces=None, n=10000):
+    """Returns (pbs, M, Mb, Md), the surfaces drawn by plot_q_vs_p at stop_idx (n points)."""
+    if surfaces is None:
+        pbs = np.linspace(0,xmax,n)
+        M = calculate_M(params)
+        Mb = calculate_Mb(pbs,params,data,stop_idx)
+        Md = calculate_Md(pbs,params,data,stop_idx)
+    else:
+        pbs = surfaces['pbs']
+        M = surfaces['M']
+        Mb = surfaces['Mb'][stop_idx-1]
+        Md = surfaces['Md'][stop_idx-1]
+    return pbs, M, Mb, Md
+
+def sxy_vs_sy_limits(data, stop_idx, xmin='auto', xmax='auto', ymin='auto', ymax='auto', limits=None):
+    """Returns the axis limits ((xmin, xmax), (ymin, ymax)) of plot_sxy_vs_sy at stop_idx."""
+    return (set_limit(xmin, xmax, data,['sy'], limits=limits, stop_idx=stop_idx),
+            set_limit(ymin, ymax, data,['sxy'], limits=limits, stop_idx=stop_idx))
+
 def plot_sxy_vs_sy(ax, data,params, stop_idx, xmin='auto', xmax='auto', ymin='auto', ymax='auto',
-                   show_surfaces=True):
+                   show_surfaces=True, surfaces=None, limits=None):
     """
     Plots shear stress (τ_xy) versus vertical effective stress (σ'_y) on the provided Matplotlib Axes.
 
@@ -74,6 +124,10 @@ def plot_sxy_vs_sy(ax, data,params, stop_idx, xmin='auto', xmax='auto', ymin='au
         Minimum y-axis limit. If 'auto', it is calculated based on the data in the 'sxy' column.
     - ymax: float or 'auto', optional
         Maximum y-axis limit. If 'auto', it is calculated based on the data in the 'sxy' column.
+    - surfaces: dict or None, optional
+        Precomputed surfaces from surface_tables. If None, Mb and Md are calculated for the frame.
+    - limits: LimitIndex or None, optional
+        Precomputed axis limits of data (see LimitIndex). Default is None.
 
     Returns:
     - None
@@ -91,8 +145,7 @@ def plot_sxy_vs_sy(ax, data,params, stop_idx, xmin='auto', xmax='auto', ymin='au
     ax.grid(color='gray', alpha=0.2)
 
     # Calculate axis limits using the helper function set_limit
-    xmin, xmax = set_limit(xmin, xmax, data,['sy'])
-    ymin, ymax = set_limit(ymin, ymax, data,['sxy'])
+    (xmin, xmax), (ymin, ymax) = sxy_vs_sy_limits(data, stop_idx, xmin, xmax, ymin, ymax, limits=limits)
 
     
     # Apply axis limits
@@ -101,23 +154,15 @@ def plot_sxy_vs_sy(ax, data,params, stop_idx, xmin='auto', xmax='auto', ymin='au
 
     if show_surfaces==True:
 
-        deltaxy = data['sxy'].values[stop_idx-1]-data['sxy'].values[stop_idx-2]
-        if deltaxy>=0:
-            signo = 1
-        else:
-            signo = -1
+        signo, M, Mb, Md = stress_path_surfaces(data, params, stop_idx, surfaces)
 
-        M = calculate_M(params)
         tanphi_M = calculate_tanphi(M)
         ax.plot([0,xmax],[0,xmax*tanphi_M*signo],color='r',label='$M$')
-        pbs = [data['p_ast'].values[stop_idx-1]]
 
-        Mb = calculate_Mb(pbs,params,data,stop_idx)
-        tanphi_Mb = calculate_tanphi(Mb[0])
+        tanphi_Mb = calculate_tanphi(Mb)
         ax.plot([0,xmax],[0,xmax*tanphi_Mb*signo],color='b',label='$M_{b}$')
         
-        Md = calculate_Md(pbs,params,data,stop_idx)
-        tanphi_Md = calculate_tanphi(Md[0])
+        tanphi_Md = calculate_tanphi(Md)
         ax.plot([0,xmax],[0,xmax*tanphi_Md*signo],color='forestgreen',label='$M_{d}$')
         ax.legend(loc='lower left',ncol=3)
         
@@ -129,7 +174,12 @@ def plot_sxy_vs_sy(ax, data,params, stop_idx, xmin='auto', xmax='auto', ymin='au
     ax.scatter(data['sy'].values[stop_idx - 1], data['sxy'].values[stop_idx - 1], color='k')
     
 
-def plot_alpha_vs_N(ax, data, stop_idx, xmin='auto', xmax='auto', ymin='auto', ymax='auto'):
+def alpha_vs_N_limits(data, stop_idx, xmin='auto', xmax='auto', ymin='auto', ymax='auto', limits=None):
+    """Returns the axis limits ((xmin, xmax), (ymin, ymax)) of plot_alpha_vs_N at stop_idx."""
+    return (set_limit(xmin, xmax, data, ['N'], limits=limits, stop_idx=stop_idx),
+            set_limit(ymin, ymax, data, ['alphaxx', 'alphaxy', 'alphayy'], limits=limits, stop_idx=stop_idx))
+
+def plot_alpha_vs_N(ax, data, stop_idx, xmin='auto', xmax='auto', ymin='auto', ymax='auto', limits=None):
     """
     Plots back stress ratio (\u03b1) versus the number of uniform cycles (N) on the provided Matplotlib Axes.
 
@@ -149,6 +199,8 @@ def plot_alpha_vs_N(ax, data, stop_idx, xmin='auto', xmax='auto', ymin='auto', y
         Minimum y-axis limit. If 'auto', it is calculated based on the data in the columns 'alphaxx', 'alphayy', and 'alphaxy'.
     - ymax: float or 'auto', optional
         Maximum y-axis limit. If 'auto', it is calculated based on the data in the columns 'alphaxx', 'alphayy', and 'alphaxy'.
+    - limits: LimitIndex or None, optional
+        Precomputed axis limits of data (see LimitIndex). Default is None.
 
     Returns:
     - None
@@ -165,9 +217,8 @@ def plot_alpha_vs_N(ax, data, stop_idx, xmin='auto', xmax='auto', ymin='auto', y
     # Add grid lines for better visualization
     ax.grid(color='gray', alpha=0.2)
 
-    # Helper function to calculate axis limits
-    xmin, xmax = set_limit(xmin, xmax, data, ['N'])  # Set x-axis limits based on the 'N' column
-    ymin, ymax = set_limit(ymin, ymax, data, ['alphaxx', 'alphaxy', 'alphayy'])  # Set y-axis limits based on the back stress ratio columns
+    # Helper function to calculate axis limits ('N' column, back stress ratio columns)
+    (xmin, xmax), (ymin, ymax) = alpha_vs_N_limits(data, stop_idx, xmin, xmax, ymin, ymax, limits=limits)
 
     # Apply the calculated axis limits
     ax.set_xlim(xmin, xmax)
@@ -210,8 +261,14 @@ def plot_alpha_vs_N(ax, data, stop_idx, xmin='auto', xmax='auto', ymin='auto', y
     
 
 
+def q_vs_p_limits(data, stop_idx, xmin='auto', xmax='auto', ymin='auto', ymax='auto', limits=None):
+    """Returns the axis limits ((xmin, xmax), (ymin, ymax)) of plot_q_vs_p at stop_idx."""
+    xmin, xmax = set_limit(xmin, xmax, data, ['p_ast'], limits=limits, stop_idx=stop_idx)
+    ymin, ymax = set_limit(ymin, ymax, data, ['q_ast'], limits=limits, stop_idx=stop_idx)
+    return (0, xmax), (0, ymax)
+
 def plot_q_vs_p(ax, data, params, stop_idx, xmin='auto', xmax='auto', ymin='auto', ymax='auto',
-                show_surfaces=True):
+                show_surfaces=True, surfaces=None, limits=None):
     """
     Plots back stress ratio (\u03b1) versus the number of uniform cycles (N) on the provided Matplotlib Axes.
 
@@ -231,6 +288,10 @@ def plot_q_vs_p(ax, data, params, stop_idx, xmin='auto', xmax='auto', ymin='auto
         Minimum y-axis limit. If 'auto', it is calculated based on the data in the columns 'alphaxx', 'alphayy', and 'alphaxy'.
     - ymax: float or 'auto', optional
         Maximum y-axis limit. If 'auto', it is calculated based on the data in the columns 'alphaxx', 'alphayy', and 'alphaxy'.
+    - surfaces: dict or None, optional
+        Precomputed surfaces from surface_tables. If None, the surfaces are calculated for the frame.
+    - limits: LimitIndex or None, optional
+        Precomputed axis limits of data (see LimitIndex). Default is None.
 
     Returns:
     - None
@@ -245,12 +306,8 @@ def plot_q_vs_p(ax, data, params, stop_idx, xmin='auto', xmax='auto', ymin='auto
     # Add grid lines for better visualization
     ax.grid(color='gray', alpha=0.2)
 
-    # Helper function to calculate axis limits
-    xmin, xmax = set_limit(xmin, xmax, data, ['p_ast'])  # Set x-axis limits based on the 'N' column
-    ymin, ymax = set_limit(ymin, ymax, data, ['q_ast'])  # Set y-axis limits based on the back stress ratio columns
-
-    xmin = 0
-    ymin = 0
+    # Helper function to calculate axis limits ('p_ast' and 'q_ast' columns, from 0)
+    (xmin, xmax), (ymin, ymax) = q_vs_p_limits(data, stop_idx, xmin, xmax, ymin, ymax, limits=limits)
 
     # Apply the calculated axis limits
     ax.set_xlim(xmin, xmax)
@@ -258,15 +315,10 @@ def plot_q_vs_p(ax, data, params, stop_idx, xmin='auto', xmax='auto', ymin='auto
 
 
     if show_surfaces==True:
-        pbs = np.linspace(0,xmax,10000)
+        pbs, M, Mb, Md = q_p_surfaces(data, params, stop_idx, xmax, surfaces)
 
-        M = calculate_M(params)
         ax.plot([0,xmax],[0,xmax*M],color='r',label='$M$')
-
-        Mb = calculate_Mb(pbs,params,data,stop_idx)
         ax.plot(pbs,pbs*Mb,color='b',label='$M_{b}$')
-
-        Md = calculate_Md(pbs,params,data,stop_idx)
         ax.plot(pbs,pbs*Md,color='forestgreen',label='$M_{d}$')
 
 
@@ -283,7 +335,12 @@ def plot_q_vs_p(ax, data, params, stop_idx, xmin='auto', xmax='auto', ymin='auto
 
 
 
-def plot_e_vs_logp(ax, data, params, stop_idx, xmin='auto', xmax='auto', ymin='auto', ymax='auto', log_scale=True):
+def e_vs_logp_limits(data, stop_idx, xmin='auto', xmax='auto', ymin='auto', ymax='auto', limits=None):
+    """Returns the axis limits ((xmin, xmax), (ymin, ymax)) of plot_e_vs_logp at stop_idx."""
+    return (set_limit(xmin, xmax, data, ['p_ast'], limits=limits, stop_idx=stop_idx),
+            set_limit(ymin, ymax, data, ['e'], limits=limits, stop_idx=stop_idx))
+
+def plot_e_vs_logp(ax, data, params, stop_idx, xmin='auto', xmax='auto', ymin='auto', ymax='auto', log_scale=True, limits=None):
     """
     Plots the void ratio (e) versus the logarithm of mean effective stress (p*) on the provided Matplotlib Axes.
 
@@ -307,6 +364,8 @@ def plot_e_vs_logp(ax, data, params, stop_idx, xmin='auto', xmax='auto', ymin='a
         Maximum y-axis limit. If 'auto', it is calculated based on the data in the 'e' column.
     - log_scale: bool, optional
         Whether to use a logarithmic scale for the x-axis. Default is True.
+    - limits: LimitIndex or None, optional
+        Precomputed axis limits of data (see LimitIndex). Default is None.
 
     Returns:
     - None
@@ -320,9 +379,8 @@ def plot_e_vs_logp(ax, data, params, stop_idx, xmin='auto', xmax='auto', ymin='a
     # Add grid lines for better visualization
     ax.grid(color='gray', alpha=0.2)
 
-    # Helper function to calculate axis limits
-    xmin, xmax = set_limit(xmin, xmax, data, ['p_ast'])  # Set x-axis limits based on the 'p_ast' column
-    ymin, ymax = set_limit(ymin, ymax, data, ['e'])  # Set y-axis limits based on the 'e' column
+    # Helper function to calculate axis limits ('p_ast' and 'e' columns)
+    (xmin, xmax), (ymin, ymax) = e_vs_logp_limits(data, stop_idx, xmin, xmax, ymin, ymax, limits=limits)
 
     # Apply the calculated axis limits
     ax.set_xlim(xmin, xmax)
@@ -356,7 +414,20 @@ def plot_e_vs_logp(ax, data, params, stop_idx, xmin='auto', xmax='auto', ymin='a
     # Add legend
     ax.legend(loc='lower left')
 
-def plot_ryy_vs_rxy(ax, data, params, stop_idx, xmin='auto', xmax='auto', ymin='auto', ymax='auto'):
+def ryy_vs_rxy_limits(data, stop_idx, xmin='auto', xmax='auto', ymin='auto', ymax='auto', limits=None):
+    """
+    Returns the axis limits ((xmin, xmax), (ymin, ymax)) of plot_ryy_vs_rxy at
+    stop_idx, before equal scaling widens one of them.
+    """
+    xmin, xmax = set_limit(xmin, xmax, data, ['rxy'], offset=0.2, limits=limits, stop_idx=stop_idx)
+    ymin, ymax = set_limit(ymin, ymax, data, ['ryy'], offset=0.2, limits=limits, stop_idx=stop_idx)
+
+    xmax = max(abs(xmin), xmax)
+    ymax = max(abs(ymin), ymax)
+    value_max = max(xmax, ymax)
+    return (-value_max, value_max), (-value_max, value_max)
+
+def plot_ryy_vs_rxy(ax, data, params, stop_idx, xmin='auto', xmax='auto', ymin='auto', ymax='auto', limits=None):
     """
     Plots the stress ratio r_yy versus r_xy on the provided Matplotlib Axes.
 
@@ -378,6 +449,8 @@ def plot_ryy_vs_rxy(ax, data, params, stop_idx, xmin='auto', xmax='auto', ymin='
         Minimum y-axis limit. If 'auto', it is calculated based on the data in the 'ryy' column.
     - ymax: float or 'auto', optional
         Maximum y-axis limit. If 'auto', it is calculated based on the data in the 'ryy' column.
+    - limits: LimitIndex or None, optional
+        Precomputed axis limits of data (see LimitIndex). Default is None.
 
     Returns:
     - None
@@ -404,17 +477,12 @@ def plot_ryy_vs_rxy(ax, data, params, stop_idx, xmin='auto', xmax='auto', ymin='
     # Add grid lines for better visualization
     ax.grid(color='gray', alpha=0.2)
 
-    # Helper function to calculate axis limits
-    xmin, xmax = set_limit(xmin, xmax, data, ['rxy'], offset=0.2)  # Set x-axis limits based on the 'rxy' column
-    ymin, ymax = set_limit(ymin, ymax, data, ['ryy'], offset=0.2)  # Set y-axis limits based on the 'ryy' column
-
-    xmax = max(abs(xmin), xmax)
-    ymax = max(abs(ymin), ymax)
-    value_max = max(xmax, ymax)
+    # Helper function to calculate axis limits ('rxy' and 'ryy' columns, symmetric)
+    xlim, ylim = ryy_vs_rxy_limits(data, stop_idx, xmin, xmax, ymin, ymax, limits=limits)
 
     # Apply the calculated axis limits
-    ax.set_xlim(-value_max, value_max)
-    ax.set_ylim(-value_max, value_max)
+    ax.set_xlim(*xlim)
+    ax.set_ylim(*ylim)
 
     # Plot stress ratio trajectory
     ax.plot(data['rxy'].values[:stop_idx] * np.sqrt(2),
@@ -452,7 +520,15 @@ def plot_ryy_vs_rxy(ax, data, params, stop_idx, xmin='auto', xmax='auto', ymin='
     ax.legend(loc='best')
 
 
-def plot_ru_vs_gxy(ax, data, params, stop_idx, xmin='auto', xmax='auto', ymin='auto', ymax='auto'):
+def ru_vs_gxy_limits(data, stop_idx, xmin='auto', xmax='auto', ymin='auto', ymax='auto', limits=None):
+    """Returns the axis limits ((xmin, xmax), (ymin, ymax)) of plot_ru_vs_gxy at stop_idx."""
+    xlim = set_limit(xmin, xmax, data, ['gamxy'], limits=limits, stop_idx=stop_idx)
+    ymin, ymax = set_limit(ymin, ymax, data, ['ru'], limits=limits, stop_idx=stop_idx)
+
+    value_max = max(abs(ymin), ymax)
+    return xlim, (-value_max, value_max)
+
+def plot_ru_vs_gxy(ax, data, params, stop_idx, xmin='auto', xmax='auto', ymin='auto', ymax='auto', limits=None):
     """
     Plots the pore pressure ratio (ru) versus shear strain (\u03b3_xy) on the provided Matplotlib Axes.
 
@@ -474,6 +550,8 @@ def plot_ru_vs_gxy(ax, data, params, stop_idx, xmin='auto', xmax='auto', ymin='a
         Minimum y-axis limit. If 'auto', it is calculated based on the data in the 'ru' column.
     - ymax: float or 'auto', optional
         Maximum y-axis limit. If 'auto', it is calculated based on the data in the 'ru' column.
+    - limits: LimitIndex or None, optional
+        Precomputed axis limits of data (see LimitIndex). Default is None.
 
     Returns:
     - None
@@ -499,15 +577,12 @@ def plot_ru_vs_gxy(ax, data, params, stop_idx, xmin='auto', xmax='auto', ymin='a
     # Add grid lines for better visualization
     ax.grid(color='gray', alpha=0.2)
 
-    # Helper function to calculate axis limits
-    xmin, xmax = set_limit(xmin, xmax, data, ['gamxy'])  # Set x-axis limits based on the 'gamxy' column
-    ymin, ymax = set_limit(ymin, ymax, data, ['ru'])  # Set y-axis limits based on the 'ru' column
-
-    value_max = max(abs(ymin), ymax)
+    # Helper function to calculate axis limits ('gamxy' and 'ru' columns, ru symmetric)
+    xlim, ylim = ru_vs_gxy_limits(data, stop_idx, xmin, xmax, ymin, ymax, limits=limits)
 
     # Apply the calculated axis limits
-    ax.set_xlim(xmin, xmax)
-    ax.set_ylim(-value_max, value_max)
+    ax.set_xlim(*xlim)
+    ax.set_ylim(*ylim)
 
     # Plot ru versus gamxy trajectory
     ax.plot(data['gamxy'].values[:stop_idx], data['ru'].values[:stop_idx], color='k')
@@ -519,7 +594,7 @@ def plot_ru_vs_gxy(ax, data, params, stop_idx, xmin='auto', xmax='auto', ymin='a
     ax.axhline(0, color='k', linestyle='dotted')
     ax.axhline(1, color='r', linestyle='dotted')
 
-def particles_plot(ax, data, params, stop_idx, limit_move='auto'):
+def particles_plot(ax, data, params, stop_idx, limit_move='auto', limits=None):
     """
     Plots a visualization of particle movement and force interactions on the provided Matplotlib Axes.
 
@@ -535,6 +610,8 @@ def particles_plot(ax, data, params, stop_idx, limit_move='auto'):
         The index in the data up to which the plot should be drawn.
     - limit_move: float or 'auto', optional
         The maximum movement limit for the visualization. If 'auto', it defaults to 10.
+    - limits: LimitIndex or None, optional
+        Precomputed axis limits of data (see LimitIndex). Default is None.
 
     Returns:
     - None
@@ -586,15 +663,24 @@ def particles_plot(ax, data, params, stop_idx, limit_move='auto'):
     ax.add_patch(circulo)
 
     # Add force/displacement arrows
+    if limits is not None:
+        sxy_max = limits.range('sxy')[1]
+    else:
+        sxy_max = data['sxy'].max()
     ax.arrow(x, y + 2, 0, -0.75, color='r', head_width=0.1)
     if x != 0:
-        ax.arrow(x, y + 1.1, 0.75 / 0.5 * 0.5 * data['sxy'].values[stop_idx - 1] / data['sxy'].max(), 0, color='b', head_width=0.1)
+        ax.arrow(x, y + 1.1, 0.75 / 0.5 * 0.5 * data['sxy'].values[stop_idx - 1] / sxy_max, 0, color='b', head_width=0.1)
 
     # Turn off the axis
     ax.axis('equal')
     ax.set_axis_off()
 
-def plot_rxy_vs_N(ax, data,params, stop_idx, xmin='auto', xmax='auto', ymin='auto', ymax='auto'):
+def rxy_vs_N_limits(data, stop_idx, xmin='auto', xmax='auto', ymin='auto', ymax='auto', limits=None):
+    """Returns the axis limits ((xmin, xmax), (ymin, ymax)) of plot_rxy_vs_N at stop_idx."""
+    return (set_limit(xmin, xmax, data, ['N'], limits=limits, stop_idx=stop_idx),
+            set_limit(ymin, ymax, data, ['rxx', 'rxy', 'ryy'], limits=limits, stop_idx=stop_idx))
+
+def plot_rxy_vs_N(ax, data,params, stop_idx, xmin='auto', xmax='auto', ymin='auto', ymax='auto', limits=None):
     """
     Plots back stress ratio (\u03b1) versus the number of uniform cycles (N) on the provided Matplotlib Axes.
 
@@ -614,6 +700,8 @@ def plot_rxy_vs_N(ax, data,params, stop_idx, xmin='auto', xmax='auto', ymin='aut
         Minimum y-axis limit. If 'auto', it is calculated based on the data in the columns 'alphaxx', 'alphayy', and 'alphaxy'.
     - ymax: float or 'auto', optional
         Maximum y-axis limit. If 'auto', it is calculated based on the data in the columns 'alphaxx', 'alphayy', and 'alphaxy'.
+    - limits: LimitIndex or None, optional
+        Precomputed axis limits of data (see LimitIndex). Default is None.
 
     Returns:
     - None
@@ -630,9 +718,8 @@ def plot_rxy_vs_N(ax, data,params, stop_idx, xmin='auto', xmax='auto', ymin='aut
     # Add grid lines for better visualization
     ax.grid(color='gray', alpha=0.2)
 
-    # Helper function to calculate axis limits
-    xmin, xmax = set_limit(xmin, xmax, data, ['N'])  # Set x-axis limits based on the 'N' column
-    ymin, ymax = set_limit(ymin, ymax, data, ['rxx', 'rxy', 'ryy'])  # Set y-axis limits based on the back stress ratio columns
+    # Helper function to calculate axis limits ('N' column, stress ratio columns)
+    (xmin, xmax), (ymin, ymax) = rxy_vs_N_limits(data, stop_idx, xmin, xmax, ymin, ymax, limits=limits)
 
     # Apply the calculated axis limits
     ax.set_xlim(xmin, xmax)
@@ -671,3 +758,505 @@ def plot_rxy_vs_N(ax, data,params, stop_idx, xmin='auto', xmax='auto', ymin='aut
 
     # Add the legend to the plot
     ax.legend(loc='upper left', ncol=3)
+
+
+# Animation
+#
+# The animate_* functions draw a panel once with the matching plot_* function
+# and return an update callback. update(stop_idx) moves the artists that change
+# between frames (trajectories, current points, surfaces) with set_data and
+# set_offsets, and returns them. PanelAnimation blits those artists over the
+# static background (axes, labels, grid, reference lines) of every frame.
+#
+# With decimate=True, trajectories only keep the points that land on another
+# pixel (see decimate) and circles and surfaces get about one vertex per pixel,
+# so the cost of a frame depends on the size of the axes, not on the run.
+#
+# With a growing LimitIndex, update.relimit(stop_idx) (see _growing) sets the
+# axis limits of the panel at stop_idx and tells PanelAnimation whether the
+# background of the panel has to be drawn again.
+
+def _trajectory(line, point, x, y, ax=None):
+    """
+    Returns an update callback moving a trajectory line and its current point.
+    If ax is given, the line is decimated to the pixels of ax.
+    """
+    path = []
+
+    def decimated(stop_idx):
+        if not path:
+            # Decimated on first use, once the figure layout is final
+            if np.all(np.diff(x) >= 0):
+                vertices = minmax_decimate(x, y, ax)
+                path.extend([vertices, np.zeros(len(vertices), dtype=bool), vertices])
+            else:
+                path.extend(pixel_path(x, y, ax))
+            xs, ys = x[path[0]].astype(float), y[path[0]].astype(float)
+            xs[path[1]] = ys[path[1]] = np.nan
+            path.extend([xs, ys])
+        vertices, breaks, kept, xs, ys = path
+
+        current = stop_idx - 1
+        n = np.searchsorted(vertices, current, side='right')
+        if n and vertices[n - 1] == current:
+            return xs[:n], ys[:n]
+        previous = kept[np.searchsorted(kept, current, side='right') - 1]
+        if n and vertices[n - 1] == previous:
+            return np.append(xs[:n], x[current]), np.append(ys[:n], y[current])
+        return np.append(xs[:n], [np.nan, x[current]]), np.append(ys[:n], [np.nan, y[current]])
+
+    def update(stop_idx):
+        if ax is None:
+            line.set_data(x[:stop_idx], y[:stop_idx])
+        else:
+            line.set_data(*decimated(stop_idx))
+        point.set_offsets([[x[stop_idx - 1], y[stop_idx - 1]]])
+        return [line, point]
+
+    # Decimated again after the axis limits change
+    update.reset = path.clear
+    return update
+
+def _combine(*updates):
+    """Returns an update callback calling every update and returning all their artists."""
+    def update(stop_idx):
+        artists = []
+        for callback in updates:
+            artists.extend(callback(stop_idx))
+        return artists
+
+    resets = [callback.reset for callback in updates if hasattr(callback, 'reset')]
+
+    def reset():
+        for callback in resets:
+            callback()
+
+    update.reset = reset
+    return update
+
+def _growing(update, ax, axis_limits, data, stop_idx, kwargs, changed=None):
+    """
+    Gives update a relimit(stop_idx) callback if kwargs has a growing
+    LimitIndex: it sets the limits axis_limits(data, stop_idx, ...) returns on
+    ax when they change, then calls changed() (to move the static artists
+    that follow the limits) and resets decimated trajectories. relimit returns
+    whether the limits changed. Returns update.
+    """
+    limits = kwargs.get('limits')
+    if limits is None or not limits.growing:
+        return update
+    options = {key: kwargs[key] for key in ('xmin', 'xmax', 'ymin', 'ymax', 'limits') if key in kwargs}
+    current = [axis_limits(data, stop_idx, **options)]
+
+    def relimit(stop_idx):
+        xlim, ylim = axis_limits(data, stop_idx, **options)
+        if (xlim, ylim) == current[0]:
+            return False
+        current[0] = (xlim, ylim)
+        ax.set_xlim(*xlim)
+        ax.set_ylim(*ylim)
+        if changed is not None:
+            changed()
+        if hasattr(update, 'reset'):
+            update.reset()
+        return True
+
+    update.relimit = relimit
+    return update
+
+def _equal_box(ax, xlim, ylim):
+    """
+    Returns xlim and ylim widened around their centres so that x and y have the
+    same scale in the box of ax, as equal axes (ax.axis('equal')) draw them.
+    """
+    width, height = axes_pixels(ax)
+    (x0, x1), (y0, y1) = xlim, ylim
+    ratio = (x1 - x0) / (y1 - y0) * height / width
+    if ratio < 1:
+        half = (x1 - x0) / ratio / 2
+        return ((x0 + x1) / 2 - half, (x0 + x1) / 2 + half), ylim
+    half = (y1 - y0) * ratio / 2
+    return xlim, ((y0 + y1) / 2 - half, (y0 + y1) / 2 + half)
+
+def animate_sxy_vs_gxy(ax, data, params, stop_idx, decimate=False, **kwargs):
+    plot_sxy_vs_gxy(ax, data, stop_idx, **kwargs)
+    update = _trajectory(ax.lines[-1], ax.collections[-1], data['gamxy'].values * 100, data['sxy'].values,
+                         ax if decimate else None)
+    return _growing(update, ax, sxy_vs_gxy_limits, data, stop_idx, kwargs)
+
+def animate_sxy_vs_sy(ax, data, params, stop_idx, show_surfaces=True, surfaces=None, decimate=False, **kwargs):
+    plot_sxy_vs_sy(ax, data, params, stop_idx, show_surfaces=show_surfaces, surfaces=surfaces, **kwargs)
+    trajectory = _trajectory(ax.lines[-1], ax.collections[-1], data['sy'].values, data['sxy'].values,
+                             ax if decimate else None)
+    if not show_surfaces:
+        return _growing(trajectory, ax, sxy_vs_sy_limits, data, stop_idx, kwargs)
+
+    lines = ax.lines[1:4]
+
+    def update_surfaces(stop_idx):
+        xmax = ax.get_xlim()[1]
+        signo, M, Mb, Md = stress_path_surfaces(data, params, stop_idx, surfaces)
+        for line, ratio in zip(lines, (M, Mb, Md)):
+            line.set_data([0, xmax], [0, xmax * calculate_tanphi(ratio) * signo])
+        return lines
+
+    return _growing(_combine(update_surfaces, trajectory), ax, sxy_vs_sy_limits, data, stop_idx, kwargs)
+
+def animate_alpha_vs_N(ax, data, params, stop_idx, decimate=False, **kwargs):
+    plot_alpha_vs_N(ax, data, stop_idx, **kwargs)
+    N = data['N'].values
+    update = _combine(*[_trajectory(line, point, N, data[var].values, ax if decimate else None)
+                        for line, point, var in zip(ax.lines[1::2], ax.collections,
+                                                    ['alphaxx', 'alphayy', 'alphaxy'])])
+    return _growing(update, ax, alpha_vs_N_limits, data, stop_idx, kwargs)
+
+def animate_q_vs_p(ax, data, params, stop_idx, show_surfaces=True, surfaces=None, decimate=False, **kwargs):
+    plot_q_vs_p(ax, data, params, stop_idx, show_surfaces=show_surfaces, surfaces=surfaces, **kwargs)
+    q_ast = data['q_ast'].values
+    p_ast = data['p_ast'].values
+    trajectory = _trajectory(ax.lines[-1], ax.collections[-1], p_ast, q_ast, ax if decimate else None)
+    if not show_surfaces:
+        return _growing(trajectory, ax, q_vs_p_limits, data, stop_idx, kwargs)
+
+    critical = ax.lines[0]
+    lines = ax.lines[1:5]
+    m = 0.01
+
+    def move_critical():
+        # M line, drawn in the background up to the x limit
+        xmax = ax.get_xlim()[1]
+        critical.set_data([0, xmax], [0, xmax * calculate_M(params)])
+
+    def update_surfaces(stop_idx):
+        n = int(axes_pixels(ax)[0]) if decimate else 10000
+        pbs, M, Mb, Md = q_p_surfaces(data, params, stop_idx, ax.get_xlim()[1], surfaces, n)
+        ratio = q_ast[stop_idx-1] / p_ast[stop_idx-1]
+        lines[0].set_data(pbs, pbs * Mb)
+        lines[1].set_data(pbs, pbs * Md)
+        lines[2].set_ydata([0, 10000 * ratio])
+        lines[3].set_ydata([0, 10000 * (ratio - 2 * m)])
+        return lines
+
+    return _growing(_combine(update_surfaces, trajectory), ax, q_vs_p_limits, data, stop_idx, kwargs,
+                    changed=move_critical)
+
+def animate_e_vs_logp(ax, data, params, stop_idx, decimate=False, **kwargs):
+    plot_e_vs_logp(ax, data, params, stop_idx, **kwargs)
+    p_ast = data['p_ast'].values
+    e = data['e'].values
+    xi = data['xi'].values
+    Gamma = data['Gamma'].values
+    critical, state = ax.lines[0], ax.lines[2]
+    critical_end = Gamma[-1] - params['lambda'].values[0] * np.log(100000)
+    legend = ax.get_legend()
+    state_text = legend.get_texts()[1]
+    state_handle = getattr(legend, 'legend_handles', None) or legend.legendHandles
+    state_handle = state_handle[1]
+    trajectory = _trajectory(ax.lines[1], ax.collections[-1], p_ast, e, ax if decimate else None)
+
+    def update_state(stop_idx):
+        colorstate = 'limegreen' if xi[stop_idx-1] > 0 else 'firebrick'
+        critical.set_ydata([Gamma[stop_idx-1], critical_end])
+        state.set_data([p_ast[stop_idx-1], p_ast[stop_idx-1]], [e[stop_idx-1], e[stop_idx-1] - xi[stop_idx-1]])
+        state.set_color(colorstate)
+        state_handle.set_color(colorstate)
+        state_text.set_text('$\\xi =$ ' + str(np.round(xi[stop_idx-1], decimals=2)))
+        return [critical, state, legend]
+
+    return _growing(_combine(trajectory, update_state), ax, e_vs_logp_limits, data, stop_idx, kwargs)
+
+def animate_ryy_vs_rxy(ax, data, params, stop_idx, decimate=False, **kwargs):
+    plot_ryy_vs_rxy(ax, data, params, stop_idx, **kwargs)
+    trajectory = _trajectory(ax.lines[0], ax.collections[-1],
+                             data['rxy'].values * np.sqrt(2), data['ryy'].values * np.sqrt(2),
+                             ax if decimate else None)
+    bounding, dilatancy, yield_surface = ax.lines[1:4]
+    m = 0.01
+
+    def points(radius):
+        return circle_points(ax, radius) if decimate else 1000
+
+    def update_surfaces(stop_idx):
+        alphab = np.sqrt(1/2) * (data['Mb'].values[stop_idx-1] - m)
+        alphad = np.sqrt(1/2) * (data['Md'].values[stop_idx-1] - m)
+        bounding.set_data(*circle(alphab, 0, 0, points(alphab)))
+        dilatancy.set_data(*circle(alphad, 0, 0, points(alphad)))
+        yield_surface.set_data(*circle(m, data['alphaxy'].values[stop_idx-1] / np.sqrt(1/2),
+                                       data['alphayy'].values[stop_idx-1] / np.sqrt(1/2), points(m)))
+        return [bounding, dilatancy, yield_surface]
+
+    def equal_limits(data, stop_idx, **options):
+        return _equal_box(ax, *ryy_vs_rxy_limits(data, stop_idx, **options))
+
+    return _growing(_combine(trajectory, update_surfaces), ax, equal_limits, data, stop_idx, kwargs)
+
+def animate_ru_vs_gxy(ax, data, params, stop_idx, decimate=False, **kwargs):
+    plot_ru_vs_gxy(ax, data, params, stop_idx, **kwargs)
+    update = _trajectory(ax.lines[0], ax.collections[-1], data['gamxy'].values, data['ru'].values,
+                         ax if decimate else None)
+    return _growing(update, ax, ru_vs_gxy_limits, data, stop_idx, kwargs)
+
+def animate_particles(ax, data, params, stop_idx, limit_move='auto', limits=None, decimate=False):
+    particles_plot(ax, data, params, stop_idx, limit_move=limit_move, limits=limits)
+    if limit_move == 'auto':
+        limit_move = 10
+    particle, load = ax.patches[2:4]
+    if len(ax.patches) > 4:
+        shear = ax.patches[4]
+    else:
+        shear = ax.arrow(0, 0, 0, 0, color='b', head_width=0.1)
+    zxy = data['zxy'].values
+    sxy = data['sxy'].values
+    if limits is None:
+        limits = LimitIndex(data)
+
+    def update(stop_idx):
+        if limits.growing:
+            # Largest shear stress so far: the running maximum stays negative while the first cycle
+            # loads in the negative direction
+            sxy_max = np.nanmax(np.abs(limits.range('sxy', stop_idx)))
+        else:
+            sxy_max = limits.range('sxy')[1]
+        x = 0.5 * max(min(zxy[stop_idx - 1], limit_move), -limit_move) * -1 / limit_move
+        y = 2.95 - 0.2 * ((0.5 - np.abs(x)) / 0.5)
+        particle.set_center((x, y))
+        load.set_data(x=x, y=y + 2)
+        shear.set_data(x=x, y=y + 1.1, dx=0.75 / 0.5 * 0.5 * sxy[stop_idx - 1] / sxy_max)
+        shear.set_visible(x != 0)
+        return [particle, load, shear]
+
+    return update
+
+def animate_rxy_vs_N(ax, data, params, stop_idx, decimate=False, **kwargs):
+    plot_rxy_vs_N(ax, data, params, stop_idx, **kwargs)
+    N = data['N'].values
+    update = _combine(*[_trajectory(line, point, N, data[var].values, ax if decimate else None)
+                        for line, point, var in zip(ax.lines[1::2], ax.collections, ['rxx', 'ryy', 'rxy'])])
+    return _growing(update, ax, rxy_vs_N_limits, data, stop_idx, kwargs)
+
+# plot_* function -> animate_* function
+ANIMATED_PANELS = {
+    plot_sxy_vs_gxy: animate_sxy_vs_gxy,
+    plot_sxy_vs_sy: animate_sxy_vs_sy,
+    plot_alpha_vs_N: animate_alpha_vs_N,
+    plot_q_vs_p: animate_q_vs_p,
+    plot_e_vs_logp: animate_e_vs_logp,
+    plot_ryy_vs_rxy: animate_ryy_vs_rxy,
+    plot_ru_vs_gxy: animate_ru_vs_gxy,
+    particles_plot: animate_particles,
+    plot_rxy_vs_N: animate_rxy_vs_N,
+}
+
+def _bbox(x0, y0, x1, y1):
+    from matplotlib.transforms import Bbox
+
+    return Bbox.from_extents(x0, y0, x1, y1)
+
+def _panel_cells(figure, axes, renderer):
+    """
+    Returns the part of the figure (x0, y0, x1, y1 in pixels) that belongs to
+    every Axes of axes (in grid cells): its cells, up to halfway between its
+    labels and those of the neighbouring panels (to the figure edge on the
+    outside).
+    """
+    boxes = {ax: ax.get_tightbbox(renderer) for ax in axes}
+    specs = {ax: ax.get_subplotspec() for ax in axes}
+    rows, cols = specs[axes[0]].get_gridspec().get_geometry()
+
+    # Boundaries at the grid lines, None where no panel is on one side
+    xs = [0]
+    for i in range(1, cols):
+        left = [boxes[ax].x1 for ax in axes if specs[ax].colspan.stop == i]
+        right = [boxes[ax].x0 for ax in axes if specs[ax].colspan.start == i]
+        xs.append((max(left) + min(right)) / 2 if left and right else None)
+    xs.append(figure.bbox.width)
+    # Rows are numbered from the top, y goes up
+    ys = [figure.bbox.height]
+    for i in range(1, rows):
+        above = [boxes[ax].y0 for ax in axes if specs[ax].rowspan.stop == i]
+        below = [boxes[ax].y1 for ax in axes if specs[ax].rowspan.start == i]
+        ys.append((min(above) + max(below)) / 2 if above and below else None)
+    ys.append(0)
+
+    cells = {}
+    for ax in axes:
+        rowspan, colspan = specs[ax].rowspan, specs[ax].colspan
+        x0 = next(x for x in xs[colspan.start::-1] if x is not None)
+        x1 = next(x for x in xs[colspan.stop:] if x is not None)
+        y1 = next(y for y in ys[rowspan.start::-1] if y is not None)
+        y0 = next(y for y in ys[rowspan.stop:] if y is not None)
+        cells[ax] = (int(round(x0)), int(round(y0)), int(round(x1)), int(round(y1)))
+    return cells
+
+class PanelAnimation:
+    """
+    Figure whose panels are built once and updated for every frame.
+
+    The static background of all panels is rendered once. Each frame restores
+    it, moves the changing artists of every panel and draws only those, on top
+    of the background (legends included). Axis limits are those of the first
+    frame, unless a panel is given a growing LimitIndex (limits=...): at
+    every frame where its limits change, only their new values are set and
+    only the background of that panel is drawn again (tick labels included),
+    so the axes follow the animation at the cost of one panel redraw. The
+    layout (tight_layout) stays that of the first frame.
+    The figure is not registered with pyplot, so it is freed as soon as
+    the animation is closed or dropped.
+
+    Parameters:
+    - panels: list
+        (function, (row, col)) or (function, (row, col), kwargs) for every
+        panel. function is a plot_* function (see ANIMATED_PANELS) or an
+        animate_* function; kwargs are passed to it (limits, surfaces...).
+    - data: pandas.DataFrame
+        Data with the derived columns (see compute_derived).
+    - params: pandas.DataFrame
+        Material parameters.
+    - stop_idx: int, optional
+        Frame drawn first. Default is 2.
+    - shape: tuple or None, optional
+        (rows, cols) of the panel grid. Default is None, which fits the panels.
+    - figsize: tuple or None, optional
+        Figure size in inches. Default is None, 4 inches per panel.
+    - dpi: int, optional
+        Resolution of the frames. Default is 100.
+    - decimate: bool, optional
+        Draw only the vertices the frame can show (see decimate and
+        circle_points). Default is False, which draws every point.
+    """
+
+    def __init__(self, panels, data, params, stop_idx=2, shape=None, figsize=None, dpi=100, decimate=False):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        panels = [tuple(panel) + ({},) * (3 - len(panel)) for panel in panels]
+        if shape is None:
+            shape = (max(row for _, (row, _), _ in panels) + 1, max(col for _, (_, col), _ in panels) + 1)
+        if figsize is None:
+            figsize = (4 * shape[1], 4 * shape[0])
+
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        grid = self.figure.add_gridspec(*shape)
+        self.panels = []
+        self.names = []
+        for function, (row, col), kwargs in panels:
+            ax = self.figure.add_subplot(grid[row, col])
+            animate = ANIMATED_PANELS.get(function, function)
+            if decimate:
+                kwargs = dict(kwargs, decimate=True)
+            with profile_functions.profile('render', 'build %s' % animate.__name__):
+                self.panels.append((ax, animate(ax, data, params, stop_idx, **kwargs)))
+            self.names.append(animate.__name__)
+        with profile_functions.profile('render', 'tight_layout'):
+            self.figure.tight_layout()
+
+        for ax, update in self.panels:
+            for artist in update(stop_idx):
+                artist.set_animated(True)
+        with profile_functions.profile('render', 'draw_background'):
+            self.canvas.draw()
+            self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+
+        # Panels with growing limits, with the cell of the figure their background is drawn in
+        self._growing = [(ax, update) for ax, update in self.panels if hasattr(update, 'relimit')]
+        if self._growing:
+            cells = _panel_cells(self.figure, [ax for ax, _ in self.panels], self.canvas.get_renderer())
+            self._growing = [(ax, update, cells[ax]) for ax, update in self._growing]
+        self.update(stop_idx)
+
+    def _grow(self, stop_idx):
+        """Sets the growing limits at stop_idx and draws the background of the panels whose limits changed."""
+        changed = [(ax, update, cell) for ax, update, cell in self._growing if update.relimit(stop_idx)]
+        if not changed:
+            return
+        from matplotlib.patches import Rectangle
+        from matplotlib.transforms import IdentityTransform
+
+        with profile_functions.profile('render', 'redraw_background'):
+            renderer = self.canvas.get_renderer()
+            cells = []
+            for ax, update, (x0, y0, x1, y1) in changed:
+                # The background shows the artists as of stop_idx (legend placement)
+                update(stop_idx)
+                self.canvas.restore_region(self.background)
+                clear = Rectangle((x0, y0), x1 - x0, y1 - y0, transform=IdentityTransform(),
+                                  facecolor=self.figure.get_facecolor(), edgecolor='none', antialiased=False)
+                clear.set_figure(self.figure)
+                clear.draw(renderer)
+                ax.draw(renderer)
+                # Only the cell is kept, in case tick labels reach past it
+                cells.append(self.canvas.copy_from_bbox(_bbox(x0, y0, x1, y1)))
+            self.canvas.restore_region(self.background)
+            for cell in cells:
+                self.canvas.restore_region(cell)
+            self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+
+    def update(self, stop_idx):
+        """Draws frame stop_idx."""
+        if self._growing:
+            self._grow(stop_idx)
+        self.canvas.restore_region(self.background)
+        for name, (ax, update) in zip(self.names, self.panels):
+            with profile_functions.profile('panel', name):
+                for artist in update(stop_idx):
+                    ax.draw_artist(artist)
+        self.canvas.blit(self.figure.bbox)
+        self.stop_idx = stop_idx
+
+    def frame_rgba(self):
+        """Returns the current frame as a (height, width, 4) uint8 array (a view of the canvas)."""
+        return np.asarray(self.canvas.buffer_rgba())
+
+    def save_frame(self, path):
+        """Saves the current frame as an image (format from the extension, e.g. .png or .jpg)."""
+        from PIL import Image
+
+        with profile_functions.profile('io', 'save_frame'):
+            image = Image.fromarray(self.frame_rgba())
+            if os.path.splitext(path)[1].lower() in ('.jpg', '.jpeg'):
+                image = image.convert('RGB')
+            image.save(path)
+        if profile_functions.active_profiler() is not None:
+            profile_functions.record_bytes('io', 'save_frame', os.path.getsize(path))
+
+    def close(self):
+        """Releases the figure."""
+        if self.figure is not None:
+            self.figure.clear()
+            self.figure = self.canvas = self.panels = self.background = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def render_animation(panels, data, params, indices, path, **kwargs):
+    """
+    Renders frames to image files with a PanelAnimation.
+
+    Parameters:
+    - panels, data, params:
+        See PanelAnimation.
+    - indices: iterable of int
+        stop_idx of every frame.
+    - path: str
+        File name pattern with one '{}' replaced by stop_idx, e.g. 'frames/{}.jpg'.
+    - **kwargs:
+        Passed to PanelAnimation (shape, figsize, dpi).
+
+    Returns:
+    - int
+        Number of frames written (0 for no indices, without building a figure).
+    """
+    nframes = 0
+    indices = list(indices)
+    if not indices:
+        return 0
+    with PanelAnimation(panels, data, params, stop_idx=indices[0], **kwargs) as animation:
+        for stop_idx in indices:
+            animation.update(stop_idx)
+            animation.save_frame(path.format(stop_idx))
+            nframes += 1
+    return nframes
@@ -1,6 +1,39 @@
 import numpy as np
 
-def set_limit(axismin, axismax, data,vars,offset=0.1):
+class LimitIndex:
+    """
+    Per-column min/max of a dataset, computed once, so axis limits cost O(1)
+    per frame instead of a scan of every column.
+
+    Parameters:
+    - data: pandas.DataFrame or dict
+        The plotted data. Columns are indexed the first time they are used.
+    - growing: bool, optional
+        If False (default), limits cover the whole dataset (fixed axes, as
+        without an index). If True, limits at stop_idx cover the data up to
+        stop_idx only, so the axes grow with the animation (running prefix
+        min/max).
+    """
+
+    def __init__(self, data, growing=False):
+        self.data = data
+        self.growing = growing
+        self._prefix = {}
+
+    def _column(self, var):
+        if var not in self._prefix:
+            values = np.asarray(self.data[var], dtype=float)
+            # fmin/fmax skip NaN like Series.min/max
+            self._prefix[var] = (np.fmin.accumulate(values), np.fmax.accumulate(values))
+        return self._prefix[var]
+
+    def range(self, var, stop_idx=None):
+        """Returns (min, max) of column var, up to stop_idx if the index is growing."""
+        prefix_min, prefix_max = self._column(var)
+        i = stop_idx - 1 if self.growing and stop_idx is not None else -1
+        return prefix_min[i], prefix_max[i]
+
+def set_limit(axismin, axismax, data,vars,offset=0.1, limits=None, stop_idx=None):
     """
     Determines the axis limits for a plot based on input values or data series.
 
@@ -11,6 +44,10 @@ def set_limit(axismin, axismax, data,vars,offset=0.1):
         Maximum value for the axis. If 'auto', it is calculated based on the series.
     - series: pandas.Series or array-like
         The data series from which the limits are calculated if 'auto' is specified.
+    - limits: LimitIndex or None, optional
+        Precomputed min/max of the data. If None, the columns are scanned.
+    - stop_idx: int or None, optional
+        Current frame, used by growing limit indexes.
 
     Returns:
     - tuple: (axismin, axismax)
@@ -20,19 +57,22 @@ def set_limit(axismin, axismax, data,vars,offset=0.1):
     axismin_val = 10**6
     axismax_val = -10**6
     for var in vars:
+        if axismin == 'auto' or axismax == 'auto':
+            if limits is not None:
+                min_value, max_value = limits.range(var, stop_idx)
+            else:
+                series = data[var]
+                max_value = series.max()
+                min_value = series.min()
+
         # Calculate minimum limit if 'auto' is specified
-        series = data[var]
         if axismin == 'auto':
-            max_value = series.max()
-            min_value = series.min()
             axismin_i = min_value - (max_value - min_value) * offset
         else:
             axismin_i = axismin
 
         # Calculate maximum limit if 'auto' is specified
         if axismax == 'auto':
-            max_value = series.max()
-            min_value = series.min()
             axismax_i = max_value + (max_value - min_value) * offset
         else:
             axismax_i = axismax
@@ -45,25 +85,78 @@ def set_limit(axismin, axismax, data,vars,offset=0.1):
 def calculate_M(params):
     return 2*np.sin(np.radians(params['phicv'].values[0]))
 
+def bounding_ratio(pbs, M, pcs, nbwet, nbdry):
+    """
+    Bounding stress ratio Mb at mean stresses pbs, for the critical state
+    ratio M and critical mean stress pcs. The arguments broadcast, so M and pcs
+    can be column vectors (one row per step).
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xigamma = np.log(pbs) - np.log(pcs)
+        CMB = 1 / ((2*np.sin(np.radians(60))/M)**(1/nbdry)-1)
+        wet = M * np.exp(-1*nbwet*xigamma)
+        dry = M*((1+CMB)/(pbs/pcs+CMB))**nbdry
+    return np.where(pbs >= pcs, wet, dry)
+
+def dilatancy_ratio(pbs, M, pcs, nd):
+    """Dilatancy stress ratio Md at mean stresses pbs (see bounding_ratio)."""
+    with np.errstate(divide='ignore'):
+        xigamma = np.log(pbs) - np.log(pcs)
+    return M * np.exp(1*nd*xigamma)
+
 def calculate_Mb(pbs, params,data,nidx):
-    Mb = []
-    for pb in pbs:
-        pcs = data['pcs'].values[nidx-1]
-        if pb>=pcs:
-            xigamma = -np.log(data['pcs'].values[nidx-1])+np.log(pb)
-            Mb.append(data['M'].values[nidx-1] * np.exp(-1*params['nbwet'].values[0]*xigamma))
-        else:
-            CMB = 1 / ((2*np.sin(np.radians(60))/data['M'].values[nidx-1])**(1/params['nbdry'].values[0])-1)
-            Mb.append(data['M'].values[nidx-1]*((1+CMB)/(pb/data['pcs'].values[nidx-1]+CMB))**params['nbdry'].values[0])
-    return Mb
+    return bounding_ratio(np.asarray(pbs, dtype=float), data['M'].values[nidx-1], data['pcs'].values[nidx-1],
+                          params['nbwet'].values[0], params['nbdry'].values[0])
 
 def calculate_Md(pbs, params, data, nidx):
-    Md = []
-    for pb in pbs:
-    
-        xigamma = -np.log(data['pcs'].values[nidx-1])+np.log(pb)
-        Md.append(data['M'].values[nidx-1] * np.exp(1*params['nd'].values[0]*xigamma))
-    return Md
+    return dilatancy_ratio(np.asarray(pbs, dtype=float), data['M'].values[nidx-1], data['pcs'].values[nidx-1],
+                           params['nd'].values[0])
+
+def surface_tables(data, params, pbs=None, n=1000, dtype=np.float32, block=256):
+    """
+    Precomputes the M, Mb and Md surfaces of every step, so animation frames
+    only look up a row instead of evaluating the surfaces again.
+
+    Parameters:
+    - data: pandas.DataFrame
+        Must include the columns 'M', 'pcs' and 'p_ast'.
+    - params: pandas.DataFrame
+        Must include 'phicv', 'nbwet', 'nbdry' and 'nd'.
+    - pbs: array-like or None, optional
+        Mean stresses where the surfaces are evaluated. Default is None, which
+        uses n points from 0 to the 'auto' upper limit of p_ast (the x-axis of
+        plot_q_vs_p).
+    - n: int, optional
+        Number of points when pbs is None. Default is 1000.
+    - dtype: numpy dtype, optional
+        Storage type of the 2-D tables. Default is np.float32.
+    - block: int, optional
+        Number of steps evaluated at once, which bounds the temporary memory.
+
+    Returns:
+    - dict
+        'pbs': the mean stresses; 'M': calculate_M(params); 'Mb' and 'Md':
+        (nsteps, len(pbs)) arrays, row stop_idx-1 holding the surfaces at
+        stop_idx; 'Mb_p' and 'Md_p': Mb and Md at p_ast of every step.
+    """
+    if pbs is None:
+        pbs = np.linspace(0, set_limit('auto', 'auto', data, ['p_ast'])[1], n)
+    pbs = np.asarray(pbs, dtype=float)
+    M = data['M'].values.astype(float)
+    pcs = data['pcs'].values.astype(float)
+    p_ast = data['p_ast'].values.astype(float)
+    nbwet, nbdry, nd = params['nbwet'].values[0], params['nbdry'].values[0], params['nd'].values[0]
+
+    Mb = np.empty((len(M), len(pbs)), dtype=dtype)
+    Md = np.empty((len(M), len(pbs)), dtype=dtype)
+    for start in range(0, len(M), block):
+        rows = slice(start, start + block)
+        Mb[rows] = bounding_ratio(pbs, M[rows, None], pcs[rows, None], nbwet, nbdry)
+        Md[rows] = dilatancy_ratio(pbs, M[rows, None], pcs[rows, None], nd)
+
+    return {'pbs': pbs, 'M': calculate_M(params), 'Mb': Mb, 'Md': Md,
+            'Mb_p': bounding_ratio(p_ast, M, pcs, nbwet, nbdry),
+            'Md_p': dilatancy_ratio(p_ast, M, pcs, nd)}
 
 def calculate_phi(M):
     return np.degrees(np.arcsin(3*M/(6+M)))
@@ -78,4 +171,94 @@ def circle(radius,xcenter,ycenter,n=1000):
     x = np.append(x+xcenter,x[::-1]+xcenter)
     y = np.append(y+ycenter,y*-1+ycenter)
 
-    return x,y
\ No newline at end of file
+    return x,y
+
+
+def axes_pixels(ax):
+    """Returns the (width, height) of an Axes in pixels, at the figure DPI."""
+    return ax.bbox.width, ax.bbox.height
+
+def circle_points(ax, radius, min_points=16, max_points=1000):
+    """
+    Returns the n to pass to circle so the circle has about one vertex every
+    two pixels on ax, instead of a fixed 2 x 1000.
+    """
+    xmin, xmax = ax.get_xlim()
+    ymin, ymax = ax.get_ylim()
+    width, height = axes_pixels(ax)
+    scale = max(width / abs(xmax - xmin), height / abs(ymax - ymin))
+    n = int(np.pi * abs(radius) * scale / 2)
+    return min(max(n, min_points), max_points)
+
+def pixel_decimate(x, y, ax):
+    """
+    Returns the indices of the points of a path (x, y) worth drawing on ax:
+    a point is kept when it lies in another pixel than the previous point,
+    so the decimated path stays within a pixel of the original. The first and
+    last points are always kept.
+    """
+    xy = ax.transData.transform(np.column_stack([x, y]))
+    cells = np.floor(xy)
+    keep = np.ones(len(cells), dtype=bool)
+    keep[1:] = np.any(cells[1:] != cells[:-1], axis=1)
+    keep[-1] = True
+    return np.flatnonzero(keep)
+
+def minmax_decimate(x, y, ax):
+    """
+    Returns the indices of the points of a series with increasing x worth
+    drawing on ax: the first, last, lowest and highest point of every pixel
+    column, which preserves the envelope of the series exactly.
+    """
+    xy = ax.transData.transform(np.column_stack([x, y]))
+    columns = np.floor(xy[:, 0])
+    # Within every pixel column, points sorted by height
+    order = np.lexsort((xy[:, 1], columns))
+    starts = np.flatnonzero(np.r_[True, columns[order][1:] != columns[order][:-1]])
+    ends = np.r_[starts[1:], len(order)] - 1
+    first = np.flatnonzero(np.r_[True, columns[1:] != columns[:-1]])
+    last = np.r_[first[1:] - 1, len(columns) - 1]
+    return np.unique(np.concatenate([order[starts], order[ends], first, last]))
+
+def pixel_path(x, y, ax):
+    """
+    Decimates a path that can retrace itself (e.g. a cyclic stress path) to
+    what is visible on ax: points are decimated with pixel_decimate, and a
+    segment between two pixels is drawn only the first time the path crosses
+    it, with NaN breaks where repeated segments were dropped.
+
+    Returns:
+    - tuple: (vertices, breaks, kept)
+        vertices: indices of the points to draw (non-decreasing); breaks: mask
+        of the vertices to replace with NaN; kept: indices of pixel_decimate.
+    """
+    kept = pixel_decimate(x, y, ax)
+    if len(kept) < 2:
+        return kept, np.zeros(len(kept), dtype=bool), kept
+
+    cells = np.floor(ax.transData.transform(np.column_stack([x[kept], y[kept]]))).astype(np.int64)
+    a, b = cells[:-1], cells[1:]
+    # Same segment whatever the direction it is crossed in
+    swap = (a[:, 0] > b[:, 0]) | ((a[:, 0] == b[:, 0]) & (a[:, 1] > b[:, 1]))
+    segments = np.where(swap[:, None], np.hstack([b, a]), np.hstack([a, b]))
+    _, first = np.unique(segments, axis=0, return_index=True)
+    drawn = np.sort(first)
+
+    starts = drawn[np.r_[True, np.diff(drawn) != 1]]
+    keys = np.concatenate([3 * starts[1:], 3 * starts + 1, 3 * drawn + 2])
+    vertices = np.concatenate([kept[starts[1:]], kept[starts], kept[drawn + 1]])
+    breaks = np.concatenate([np.ones(len(starts) - 1, dtype=bool), np.zeros(len(starts) + len(drawn), dtype=bool)])
+    order = np.argsort(keys, kind='stable')
+    return vertices[order], breaks[order], kept
+
+def decimate(x, y, ax):
+    """
+    Returns the indices of the points of (x, y) worth drawing on ax, with
+    minmax_decimate for series with increasing x (e.g. versus N) and
+    pixel_decimate for stress paths.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) > 1 and np.all(np.diff(x) >= 0):
+        return minmax_decimate(x, y, ax)
+    return pixel_decimate(x, y, ax)
@@ -0,0 +1,224 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# Profiler recording the instrumented calls, None when profiling is off
+_active = None
+
+# Returned by profile() when profiling is off, so a disabled span costs one call
+_NO_SPAN = contextlib.nullcontext()
+
+
+def active_profiler():
+    """Returns the Profiler recording the instrumented calls, or None if profiling is off."""
+    return _active
+
+
+def profile(category, name):
+    """
+    Context manager timing a block as one call of (category, name) in the
+    active Profiler. Does nothing if profiling is off.
+    """
+    if _active is None:
+        return _NO_SPAN
+    return _Span(_active, category, name)
+
+
+def record_bytes(category, name, nbytes):
+    """Adds nbytes to the bytes written by (category, name), if profiling is on."""
+    if _active is not None:
+        _active.add_bytes(category, name, nbytes)
+
+
+class _Span:
+    __slots__ = ('profiler', 'category', 'name', 'start')
+
+    def __init__(self, profiler, category, name):
+        self.profiler = profiler
+        self.category = category
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.category, self.name, self.start, time.perf_counter())
+
+
+class Profiler:
+    """
+    Records the instrumented calls of extractions and renders.
+
+    While a Profiler is active (in a with block, or between start and stop),
+    the hot paths record every call with its duration: RPCs per request and
+    result type ('rpc', e.g. 'getsingleresult(SigxxE)'), handle lookups,
+    pandas conversions ('convert'), every panel of every frame ('panel', by
+    animate_* function), figure layout and rendering ('render'), and frame
+    encoding and file writes ('io'), with the bytes written. When no Profiler
+    is active, the instrumentation only checks a module variable.
+
+    Calls can nest (a 'render' frame includes its 'panel' calls), so the
+    totals of different categories can overlap.
+
+    Calls are counted per thread and process: the workers of
+    render_animation_parallel are not recorded.
+
+    Parameters:
+    - trace: bool, optional
+        Keep every call as a trace event for save_trace. Default is True.
+    - max_events: int, optional
+        Trace events kept at most; further calls are still counted in the
+        statistics. Default is 1000000.
+
+    Attributes:
+    - dropped: int
+        Trace events not kept because of max_events.
+    """
+
+    def __init__(self, trace=True, max_events=1000000):
+        self.trace = trace
+        self.max_events = max_events
+        self._previous = []
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forgets everything recorded so far."""
+        self.origin = time.perf_counter()
+        self.durations = {}
+        self.nbytes = {}
+        self.events = []
+        self.dropped = 0
+
+    def start(self):
+        """Makes this Profiler record the instrumented calls."""
+        global _active
+        self._previous.append(_active)
+        _active = self
+
+    def stop(self):
+        """Stops recording, restoring the Profiler active before start."""
+        global _active
+        _active = self._previous.pop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def record(self, category, name, start, end, **args):
+        """
+        Records one call of (category, name) from start to end
+        (time.perf_counter() values). args are shown in the trace event.
+        """
+        key = (category, name)
+        thread = threading.get_ident()
+        # Extraction threads record concurrently: max_events and dropped are checked and updated together
+        with self._lock:
+            durations = self.durations.get(key)
+            if durations is None:
+                durations = self.durations[key] = []
+            durations.append(end - start)
+            if self.trace:
+                if len(self.events) < self.max_events:
+                    self.events.append((category, name, start, end - start, thread, args))
+                else:
+                    self.dropped += 1
+
+    def span(self, category, name):
+        """Context manager recording a block as one call of (category, name)."""
+        return _Span(self, category, name)
+
+    def add_bytes(self, category, name, nbytes):
+        """Adds nbytes to the bytes written by (category, name)."""
+        key = (category, name)
+        with self._lock:
+            self.nbytes[key] = self.nbytes.get(key, 0) + int(nbytes)
+
+    def stats(self):
+        """
+        Returns one row per (category, name), sorted by total time: calls,
+        total time (s), mean, p50, p90, p99 and max latency (ms) and bytes
+        written.
+        """
+        rows = []
+        for key in set(self.durations) | set(self.nbytes):
+            durations = np.asarray(self.durations.get(key, ()), dtype=float)
+            if len(durations):
+                p50, p90, p99 = np.percentile(durations, [50, 90, 99]) * 1000
+                times = [durations.sum(), durations.mean() * 1000, p50, p90, p99, durations.max() * 1000]
+            else:
+                times = [0.0] + [np.nan] * 5
+            rows.append(list(key) + [len(durations)] + times + [self.nbytes.get(key, 0)])
+        columns = ['category', 'name', 'calls', 'total_s', 'mean_ms', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms',
+                   'bytes']
+        stats = pd.DataFrame(rows, columns=columns)
+        return stats.sort_values(['total_s', 'bytes'], ascending=False, ignore_index=True)
+
+    def summary(self, top=None):
+        """
+        Returns the statistics as a text table, totals per category first.
+
+        Parameters:
+        - top: int or None, optional
+            Rows shown at most. Default is None (all).
+        """
+        stats = self.stats()
+        lines = []
+        totals = stats.groupby('category')[['calls', 'total_s', 'bytes']].sum()
+        for category, row in totals.sort_values('total_s', ascending=False).iterrows():
+            lines.append('%-8s %8d calls %10.3f s %12s' % (category, row['calls'], row['total_s'],
+                                                          _format_bytes(row['bytes'])))
+        lines.append('')
+        lines.append('%-8s %-40s %8s %10s %9s %9s %9s %9s %9s %10s' % (
+            'category', 'name', 'calls', 'total s', 'mean ms', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'bytes'))
+        for row in stats.head(top).itertuples() if top is not None else stats.itertuples():
+            lines.append('%-8s %-40s %8d %10.3f %9.3f %9.3f %9.3f %9.3f %9.3f %10s' % (
+                row.category, row.name[:40], row.calls, row.total_s, row.mean_ms, row.p50_ms, row.p90_ms,
+                row.p99_ms, row.max_ms, _format_bytes(row.bytes)))
+        if self.dropped:
+            lines.append('%d trace events dropped (max_events)' % self.dropped)
+        return '\n'.join(lines)
+
+    def trace_events(self):
+        """Returns the recorded calls as Chrome trace events (complete events, times in microseconds)."""
+        pid = os.getpid()
+        main = threading.main_thread().ident
+        threads = {main: 0}
+        events = []
+        for category, name, start, duration, thread, args in self.events:
+            tid = threads.setdefault(thread, len(threads))
+            event = {'name': name, 'cat': category, 'ph': 'X', 'pid': pid, 'tid': tid,
+                     'ts': round((start - self.origin) * 1e6, 3), 'dur': round(duration * 1e6, 3)}
+            if args:
+                event['args'] = args
+            events.append(event)
+        for thread, tid in threads.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                           'args': {'name': 'main' if thread == main else 'thread %d' % tid}})
+        return events
+
+    def save_trace(self, path):
+        """
+        Writes the trace events as a JSON file, which chrome://tracing or
+        https://ui.perfetto.dev opens.
+        """
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, f)
+
+
+def _format_bytes(nbytes):
+    if not nbytes:
+        return '-'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if nbytes < 1024 or unit == 'GB':
+            return ('%d %s' if unit == 'B' else '%.1f %s') % (nbytes, unit)
+        nbytes /= 1024
@@ -0,0 +1,460 @@
+import math
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from .plot_functions import PanelAnimation
+from .profile_functions import active_profiler, profile
+from .storage_functions import load_run
+from .tile_functions import TiledAnimation
+
+# Per-process state of the render workers
+_worker = {}
+
+
+def print_progress(done, total, elapsed):
+    """Default progress report of render_animation_parallel."""
+    fps = done / elapsed if elapsed > 0 else 0.0
+    print('rendered %d/%d frames (%.1f frames/s)' % (done, total, fps))
+
+
+def split_frames(indices, nchunks):
+    """Splits frame indices into contiguous chunks of similar size, in order."""
+    chunk_size = max(1, math.ceil(len(indices) / max(nchunks, 1)))
+    return [indices[start:start + chunk_size] for start in range(0, len(indices), chunk_size)]
+
+
+# Columns whose change makes a frame worth rendering
+STATE_COLUMNS = ('sxy', 'gamxy', 'p_ast', 'ru', 'e', 'alphaxx', 'alphayy', 'alphaxy')
+
+
+def state_change(data, columns=None):
+    """
+    Returns the change of the plotted state at every step: the largest change
+    of any state column, as a fraction of that column's range (its axis).
+    The first step has no change.
+
+    Parameters:
+    - data: pandas.DataFrame or dict
+        Data with the derived columns.
+    - columns: list or None, optional
+        State columns. Default is None, the STATE_COLUMNS present in data.
+    """
+    if columns is None:
+        columns = [column for column in STATE_COLUMNS if column in data]
+    change = np.zeros(len(data[columns[0]]))
+    for column in columns:
+        values = np.asarray(data[column], dtype=float)
+        scale = np.nanmax(values) - np.nanmin(values)
+        if not scale > 0:
+            continue
+        step = np.abs(np.diff(values)) / scale
+        np.maximum(change[1:], np.nan_to_num(step), out=change[1:])
+    return change
+
+
+def select_frames(data, nframes=None, tolerance=None, columns=None, time_weight=0.1):
+    """
+    Selects the steps worth rendering, from how much the plotted state changes.
+
+    Frames are placed at equal intervals of the accumulated state change (see
+    state_change), so fast stages such as liquefaction get many frames and
+    quiet stretches few. A share of the frames (time_weight) is spread evenly
+    over the steps so the time axis keeps moving.
+
+    Parameters:
+    - data: pandas.DataFrame or dict
+        Data with the derived columns.
+    - nframes: int or None
+        Number of frames wanted. The result can be slightly shorter when
+        single steps change more than one interval.
+    - tolerance: float or None
+        Alternatively, the change between frames, as a fraction of the axis
+        range (e.g. 0.01 renders a frame whenever a state variable moved by 1%
+        of its axis).
+    - columns: list or None, optional
+        State columns, see state_change.
+    - time_weight: float, optional
+        Share of the accumulated change given to elapsed steps. Default is 0.1.
+
+    Returns:
+    - numpy.ndarray
+        stop_idx of the selected frames (1 to len(data)), increasing, always
+        including the first and last steps.
+    """
+    if (nframes is None) == (tolerance is None):
+        raise ValueError('give either nframes or tolerance')
+    change = state_change(data, columns)
+    nsteps = len(change)
+    total = change.sum()
+    if nsteps > 1:
+        change += time_weight * total / (1 - time_weight) / (nsteps - 1) if total > 0 else 1.0
+        change[0] = 0
+    path = np.cumsum(change)
+
+    if nframes is not None:
+        targets = np.linspace(0, path[-1], max(nframes, 2))
+    else:
+        targets = np.append(np.arange(0, path[-1], tolerance), path[-1])
+    rows = np.unique(np.searchsorted(path, targets))
+    rows = np.union1d(rows[rows < nsteps], [0, nsteps - 1])
+    return rows + 1
+
+
+def _init_worker(panels, data, params, build_idx, kwargs):
+    """Loads the run once per worker and builds its long-lived animation."""
+    if isinstance(data, str):
+        data, stored_params = load_run(data)
+        if params is None:
+            params = stored_params
+    _worker['animation'] = PanelAnimation(panels, data, params, stop_idx=build_idx, **kwargs)
+
+
+def _render_chunk(indices, path):
+    animation = _worker['animation']
+    for stop_idx in indices:
+        animation.update(stop_idx)
+        animation.save_frame(path.format(stop_idx))
+    return len(indices)
+
+
+def render_animation_parallel(panels, data, params, indices, path, workers=None, chunks_per_worker=4,
+                              progress=print_progress, **kwargs):
+    """
+    Renders frames to image files with a pool of worker processes.
+
+    The frames are split into contiguous chunks that are handed out to the
+    workers. Every worker builds its PanelAnimation once, at the same first
+    frame as render_animation, and reuses it for all its chunks, rendering each
+    chunk in order. The files are therefore identical to those of
+    render_animation.
+
+    Parameters:
+    - panels, params, indices, path:
+        See render_animation.
+    - data: pandas.DataFrame or str
+        Data with the derived columns, or a directory written by save_run,
+        which every worker memory-maps instead of receiving a copy of the data
+        (params default to the stored parameters).
+    - workers: int or None, optional
+        Number of processes. Default is None (os.cpu_count()).
+    - chunks_per_worker: int, optional
+        Number of chunks per worker, for load balancing and progress reports.
+        Default is 4.
+    - progress: callable or None, optional
+        Called as progress(done, total, elapsed) after every chunk. Default
+        prints the number of frames rendered. None disables it.
+    - **kwargs:
+        Passed to PanelAnimation (shape, figsize, dpi).
+
+    Returns:
+    - int
+        Number of frames written (0 for no indices, without starting workers).
+    """
+    indices = list(indices)
+    if not indices:
+        return 0
+    workers = workers or os.cpu_count() or 1
+    chunks = split_frames(indices, workers * chunks_per_worker)
+    workers = min(workers, len(chunks))
+
+    done = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(panels, data, params, indices[0], kwargs)) as pool:
+        futures = [pool.submit(_render_chunk, chunk, path) for chunk in chunks]
+        for future in as_completed(futures):
+            done += future.result()
+            if progress is not None:
+                progress(done, len(indices), time.perf_counter() - start)
+    return done
+
+
+class FFmpegSink:
+    """
+    Encodes RGBA frames with an ffmpeg process fed through a pipe.
+
+    Frames are written to the pipe straight from the canvas buffer, without
+    intermediate files or copies.
+
+    Parameters:
+    - path: str
+        Output file (e.g. .mp4, .webm, .gif). The format follows the extension.
+    - size: tuple
+        (width, height) of the frames in pixels.
+    - fps: float, optional
+        Frame rate. Default is 30.
+    - codec: str or None, optional
+        Video codec. Default is 'libx264' for .mp4/.mov/.mkv and None (ffmpeg
+        default) for other formats.
+    - binary: str, optional
+        ffmpeg executable. Default is 'ffmpeg'.
+    - extra_args: list, optional
+        Additional output arguments for ffmpeg (e.g. ['-crf', '18']).
+    """
+
+    def __init__(self, path, size, fps=30, codec=None, binary='ffmpeg', extra_args=()):
+        width, height = size
+        extension = os.path.splitext(path)[1].lower()
+        if codec is None and extension in ('.mp4', '.mov', '.mkv'):
+            codec = 'libx264'
+        command = [binary, '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', '%dx%d' % (width, height), '-r', str(fps),
+                   '-i', '-']
+        if codec is not None:
+            command += ['-c:v', codec]
+        if codec == 'libx264':
+            # yuv420p (playable everywhere) needs even dimensions
+            command += ['-pix_fmt', 'yuv420p', '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2']
+        command += list(extra_args) + [path]
+        self.path = path
+        self.frames = 0
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        self._process.stdin.write(np.ascontiguousarray(frame).data)
+        self.frames += 1
+
+    def close(self):
+        self._process.stdin.close()
+        if self._process.wait() != 0:
+            raise RuntimeError('ffmpeg failed writing %s' % self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PillowSink:
+    """
+    Encodes RGBA frames as an animated GIF, APNG (.png) or WebP with Pillow.
+
+    Pillow writes animations in one go, so the frames are kept in memory
+    until close: width * height bytes per frame for GIF (palette images),
+    width * height * 4 otherwise. A 16x12 in figure at dpi 200 takes about
+    10 MB per RGBA frame, so hundreds of frames need gigabytes; use
+    FFmpegSink or ImageSequenceSink for long animations.
+
+    Parameters:
+    - path: str
+        Output file, .gif, .png/.apng or .webp.
+    - fps: float, optional
+        Frame rate. Default is 30.
+    - loop: int, optional
+        Number of loops, 0 (default) repeats forever.
+    """
+
+    FORMATS = {'.gif': 'GIF', '.png': 'PNG', '.apng': 'PNG', '.webp': 'WEBP'}
+
+    def __init__(self, path, fps=30, loop=0):
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in self.FORMATS:
+            raise ValueError('Pillow cannot write %s animations; use .gif, .png or .webp' % extension)
+        self.path = path
+        self.format = self.FORMATS[extension]
+        self.fps = fps
+        self.loop = loop
+        self.images = []
+
+    @property
+    def frames(self):
+        return len(self.images)
+
+    def write(self, frame):
+        from PIL import Image
+
+        image = Image.fromarray(frame)
+        # The canvas buffer is reused for the next frame, so keep a copy
+        self.images.append(image.convert('RGB').quantize() if self.format == 'GIF' else image.copy())
+
+    def close(self):
+        if self.images:
+            self.images[0].save(self.path, format=self.format, save_all=True, append_images=self.images[1:],
+                                duration=1000 / self.fps, loop=self.loop)
+        self.images = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ImageSequenceSink:
+    """
+    Writes every frame to its own image file as it arrives, like
+    render_animation, so nothing is kept in memory. Pass it as the encoder
+    of encode_animation where ffmpeg is missing.
+
+    Parameters:
+    - pattern: str
+        File name pattern with one '{}' replaced by the frame number (from 0),
+        e.g. 'frames/{:05d}.jpg'. The format follows the extension. The
+        directory is created if missing.
+    """
+
+    def __init__(self, pattern):
+        directory = os.path.dirname(pattern)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.pattern = pattern
+        self.frames = 0
+
+    def write(self, frame):
+        from PIL import Image
+
+        path = self.pattern.format(self.frames)
+        image = Image.fromarray(frame)
+        if os.path.splitext(path)[1].lower() in ('.jpg', '.jpeg'):
+            image = image.convert('RGB')
+        image.save(path)
+        self.frames += 1
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MemorySink:
+    """
+    Keeps RGBA frames in memory, in one (nframes, height, width, 4) uint8 array.
+
+    Parameters:
+    - size: tuple
+        (width, height) of the frames in pixels.
+    - nframes: int, optional
+        Number of frames to preallocate. The array grows when it is exceeded.
+        Default is 16.
+    """
+
+    def __init__(self, size, nframes=16):
+        width, height = size
+        self.array = np.empty((max(nframes, 1), height, width, 4), dtype=np.uint8)
+        self.frames = 0
+
+    def write(self, frame):
+        if self.frames == len(self.array):
+            self.array = np.concatenate([self.array, np.empty_like(self.array)])
+        self.array[self.frames] = frame
+        self.frames += 1
+
+    def to_array(self):
+        """Returns the written frames (a view of the buffer)."""
+        return self.array[:self.frames]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_encoder(path, size, fps=30, nframes=16):
+    """
+    Returns a frame sink for path: FFmpegSink if ffmpeg is installed,
+    otherwise PillowSink for GIF, APNG or WebP files (kept in memory until
+    the end, see PillowSink). MemorySink if path is None.
+
+    Without ffmpeg, other formats (e.g. .mp4) raise a RuntimeError before any
+    frame is written; pass encoder=ImageSequenceSink(...) to write image
+    files instead.
+    """
+    if path is None:
+        return MemorySink(size, nframes)
+    if shutil.which('ffmpeg') is not None:
+        return FFmpegSink(path, size, fps)
+    if os.path.splitext(path)[1].lower() in PillowSink.FORMATS:
+        return PillowSink(path, fps)
+    raise RuntimeError('ffmpeg is not installed, so %s cannot be encoded; install ffmpeg, use a .gif, .png or '
+                       '.webp path, or pass encoder=ImageSequenceSink(...)' % path)
+
+
+def encode_animation(panels, data, params, indices, path, fps=30, encoder=None, progress=None, cache=None,
+                     **kwargs):
+    """
+    Renders frames with a PanelAnimation and streams the canvas buffers into an
+    encoder, without writing image files.
+
+    Parameters:
+    - panels, data, params, indices:
+        See render_animation.
+    - path: str or None
+        Output file (e.g. 'animation.mp4' or 'animation.gif'), see open_encoder.
+        None keeps the frames in a MemorySink (returned as 'encoder').
+    - fps: float, optional
+        Frame rate of the animation. Default is 30.
+    - encoder: sink or None, optional
+        FFmpegSink, PillowSink or MemorySink to use instead of open_encoder.
+        It is not closed, so a MemorySink can be read afterwards.
+    - progress: callable or None, optional
+        Called as progress(done, total, elapsed) every 100 frames and at the
+        end, e.g. print_progress. Default is None.
+    - cache: TileCache, str or None, optional
+        Tile cache (or its directory). If given, frames are composited from
+        cached panel tiles with a TiledAnimation, so only the panels that
+        changed since the last export are redrawn. Default is None.
+    - **kwargs:
+        Passed to PanelAnimation (shape, figsize, dpi).
+
+    Returns:
+    - dict
+        'frames', 'seconds' and 'fps' (rendering and encoding throughput), and
+        'encoder', the sink used. For no indices, nothing is rendered and no
+        encoder or file is opened ('encoder' is the one given, or None).
+    """
+    indices = list(indices)
+    if not indices:
+        return {'frames': 0, 'seconds': 0.0, 'fps': 0.0, 'encoder': encoder}
+    start = time.perf_counter()
+    if cache is not None:
+        animation = TiledAnimation(panels, data, params, cache, stop_idx=indices[0], **kwargs)
+    else:
+        animation = PanelAnimation(panels, data, params, stop_idx=indices[0], **kwargs)
+    with animation:
+        return stream_frames(animation, indices, path, fps, encoder, progress, start)
+
+
+def stream_frames(animation, indices, path, fps=30, encoder=None, progress=None, start=None):
+    """
+    Streams the frames of an animation (PanelAnimation or TiledAnimation) into
+    an encoder. See encode_animation for the parameters and the result.
+    """
+    indices = list(indices)
+    if start is None:
+        start = time.perf_counter()
+    sink = encoder
+    if sink is None:
+        height, width = animation.frame_rgba().shape[:2]
+        sink = open_encoder(path, (width, height), fps, len(indices))
+    try:
+        for done, stop_idx in enumerate(indices, 1):
+            with profile('render', 'frame'):
+                animation.update(stop_idx)
+            with profile('io', 'encode'):
+                sink.write(animation.frame_rgba())
+            if progress is not None and (done % 100 == 0 or done == len(indices)):
+                progress(done, len(indices), time.perf_counter() - start)
+    finally:
+        if encoder is None:
+            with profile('io', 'encode'):
+                sink.close()
+
+    profiler = active_profiler()
+    if profiler is not None and path is not None and encoder is None and os.path.exists(path):
+        profiler.add_bytes('io', 'encode', os.path.getsize(path))
+    seconds = time.perf_counter() - start
+    return {'frames': len(indices), 'seconds': seconds, 'fps': len(indices) / seconds, 'encoder': sink}
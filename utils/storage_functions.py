@@ -0,0 +1,154 @@
+import glob
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from .profile_functions import profile
+from .stream_functions import NpySink
+
+
+def to_frame(data):
+    """Returns extracted data (dict of lists, DataFrame or ResultBuffer) as a DataFrame."""
+    with profile('convert', 'to_frame'):
+        if hasattr(data, 'to_frame') and not isinstance(data, pd.Series):
+            return data.to_frame()
+        return pd.DataFrame(data)
+
+
+def params_to_dict(params):
+    """Returns material parameters (dict or one-row DataFrame) as a plain dict."""
+    if isinstance(params, pd.DataFrame):
+        params = {column: params[column].values[0] for column in params.columns}
+    return {name: value.item() if hasattr(value, 'item') else value for name, value in params.items()}
+
+
+def save_run(directory, data, params=None, dtype=np.float64, format='npy'):
+    """
+    Saves an extracted run and its material parameters in a columnar format.
+
+    Parameters:
+    - directory: str
+        Output directory. Created if missing.
+    - data: dict, pandas.DataFrame or ResultBuffer
+        Extracted time history.
+    - params: dict, pandas.DataFrame or None, optional
+        Material parameters, stored in meta.json.
+    - dtype: numpy dtype, optional
+        Storage type of the float columns, np.float64 (default) or np.float32.
+    - format: str, optional
+        'npy' (default) writes one .npy file per column, which load_run
+        memory-maps. 'parquet' writes data.parquet (requires pyarrow or
+        fastparquet).
+    """
+    data = to_frame(data)
+    meta = {'params': params_to_dict(params) if params is not None else None}
+
+    if format == 'npy':
+        with NpySink(directory, list(data.columns), dtype=dtype, meta=meta) as sink:
+            sink.write({column: data[column].to_numpy() for column in data.columns})
+    elif format == 'parquet':
+        os.makedirs(directory, exist_ok=True)
+        floats = data.select_dtypes('float').columns
+        data.astype({column: dtype for column in floats}).to_parquet(os.path.join(directory, 'data.parquet'))
+        meta.update({'rows': len(data), 'columns': list(data.columns), 'format': 'parquet'})
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=1)
+    else:
+        raise ValueError("format must be 'npy' or 'parquet'")
+
+
+def load_run(directory, columns=None, mmap=True):
+    """
+    Loads a run saved with save_run.
+
+    With the npy format, columns are memory-mapped (copy-on-write), so loading
+    is immediate and values are only read from disk when they are used.
+    Modifying a column never changes the files.
+
+    Parameters:
+    - directory: str
+        Directory written by save_run.
+    - columns: list or None, optional
+        Columns to load. Default is None (all columns).
+    - mmap: bool, optional
+        Memory-map the columns. Default is True. If False they are read into memory.
+
+    Returns:
+    - tuple: (data, params)
+        data is a pandas.DataFrame. params is a one-row pandas.DataFrame, like
+        the *_params.csv files, or None if no parameters were saved.
+    """
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+    columns = list(meta['columns']) if columns is None else list(columns)
+
+    with profile('io', 'load_run'):
+        if meta.get('format') == 'parquet':
+            data = pd.read_parquet(os.path.join(directory, 'data.parquet'), columns=columns)
+        else:
+            arrays = {column: np.load(os.path.join(directory, meta['files'][column]),
+                                      mmap_mode='c' if mmap else None)
+                      for column in columns}
+            data = pd.DataFrame(arrays, columns=columns, copy=False)
+
+    params = meta.get('params')
+    if params is not None:
+        params = pd.DataFrame(params, index=[0])
+    return data, params
+
+
+def params_csv_for(csv_path):
+    """
+    Returns the parameter CSV matching a run CSV, following the naming of the
+    data folder (CDSSPm4silt3.csv -> DSSPm4silt_params3.csv), or None.
+    """
+    folder, name = os.path.split(csv_path)
+    match = re.match(r'C(.*?)(\d*)\.csv$', name)
+    if match is None:
+        return None
+    path = os.path.join(folder, '%s_params%s.csv' % match.groups())
+    return path if os.path.exists(path) else None
+
+
+def convert_csv(csv_path, directory=None, params_path=None, dtype=np.float64, format='npy'):
+    """
+    Converts a run CSV (and its parameter CSV) to the columnar format.
+
+    Parameters:
+    - csv_path: str
+        Run CSV, as written by the extraction notebook.
+    - directory: str or None, optional
+        Output directory. Default is the CSV path without its extension.
+    - params_path: str or None, optional
+        Parameter CSV. Default is found with params_csv_for.
+    - dtype, format:
+        See save_run.
+
+    Returns:
+    - str
+        The output directory.
+    """
+    if directory is None:
+        directory = os.path.splitext(csv_path)[0]
+    if params_path is None:
+        params_path = params_csv_for(csv_path)
+
+    data = pd.read_csv(csv_path, index_col=0)
+    params = pd.read_csv(params_path, index_col=0) if params_path is not None else None
+    save_run(directory, data, params, dtype=dtype, format=format)
+    return directory
+
+
+def convert_all(data_dir, dtype=np.float64, format='npy'):
+    """
+    Converts every run CSV (C*.csv) below data_dir, next to the original files.
+
+    Returns:
+    - list of str
+        The output directories.
+    """
+    paths = sorted(glob.glob(os.path.join(data_dir, '**', 'C*.csv'), recursive=True))
+    return [convert_csv(path, dtype=dtype, format=format) for path in paths]
@@ -0,0 +1,235 @@
+import csv
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+from .extract_functions import (PM4SAND_COLUMNS, PM4SAND_FIELDS, PM4SILT_COLUMNS, PM4SILT_FIELDS,
+                                ExtractionReport, extract_steps, resolve_result_types, select_fields)
+from .profile_functions import active_profiler
+
+# Size of the .npy headers written by NpySink, so the row count can be rewritten in place
+NPY_HEADER_SIZE = 128
+
+
+def iter_data(g_o, phases, x, y, fields, all_columns, columns=None, block_size=None, report=None):
+    """
+    Extracts a time history at point (x, y) lazily, step by step.
+
+    Nothing is accumulated, so memory stays flat however long the phases are.
+    Pass the generator to stream_to to write it to disk as it arrives.
+
+    Parameters:
+    - g_o: PLAXIS output global object
+    - phases: list
+        Phases to extract, in order.
+    - x, y: float
+        Coordinates of the point.
+    - fields, all_columns, columns:
+        See extract_data.
+    - block_size: int or None, optional
+        If None (default), one record is yielded per step as
+        {column: value}. Otherwise blocks of up to block_size steps are yielded
+        as {column: list of values}.
+    - report: ExtractionReport or None, optional
+        Retry policy and failure record. Default is None (default policy).
+
+    Yields:
+    - dict
+        A record or a block, see block_size.
+    """
+    fields, columns = select_fields(fields, all_columns, columns)
+    handles = resolve_result_types(g_o, dict.fromkeys(field[1] for field in fields))
+    if report is None:
+        report = ExtractionReport()
+
+    phaseid = -1
+    for phase in phases:
+        phaseid += 1
+        steps = list(phase.Steps)
+        for start in range(0, len(steps), block_size or 1):
+            block = {column: [] for column in columns}
+            extract_steps(g_o, steps[start:start + (block_size or 1)], x, y, fields, handles, block, phaseid,
+                          report=report, first_step=start)
+            if block_size is None:
+                yield {column: values[0] for column, values in block.items()}
+            else:
+                yield block
+
+
+def iter_data_PM4Silt(g_o, phases, x, y, columns=None, block_size=None, report=None):
+    return iter_data(g_o, phases, x, y, PM4SILT_FIELDS, PM4SILT_COLUMNS, columns=columns, block_size=block_size,
+                     report=report)
+
+
+def iter_data_PM4Sand(g_o, phases, x, y, columns=None, block_size=None, report=None):
+    return iter_data(g_o, phases, x, y, PM4SAND_FIELDS, PM4SAND_COLUMNS, columns=columns, block_size=block_size,
+                     report=report)
+
+
+def as_block(record):
+    """Returns a record ({column: value}) as a block ({column: [value]}); blocks are returned as is."""
+    if all(np.ndim(value) == 1 for value in record.values()):
+        return record
+    return {column: [value] for column, value in record.items()}
+
+
+class CSVSink:
+    """
+    Appends records or blocks to a CSV file, in the layout written by
+    pandas.DataFrame.to_csv in the notebooks (unnamed leading index column).
+
+    Parameters:
+    - path: str
+        CSV file.
+    - columns: list
+        Columns to write, in order.
+    - append: bool, optional
+        Continue an existing file (header and index are not repeated).
+        Default is False, which overwrites it.
+    """
+
+    def __init__(self, path, columns, append=False):
+        self.columns = list(columns)
+        self.rows = 0
+        if append and os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, newline='') as f:
+                self.rows = sum(1 for row in csv.reader(f)) - 1
+            self._file = open(path, 'a', newline='')
+            self._writer = csv.writer(self._file, lineterminator='\n')
+        else:
+            self._file = open(path, 'w', newline='')
+            self._writer = csv.writer(self._file, lineterminator='\n')
+            self._writer.writerow([''] + self.columns)
+
+    def write(self, record):
+        profiler = active_profiler()
+        if profiler is not None:
+            start, offset = time.perf_counter(), self._file.tell()
+        block = as_block(record)
+        nrows = len(block[self.columns[0]])
+        self._writer.writerows([self.rows + i] + [block[column][i] for column in self.columns]
+                               for i in range(nrows))
+        self.rows += nrows
+        self._file.flush()
+        if profiler is not None:
+            profiler.record('io', 'CSVSink.write', start, time.perf_counter())
+            profiler.add_bytes('io', 'CSVSink.write', self._file.tell() - offset)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class NpySink:
+    """
+    Appends records or blocks to one .npy file per column, in a directory.
+
+    Every write is flushed and the .npy headers are rewritten with the number
+    of rows written so far (the headers are padded to a fixed size), so the
+    columns can be memory-mapped with numpy.load(..., mmap_mode='r') while
+    streaming, and the files of an interrupted stream hold every complete
+    write. A meta.json file lists the columns, their files and the number of
+    rows; it is written on close.
+
+    Parameters:
+    - directory: str
+        Output directory. Created if missing.
+    - columns: list
+        Columns to write, in order.
+    - dtype: numpy dtype, optional
+        Storage type of the float columns (np.float64 or np.float32).
+        'phase' is always stored as int64. Default is np.float64.
+    - meta: dict or None, optional
+        Extra entries stored in meta.json (e.g. material parameters).
+    """
+
+    def __init__(self, directory, columns, dtype=np.float64, meta=None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.columns = list(columns)
+        self.rows = 0
+        self.meta = dict(meta or {})
+        self.dtypes = {column: np.dtype(np.int64 if column == 'phase' else dtype) for column in self.columns}
+        self.files = {column: 'c%03d.npy' % i for i, column in enumerate(self.columns)}
+        self._handles = {}
+        for column in self.columns:
+            f = open(os.path.join(directory, self.files[column]), 'wb')
+            self._write_header(f, column, 0)
+            self._handles[column] = f
+
+    def _write_header(self, f, column, nrows):
+        # Version 1.0 header padded with spaces to NPY_HEADER_SIZE bytes, whatever the number of rows
+        header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (
+            np.lib.format.dtype_to_descr(self.dtypes[column]), nrows)
+        magic = np.lib.format.magic(1, 0)
+        header = header.ljust(NPY_HEADER_SIZE - len(magic) - 2 - 1) + '\n'
+        f.write(magic + struct.pack('<H', len(header)) + header.encode('latin1'))
+
+    def _flush(self):
+        # Data first, so a header never counts rows that are not on disk
+        for f in self._handles.values():
+            f.flush()
+        for column, f in self._handles.items():
+            f.seek(0)
+            self._write_header(f, column, self.rows)
+            f.seek(0, os.SEEK_END)
+            f.flush()
+
+    def write(self, record):
+        profiler = active_profiler()
+        if profiler is not None:
+            start = time.perf_counter()
+        block = as_block(record)
+        nbytes = 0
+        for column in self.columns:
+            values = np.asarray(block[column], dtype=self.dtypes[column])
+            self._handles[column].write(values.tobytes())
+            nbytes += values.nbytes
+        self.rows += len(block[self.columns[0]])
+        self._flush()
+        if profiler is not None:
+            profiler.record('io', 'NpySink.write', start, time.perf_counter())
+            profiler.add_bytes('io', 'NpySink.write', nbytes)
+
+    def close(self):
+        self._flush()
+        for f in self._handles.values():
+            f.close()
+        self._handles = {}
+
+        meta = dict(self.meta)
+        meta.update({'rows': self.rows, 'columns': self.columns,
+                     'files': self.files, 'dtypes': {c: d.str for c, d in self.dtypes.items()}})
+        with open(os.path.join(self.directory, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def stream_to(stream, *sinks):
+    """
+    Writes every record or block of stream to all sinks as it arrives.
+
+    Returns:
+    - int
+        Number of rows written.
+    """
+    nrows = 0
+    for record in stream:
+        for sink in sinks:
+            sink.write(record)
+        block = as_block(record)
+        nrows += len(next(iter(block.values())))
+    return nrows
@@ -0,0 +1,298 @@
+import functools
+import hashlib
+import inspect
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from .plot_functions import ANIMATED_PANELS, PanelAnimation
+from .profile_functions import active_profiler, profile
+from .plot_settings import LimitIndex
+
+
+def _update_code_hash(h, code):
+    """Feeds the bytecode, constants and names of a code object (and of its nested functions) to a hash."""
+    h.update(code.co_code)
+    h.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            _update_code_hash(h, const)
+        elif isinstance(const, frozenset):
+            # Set order changes with the hash seed of the session
+            h.update(repr(sorted(const, key=repr)).encode())
+        else:
+            h.update(repr(const).encode())
+
+
+def _code_names(code):
+    """Returns the global names used by a code object and its nested functions."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _code_names(const)
+    return names
+
+
+def _package(module):
+    """Returns the package of a module name, or the module itself if it is not in a package."""
+    return module.rpartition('.')[0] or module
+
+
+def _update_function_hash(h, function, seen):
+    """
+    Feeds a function to a hash: its name, code, defaults and closure, and the
+    functions of its own package it calls (e.g. the plot_* function of an
+    animate_* function, set_limit), so editing any of them changes the hash.
+    """
+    if function in seen:
+        return
+    seen.add(function)
+    h.update(('function %s.%s' % (function.__module__, function.__qualname__)).encode())
+    _update_code_hash(h, function.__code__)
+    _update_hash(h, function.__defaults__)
+    _update_hash(h, function.__kwdefaults__)
+    for cell in function.__closure__ or ():
+        value = cell.cell_contents
+        if inspect.isfunction(value):
+            _update_function_hash(h, value, seen)
+        else:
+            _update_hash(h, value)
+    for name in sorted(_code_names(function.__code__)):
+        value = function.__globals__.get(name)
+        if inspect.isfunction(value) and _package(value.__module__) == _package(function.__module__):
+            _update_function_hash(h, value, seen)
+
+
+def _update_hash(h, value):
+    """
+    Feeds a panel argument (scalars, containers, arrays, DataFrames, functions) to a hash.
+
+    Raises TypeError for objects without a repr of their own, whose default
+    repr holds their address and would never hash the same twice.
+    """
+    if isinstance(value, pd.DataFrame):
+        h.update(b'frame')
+        for column in value.columns:
+            _update_hash(h, column)
+            _update_hash(h, value[column].to_numpy())
+    elif isinstance(value, (pd.Series, np.ndarray)):
+        values = np.ascontiguousarray(np.asarray(value))
+        h.update(('array%s%s' % (values.dtype.str, values.shape)).encode())
+        h.update(values.tobytes() if values.dtype != object else repr(values.tolist()).encode())
+    elif isinstance(value, dict):
+        h.update(b'dict%d' % len(value))
+        for key in sorted(value, key=repr):
+            _update_hash(h, key)
+            _update_hash(h, value[key])
+    elif isinstance(value, (list, tuple)):
+        h.update(b'list%d' % len(value))
+        for item in value:
+            _update_hash(h, item)
+    elif isinstance(value, LimitIndex):
+        h.update(b'limits%d' % value.growing)
+        _update_hash(h, value.data)
+    elif inspect.isfunction(value):
+        _update_function_hash(h, value, set())
+    elif isinstance(value, functools.partial):
+        h.update(b'partial')
+        _update_hash(h, (value.func, value.args, value.keywords))
+    elif callable(value) and hasattr(value, '__qualname__'):
+        # Classes and builtins
+        h.update(('%s.%s' % (value.__module__, value.__qualname__)).encode())
+    elif type(value).__repr__ is object.__repr__:
+        raise TypeError('cannot fingerprint %s objects for the tile cache; pass plain values, arrays or '
+                        'DataFrames' % type(value).__name__)
+    else:
+        h.update(repr(value).encode())
+
+
+def data_fingerprint(data):
+    """
+    Fingerprint of a dataset (DataFrame, dict of columns or material
+    parameters), changing whenever a column name or value changes.
+    """
+    h = hashlib.sha1()
+    _update_hash(h, data)
+    return h.hexdigest()
+
+
+def panel_key(function, kwargs, fingerprint, build_idx, size, dpi, decimate=False):
+    """
+    Key of the tiles of a panel: a hash of its function (with its code and
+    the code of the functions it calls), its arguments, the fingerprint of
+    the data and parameters, the frame its axis limits are taken
+    from (build_idx) and its size. The tile of frame stop_idx is stored under
+    (key, stop_idx).
+    """
+    h = hashlib.sha1()
+    _update_hash(h, (function, kwargs, fingerprint, build_idx, tuple(size), dpi, decimate))
+    return h.hexdigest()
+
+
+class TileCache:
+    """
+    On-disk cache of rendered panel tiles.
+
+    Every panel configuration (see panel_key) has its own directory holding one
+    PNG file per frame, named after stop_idx. Changing the function, arguments
+    or data of a panel changes its key, so its old tiles are simply no longer
+    used; prune() deletes them.
+
+    Parameters:
+    - directory: str
+        Cache directory. Created if missing.
+    - compress_level: int, optional
+        PNG compression level, from 0 (fastest) to 9 (smallest). Default is 1.
+    """
+
+    def __init__(self, directory, compress_level=1):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.compress_level = compress_level
+
+    def path(self, key, stop_idx):
+        return os.path.join(self.directory, key, '%d.png' % stop_idx)
+
+    def load(self, key, stop_idx):
+        """Returns the tile of a panel at stop_idx as a (height, width, 4) uint8 array, or None."""
+        from PIL import Image
+
+        path = self.path(key, stop_idx)
+        if not os.path.exists(path):
+            return None
+        with profile('io', 'TileCache.load'), Image.open(path) as image:
+            return np.asarray(image.convert('RGBA'))
+
+    def store(self, key, stop_idx, tile):
+        """Stores the tile of a panel at stop_idx."""
+        from PIL import Image
+
+        os.makedirs(os.path.join(self.directory, key), exist_ok=True)
+        path = self.path(key, stop_idx)
+        # Written under another name first, so an interrupted write never leaves a broken tile
+        with profile('io', 'TileCache.store'):
+            Image.fromarray(tile).save(path + '.tmp', format='PNG', compress_level=self.compress_level)
+            os.replace(path + '.tmp', path)
+        profiler = active_profiler()
+        if profiler is not None:
+            profiler.add_bytes('io', 'TileCache.store', os.path.getsize(path))
+
+    def keys(self):
+        """Returns the keys of the cached panel configurations."""
+        return [name for name in os.listdir(self.directory) if os.path.isdir(os.path.join(self.directory, name))]
+
+    def prune(self, keep):
+        """Deletes the tiles of every panel configuration whose key is not in keep."""
+        keep = set(keep)
+        for key in self.keys():
+            if key not in keep:
+                shutil.rmtree(os.path.join(self.directory, key))
+
+
+class TiledAnimation:
+    """
+    Animation whose frames are composited from cached panel tiles.
+
+    Every panel is rendered on its own as a tile of the frame (a one-panel
+    PanelAnimation). Tiles are looked up in a TileCache first, so after a
+    change to one panel only that panel is redrawn, and frames whose tiles are
+    all cached need no drawing at all. The PanelAnimation of a panel is only
+    built when one of its tiles is missing.
+
+    Since every panel has its own layout, the frames can differ slightly from
+    those of a PanelAnimation of the whole figure (spacing between panels).
+
+    Parameters:
+    - panels, data, params, stop_idx, shape, figsize, dpi, decimate:
+        See PanelAnimation. figsize is split evenly between the panels.
+    - cache: TileCache or str
+        Tile cache, or its directory.
+
+    Attributes:
+    - keys: list of str
+        Key of every panel (see panel_key).
+    - hits, misses: int
+        Number of tiles read from the cache and rendered.
+    """
+
+    def __init__(self, panels, data, params, cache, stop_idx=2, shape=None, figsize=None, dpi=100,
+                 decimate=False):
+        panels = [tuple(panel) + ({},) * (3 - len(panel)) for panel in panels]
+        if shape is None:
+            shape = (max(row for _, (row, _), _ in panels) + 1, max(col for _, (_, col), _ in panels) + 1)
+        if figsize is None:
+            figsize = (4 * shape[1], 4 * shape[0])
+        if isinstance(cache, str):
+            cache = TileCache(cache)
+
+        self.panels = panels
+        self.data = data
+        self.params = params
+        self.cache = cache
+        self.shape = shape
+        self.build_idx = stop_idx
+        self.tile_size = (figsize[0] / shape[1], figsize[1] / shape[0])
+        self.dpi = dpi
+        self.decimate = decimate
+
+        fingerprint = data_fingerprint((data, params))
+        self.keys = [panel_key(ANIMATED_PANELS.get(function, function), kwargs, fingerprint, stop_idx,
+                               self.tile_size, dpi, decimate)
+                     for function, _, kwargs in panels]
+        self._animations = {}
+        self.frame = None
+        self.hits = self.misses = 0
+        self.update(stop_idx)
+
+    def _render(self, i, stop_idx):
+        if i not in self._animations:
+            function, _, kwargs = self.panels[i]
+            self._animations[i] = PanelAnimation([(function, (0, 0), kwargs)], self.data, self.params,
+                                                 stop_idx=self.build_idx, figsize=self.tile_size, dpi=self.dpi,
+                                                 decimate=self.decimate)
+        animation = self._animations[i]
+        animation.update(stop_idx)
+        return animation.frame_rgba()
+
+    def update(self, stop_idx):
+        """Composites frame stop_idx, rendering and caching the missing tiles."""
+        for i, (key, (_, (row, col), _)) in enumerate(zip(self.keys, self.panels)):
+            tile = self.cache.load(key, stop_idx)
+            if tile is None:
+                tile = self._render(i, stop_idx)
+                self.cache.store(key, stop_idx, tile)
+                self.misses += 1
+            else:
+                self.hits += 1
+            height, width = tile.shape[:2]
+            if self.frame is None:
+                self.frame = np.full((height * self.shape[0], width * self.shape[1], 4), 255, dtype=np.uint8)
+            self.frame[row * height:(row + 1) * height, col * width:(col + 1) * width] = tile
+        self.stop_idx = stop_idx
+
+    def frame_rgba(self):
+        """Returns the current frame as a (height, width, 4) uint8 array."""
+        return self.frame
+
+    def save_frame(self, path):
+        """Saves the current frame as an image (format from the extension, e.g. .png or .jpg)."""
+        from PIL import Image
+
+        image = Image.fromarray(self.frame)
+        if os.path.splitext(path)[1].lower() in ('.jpg', '.jpeg'):
+            image = image.convert('RGB')
+        image.save(path)
+
+    def close(self):
+        """Releases the figures of the rendered panels."""
+        for animation in self._animations.values():
+            animation.close()
+        self._animations = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()